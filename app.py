@@ -1,24 +1,27 @@
-import os, hmac, hashlib, json, datetime
-from openai import AsyncOpenAI
+import os, hmac, hashlib, datetime, time
 from dotenv import load_dotenv
-from quart import Quart, request, jsonify, render_template
+load_dotenv()  # до импорта logic.*: модули читают настройки из окружения при импорте
+from quart import Quart, Response, request, jsonify, render_template
 from logic.core import processing
 from logic.ofd import check
 from panel.site_routes import site_routes
 from logic.cache import get_pyrus_key, get_cache_config
 from init_db import init_db
-from logic.regform_updater import scheduler, form_register, requests_today
+from logic import metrics, capture, idempotency, fastjson
+from logic.regform_updater import scheduler, form_register
+from logic.stats import count_request, flush_stats
+from logic.assistants import warm as warm_assistants
+from logic.intents import warm as warm_intents
+from logic.keys import refresh as refresh_keys
+from logic import keys
+from logic.usage import flush_usage
 #init_db()
 app = Quart(__name__)
+app.json = fastjson.Provider(app)  # jsonify через orjson, если установлен
 app.secret_key = os.urandom(24)
 
 sessions = {}
 answer = {}
-load_dotenv()
-
-# Assistants для каждого tenant (создаются при первом обращении)
-tenant_assistants = {}  # {tenant_id: {"main": asst_id, "integrations": asst_id}}
-assistants_lock = None
 
 
 def sign(message, secret, signature):
@@ -29,42 +32,84 @@ def sign(message, secret, signature):
 
 @app.before_serving
 async def startup():
-    global assistants_lock
-    import asyncio
-    assistants_lock = asyncio.Lock()
     scheduler.start()
+    await refresh_keys()
+    await warm_assistants()
+    await warm_intents()
     await form_register()
 
+# SIGTERM обрабатывает сервер (uvicorn): он дожидается запросов и вызывает after_serving,
+# поэтому последний сброс счётчиков — здесь, в event loop, а не в обработчике сигнала
 @app.after_serving
 async def shutdown():
-    from logic.regform_updater import dump_stats
-    await dump_stats()
+    await flush_stats()
+    await flush_usage()
 
 @app.route("/webhook/<tenant_id>", methods=["POST"])
 async def webhook(tenant_id):
+    started = time.perf_counter()
+    metrics.current_tenant.set("-")  # до проверки tenant_id в метках не участвует
+    metrics.set_outcome("skipped")
+    try:
+        return await handle_webhook(tenant_id)
+    except Exception:
+        metrics.set_outcome("error")
+        raise
+    finally:
+        tenant, outcome = metrics.current_tenant.get(), metrics.current_outcome.get()
+        duration = time.perf_counter() - started
+        metrics.observe("barry_webhook_seconds", duration, tenant, outcome)
+        metrics.inc("barry_webhooks_total", tenant, outcome)
+        if capture.ENABLED:
+            capture.record(tenant_id, await request.get_data(), duration, outcome)
+
+async def handle_webhook(tenant_id):
+    t0 = time.perf_counter()
     pyrus_key, model = get_pyrus_key(tenant_id)
     if not pyrus_key:
+        metrics.set_outcome("unknown_tenant")
         return jsonify({"error": "Unknown tenant"}), 404
+    metrics.current_tenant.set(tenant_id)
+    metrics.observe_stage("get_pyrus_key", t0)
+    t0 = time.perf_counter()
     config = get_cache_config(pyrus_key)
+    metrics.observe_stage("get_cache_config", t0)
     secret = pyrus_key.encode()
     signature = request.headers.get("x-pyrus-sig")
 
-    if not sign(body := await request.data, secret, signature):
+    body = await request.data
+    t0 = time.perf_counter()
+    signed = sign(body, secret, signature)
+    metrics.observe_stage("sign", t0)
+    if not signed:
+        metrics.set_outcome("bad_signature")
         return jsonify({"error": "Invalid signature"}), 400
     
-    requests_today[tenant_id] = requests_today.get(tenant_id, 0) + 1
+    count_request(tenant_id)
 
-    task = json.loads(body.decode())["task"]
+    task = fastjson.loads(body)["task"]
     id = task["id"]
 
+    # повтор вебхука Pyrus во время или после обработки того же комментария получает тот же ответ
+    last_comment = (task.get("comments") or [{}])[-1].get("id")
+    return await idempotency.once((tenant_id, id, last_comment), lambda: respond(task, id, pyrus_key, model, config, tenant_id))
+
+async def respond(task, id, pyrus_key, model, config, tenant_id):
     if config["ofd"]["enabled"]:
         ofd_day = config["ofd"]["day"]
         if ofd_day and datetime.datetime.today().day == ofd_day and id not in answer:
             return await check(task, id, sessions, answer, pyrus_key, tenant_id)
-        
-    client = AsyncOpenAI(api_key=config["api_keys"]["openai_api_key"])
+
+    client = keys.client(config)
     return await processing(task, id, sessions, pyrus_key, model, client, tenant_id)
 
+@app.route("/metrics")
+async def metrics_endpoint():
+    token = os.getenv("METRICS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 app.register_blueprint(site_routes)
 
 @app.errorhandler(404)
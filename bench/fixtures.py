@@ -0,0 +1,71 @@
+"""Реалистичные входные данные для бенчмарков: длинные задачи, большие справочники"""
+import json
+from loadtest.fake_pyrus import make_catalog, make_task_fields, GROUP_ID
+
+CATALOG = make_catalog(5000)
+CATALOG_BODY = json.dumps(CATALOG, ensure_ascii=False).encode()  # ответ GET /catalogs/{id}
+
+FORM = {"name_column": "1", "filter_column": "3", "filter_words": "active, new"}
+
+STOP_WORDS = "отменить заявку, спасибо за помощь, anydesk, оператор, позвоните мне"
+
+
+def make_task(comments=200):
+    return {
+        "id": 123456789,
+        "form_id": 1,
+        "is_closed": False,
+        "fields": make_task_fields(1)["task"]["fields"] + [
+            {"id": 100 + i, "name": f"Поле {i}", "type": "text", "value": f"Значение {i}"} for i in range(40)
+        ],
+        "attachments": [{"id": i, "name": f"photo_{i}.jpg", "url": f"https://files.pyrus.com/{i}"} for i in range(10)],
+        "comments": [
+            {
+                "id": i,
+                "text": f"Сообщение {i}: касса не печатает чек, принтер мигает красным, перезагрузка не помогла",
+                "channel": {"type": "telegram"},
+                "author": {"id": i % 3, "first_name": "Клиент", "last_name": "Тестовый"},
+            }
+            for i in range(comments)
+        ],
+    }
+
+TASK = make_task()
+BODY = json.dumps({"task": TASK}, ensure_ascii=False).encode()
+SECRET = b"bench-pyrus-key"
+
+ITEM_FIELDS = [
+    {"id": 901, "name": "Телефон", "type": "phone", "value": "+77001234567"},
+    {"id": 902, "name": "Город", "type": "catalog", "value": {"item_id": 42}},
+] + [{"id": 1000 + i, "name": f"Поле {i}", "type": "text", "value": f"Значение {i}"} for i in range(60)]
+
+CURRENT_FIELDS = [
+    {"id": GROUP_ID, "name": "Клиент", "type": "title", "value": {"fields": [
+        {"id": 2000 + i, "name": f"Поле {i}", "type": "text"} for i in range(60)
+    ] + [{"id": 901, "name": "Телефон", "type": "phone"}, {"id": 902, "name": "Город", "type": "catalog"}]}},
+] + [{"id": 3000 + i, "name": f"Другое {i}", "type": "text"} for i in range(40)]
+
+DYNAMIC_FIELDS = [
+    {"id": 11, "type": "text"},
+    {"id": 12, "type": "text"},
+    {"id": 13, "type": "phone"},
+    {"id": 14, "type": "money"},
+    {"id": 15, "type": "select"},
+] * 4
+MATCHES = ["Кафе 37, ул. Абая 37", "Не печатает чек", "87001234567", "12 500,50", "Тех. поддержка"] * 4
+
+REPLY = "Перезагрузите кассу и проверьте, что принтер включён. Если ошибка E-37 повторится, пришлите фото экрана. " * 5
+
+CONFIG_ROW = {
+    "pyrus_key": "bench-pyrus-key", "tenant_id": "bench", "gpt_model": "gpt-4o-mini",
+    "allow_attachments_toggle": 1, "allow_multi_channel_toggle": 1, "config_version": 7,
+    "ofd_enabled": 0, "ofd_day": None, "ofd_greeting": "", "ofd_template": "",
+    "is_attachments_enabled": 1, "is_multi_channel_enabled": 1, "is_emergency_enabled": 0, "emergency_template": "",
+    "bot_login": "bot@bench", "temperature": 0.3, "stop_words": STOP_WORDS, "bot_stop_words": "..,anydesk",
+    "time_zone": "5", "work_from": "09:00", "work_to": "18:00", "work_from_weekend": "10:00", "work_to_weekend": "16:00",
+    "offmsg": "Мы работаем с 9 до 18", "form_enabled": 1, "form_or_card": "form", "form_template": "шаблон",
+    "dynamic_fields": json.dumps(DYNAMIC_FIELDS),
+    "card_id": None, "field_id": None, "card_field_id": None, "group_id": None,
+    "dictionary_id": "1", "dict_field_id": "10", "name_column": "1", "filter_column": "3", "filter_words": "active",
+    "template": "Инструкция. " * 2000, "parsed_reg": None,
+}
@@ -0,0 +1,138 @@
+"""Микробенчмарки горячих функций с проверкой регрессий относительно baseline.
+
+    python -m bench.run                          # сравнить с bench/baseline.json, код 1 при регрессии
+    python -m bench.run --save-baseline          # перезаписать baseline (на той же машине, где будет проверка)
+    python -m bench.run --only sign,build_config --output results.json
+"""
+import argparse, gc, hashlib, hmac, json, os, sys, time
+from bench import fixtures as fx
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.3"))  # допустимое замедление (0.3 = +30%)
+RECHECKS = 2  # регрессия засчитывается, только если повторные замеры её подтверждают
+
+
+def _drive(coro):
+    """Выполняет корутину без await внутри (fill_task_fields) без event loop"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine awaited something")
+
+
+def benchmarks():
+    from app import sign
+    from logic.core import has_stop_word, eng_ratio, is_working_now
+    from logic.serv import filter_rows, fill_task_fields, coerce_fields
+    from logic.cache import build_config
+    from logic.intents import classify
+    from logic import fastjson
+
+    config = build_config(fx.CONFIG_ROW)
+    signature = hmac.new(fx.SECRET, msg=fx.BODY, digestmod=hashlib.sha1).hexdigest()
+
+    return {
+        "sign": lambda: sign(fx.BODY, fx.SECRET, signature),
+        "has_stop_word": lambda: has_stop_word(fx.TASK, fx.STOP_WORDS),
+        "is_working_now": lambda: is_working_now(config),
+        "eng_ratio": lambda: eng_ratio(fx.REPLY),
+        "filter_rows": lambda: filter_rows(fx.CATALOG["items"], fx.FORM),
+        "fill_task_fields": lambda: _drive(fill_task_fields(fx.GROUP_ID, fx.ITEM_FIELDS, fx.CURRENT_FIELDS)),
+        "coerce_fields": lambda: coerce_fields(fx.MATCHES, fx.DYNAMIC_FIELDS),
+        "build_config": lambda: build_config(fx.CONFIG_ROW),
+        "classify_intent": lambda: classify("Спасибо большое, всё заработало!"),
+        "json_parse_webhook": lambda: fastjson.loads(fx.BODY),
+        "json_parse_catalog": lambda: fastjson.loads(fx.CATALOG_BODY),
+        "json_dump_task": lambda: fastjson.dumpb({"task": fx.TASK}),
+    }
+
+
+def measure(func, min_time=0.1, repeat=9):
+    """Минимальное время одного вызова (мкс) из repeat серий по ~min_time секунд, как timeit — без GC"""
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _measure(func, min_time, repeat)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def _measure(func, min_time, repeat):
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best * 1e6
+
+
+def compare(results, baseline, threshold):
+    """Список (имя, было, стало, изменение) для функций, замедлившихся больше порога"""
+    regressions = []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if old and value > old * (1 + threshold):
+            regressions.append((name, old, value, value / old - 1))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций")
+    parser.add_argument("--only", help="имена через запятую")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+
+    suite = benchmarks()
+    names = args.only.split(",") if args.only else list(suite)
+    results = {}
+    for name in names:
+        results[name] = round(measure(suite[name]), 3)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    for name, value in results.items():
+        old = baseline.get(name)
+        change = f"{(value / old - 1) * 100:+.1f}%" if old else "new"
+        print(f"{name:<18} {value:>12.3f} us  {change}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline | results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for _ in range(RECHECKS):
+        if not regressions:
+            break
+        for name, *_ in regressions:
+            results[name] = min(results[name], round(measure(suite[name]), 3))
+        regressions = compare(results, baseline, args.threshold)
+    for name, old, value, change in regressions:
+        print(f"REGRESSION {name}: {old:.3f} -> {value:.3f} us (+{change * 100:.1f}%, limit {args.threshold * 100:.0f}%)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
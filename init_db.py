@@ -124,6 +124,13 @@ def init_db():
         c.execute("ALTER TABLE api_keys MODIFY openai_api_key VARCHAR(500)")
     except:
         pass
+    # пул ключей: группа (tenants.key_group) и выключение без удаления
+    for alter in ("MODIFY id INT AUTO_INCREMENT", "ADD COLUMN key_group VARCHAR(50) NOT NULL DEFAULT 'default'",
+                  "ADD COLUMN enabled BOOLEAN NOT NULL DEFAULT TRUE"):
+        try:
+            c.execute(f"ALTER TABLE api_keys {alter}")
+        except:
+            pass
 
 
     c.execute("""
@@ -146,6 +153,12 @@ def init_db():
         FOREIGN KEY (pyrus_key) REFERENCES tenants(pyrus_key)
     )
     """)
+    # поля карточки, которые читают дашборд и заполнение полей
+    for column in ("card_field_id", "group_id"):
+        try:
+            c.execute(f"ALTER TABLE card ADD COLUMN {column} VARCHAR(255)")
+        except:
+            pass
 
 
     c.execute("""
@@ -166,5 +179,126 @@ def init_db():
         FOREIGN KEY (tenant_id) REFERENCES tenants(tenant_id)
     )
     """)
+
+    # дневной ряд статистики
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS statistics_daily (
+        tenant_id VARCHAR(255),
+        day DATE,
+        request_count INT DEFAULT 0,
+        task_count INT DEFAULT 0,
+        PRIMARY KEY (tenant_id, day),
+        FOREIGN KEY (tenant_id) REFERENCES tenants(tenant_id)
+    )
+    """)
+
+    # помесячные агрегаты (month — первое число месяца), из них читает админка
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS statistics_monthly (
+        tenant_id VARCHAR(255),
+        month DATE,
+        request_count INT DEFAULT 0,
+        task_count INT DEFAULT 0,
+        PRIMARY KEY (tenant_id, month),
+        INDEX (month),
+        FOREIGN KEY (tenant_id) REFERENCES tenants(tenant_id)
+    )
+    """)
+
+    # дата подключения организации (раньше хранилась в statistics.date) и перенос счётчиков
+    # текущего месяца из старой таблицы — один раз, при переходе: потом statistics не обновляется
+    try:
+        c.execute("ALTER TABLE tenants ADD COLUMN created_at DATE")
+        c.execute("""
+            UPDATE tenants t JOIN statistics s ON s.tenant_id = t.tenant_id
+            SET t.created_at = s.date
+        """)
+        c.execute("""
+            INSERT IGNORE INTO statistics_monthly (tenant_id, month, request_count, task_count)
+            SELECT tenant_id, DATE_FORMAT(CURDATE(), '%Y-%m-01'), request_count, task_count
+            FROM statistics
+        """)
+    except:
+        pass
+
+    # версия конфигурации: увеличивается при каждом сохранении, воркеры по ней обновляют кэш
+    try:
+        c.execute("ALTER TABLE tenants ADD COLUMN config_version INT NOT NULL DEFAULT 0")
+    except:
+        pass
+
+    # движок диалога: assistants (Assistants API) или chat (chat.completions с локальной историей)
+    try:
+        c.execute("ALTER TABLE tenants ADD COLUMN engine VARCHAR(20) NOT NULL DEFAULT 'assistants'")
+    except:
+        pass
+
+    # поиск по шаблону: сколько разделов подставлять к сообщению (0 — шаблон целиком в инструкциях)
+    try:
+        c.execute("ALTER TABLE tenants ADD COLUMN retrieval_top_k INT NOT NULL DEFAULT 0")
+    except:
+        pass
+
+    # кэш ответов на частые вопросы (logic/answers.py)
+    try:
+        c.execute("ALTER TABLE tenants ADD COLUMN answer_cache BOOLEAN NOT NULL DEFAULT FALSE")
+    except:
+        pass
+
+    # локальный классификатор коротких сообщений: off / shadow / on и порог уверенности
+    for column in ("intents VARCHAR(10) NOT NULL DEFAULT 'off'", "intent_threshold FLOAT NOT NULL DEFAULT 0.9"):
+        try:
+            c.execute(f"ALTER TABLE tenants ADD COLUMN {column}")
+        except:
+            pass
+
+    # допуск к вызовам модели (logic/admission.py): пределы организации и ответ при перегрузке
+    for column in ("admission_concurrency INT", "admission_rate INT", "admission_weight FLOAT",
+                   "overload VARCHAR(10) NOT NULL DEFAULT 'defer'", "busy_template TEXT"):
+        try:
+            c.execute(f"ALTER TABLE tenants ADD COLUMN {column}")
+        except:
+            pass
+
+    # маршрутизация по сложности: быстрая модель (NULL — выключена), порог длины и свои ключевые слова
+    for column in ("fast_model VARCHAR(100)", "routing_max_chars INT", "routing_keywords TEXT", "key_group VARCHAR(50)"):
+        try:
+            c.execute(f"ALTER TABLE tenants ADD COLUMN {column}")
+        except:
+            pass
+
+    # assistant'ы организаций (переживают перезапуски, общие для воркеров)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS assistants (
+        tenant_id VARCHAR(255),
+        assistant_type VARCHAR(50),
+        assistant_id VARCHAR(100),
+        instructions_hash CHAR(64),
+        config_version INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (tenant_id, assistant_type)
+    )
+    """)
+    # версия конфигурации, по которой собраны инструкции: воркер с устаревшим кэшем их не откатывает
+    try:
+        c.execute("ALTER TABLE assistants ADD COLUMN config_version INT NOT NULL DEFAULT 0")
+    except:
+        pass
+
+    # расход OpenAI по организациям, моделям и видам вызовов (month — первое число месяца)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS usage_monthly (
+        tenant_id VARCHAR(255),
+        month DATE,
+        model VARCHAR(100),
+        kind VARCHAR(20),
+        requests INT DEFAULT 0,
+        prompt_tokens BIGINT DEFAULT 0,
+        cached_tokens BIGINT DEFAULT 0,
+        completion_tokens BIGINT DEFAULT 0,
+        audio_seconds DOUBLE DEFAULT 0,
+        PRIMARY KEY (tenant_id, month, model, kind),
+        INDEX (month)
+    )
+    """)
     conn.commit()
     conn.close()
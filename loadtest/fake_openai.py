@@ -0,0 +1,213 @@
+"""Локальная замена эндпоинтов OpenAI, которые использует бот: Assistants (threads/messages/runs),
+chat.completions, audio.transcriptions, embeddings"""
+import hashlib, itertools, json, math, re, time
+from aiohttp import web
+from loadtest.latency import parse_latency, delay
+
+HANDOFF_REPLY = "..Соединяю вас с сотрудником техподдержки"
+PLAIN_REPLY = "Перезагрузите кассу и проверьте, что принтер включён и в нём есть бумага. Могу ещё чем-то помочь?"
+EXTRACT_REPLY = '"Кафе 37", "Не печатает чек", "Перезагрузка кассы", "Тех. поддержка"'
+MATCH_REPLY = "137"
+VISION_REPLY = "На фото ошибка кассы: закончилась бумага в принтере чеков."
+TRANSCRIPT = "Здравствуйте, у нас касса не печатает чеки"
+EMBEDDING_DIM = 64
+
+
+def _usage(prompt_text, completion_text):
+    prompt_tokens = max(1, len(prompt_text) // 4)
+    completion_tokens = max(1, len(completion_text) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+def embedding(text):
+    """Детерминированный «мешок слов»: одинаковые слова — близкие векторы"""
+    vector = [0.0] * EMBEDDING_DIM
+    for word in re.findall(r"\w+", text.lower()):
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % EMBEDDING_DIM] += 1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+def reply_for(text):
+    lowered = text.lower()
+    return HANDOFF_REPLY if "соедин" in lowered or "оператор" in lowered else PLAIN_REPLY
+
+def _message(thread_id, role, text, ids):
+    return {
+        "id": f"msg_{next(ids)}",
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+    }
+
+
+def create_app(latency="none", run_latency="lognormal:1.5,0.4"):
+    sample = parse_latency(latency)
+    run_sample = parse_latency(run_latency)
+    ids = itertools.count(1)
+    threads = {}  # {thread_id: {"messages": [...], "runs": {run_id: run}}}
+
+    def run_view(thread_id, run):
+        status = run.get("status") or ("completed" if time.monotonic() >= run["ready_at"] else "in_progress")
+        if status == "completed" and not run["answered"]:
+            messages = threads[thread_id]["messages"]
+            last_user = next((m for m in reversed(messages) if m["role"] == "user"), None)
+            text = reply_for(last_user["content"][0]["text"]["value"] if last_user else "")
+            messages.append(_message(thread_id, "assistant", text, ids))
+            run["answered"] = True
+            run["usage"] = _usage("x" * 4000, text)
+        return {
+            "id": run["id"], "object": "thread.run", "thread_id": thread_id,
+            "assistant_id": run["assistant_id"], "status": status, "created_at": run["created_at"],
+            "usage": run.get("usage"),
+        }
+
+    async def create_assistant(request):
+        await delay(sample)
+        body = await request.json()
+        return web.json_response({"id": f"asst_{next(ids)}", "object": "assistant", "created_at": int(time.time()),
+                                  "model": body.get("model"), "name": body.get("name"),
+                                  "instructions": body.get("instructions"), "tools": []})
+
+    async def update_assistant(request):
+        await delay(sample)
+        body = await request.json()
+        return web.json_response({"id": request.match_info["assistant_id"], "object": "assistant",
+                                  "created_at": int(time.time()), "model": body.get("model"), "tools": []})
+
+    async def delete_assistant(request):
+        return web.json_response({"id": request.match_info["assistant_id"], "object": "assistant.deleted", "deleted": True})
+
+    async def create_thread(request):
+        await delay(sample)
+        thread_id = f"thread_{next(ids)}"
+        body = await request.json() if request.can_read_body else {}
+        messages = [_message(thread_id, m.get("role", "user"), m.get("content", ""), ids) for m in body.get("messages", [])]
+        threads[thread_id] = {"messages": messages, "runs": {}}
+        return web.json_response({"id": thread_id, "object": "thread", "created_at": int(time.time())})
+
+    async def create_message(request):
+        await delay(sample)
+        thread_id = request.match_info["thread_id"]
+        body = await request.json()
+        message = _message(thread_id, body.get("role", "user"), body.get("content", ""), ids)
+        threads[thread_id]["messages"].append(message)
+        return web.json_response(message)
+
+    async def list_messages(request):
+        await delay(sample)
+        thread_id = request.match_info["thread_id"]
+        data = list(reversed(threads[thread_id]["messages"]))[:int(request.query.get("limit", 20))]
+        return web.json_response({"object": "list", "data": data, "has_more": False})
+
+    async def delete_message(request):
+        thread_id, message_id = request.match_info["thread_id"], request.match_info["message_id"]
+        threads[thread_id]["messages"] = [m for m in threads[thread_id]["messages"] if m["id"] != message_id]
+        return web.json_response({"id": message_id, "object": "thread.message.deleted", "deleted": True})
+
+    async def create_run(request):
+        await delay(sample)
+        thread_id = request.match_info["thread_id"]
+        body = await request.json()
+        run = {"id": f"run_{next(ids)}", "assistant_id": body.get("assistant_id"), "created_at": int(time.time()),
+               "ready_at": time.monotonic() + run_sample(), "answered": False}
+        threads[thread_id]["runs"][run["id"]] = run
+        return web.json_response(run_view(thread_id, run) | {"status": "queued"})
+
+    async def list_runs(request):
+        await delay(sample)
+        thread_id = request.match_info["thread_id"]
+        runs = [run_view(thread_id, r) for r in reversed(list(threads[thread_id]["runs"].values()))]
+        return web.json_response({"object": "list", "data": runs[:int(request.query.get("limit", 20))], "has_more": False})
+
+    async def retrieve_run(request):
+        await delay(sample)
+        thread_id = request.match_info["thread_id"]
+        return web.json_response(run_view(thread_id, threads[thread_id]["runs"][request.match_info["run_id"]]))
+
+    async def cancel_run(request):
+        thread_id = request.match_info["thread_id"]
+        run = threads[thread_id]["runs"][request.match_info["run_id"]]
+        run["status"] = "cancelled"
+        return web.json_response(run_view(thread_id, run))
+
+    async def chat_completions(request):
+        body = await request.json()
+        await delay(run_sample)
+        messages = body.get("messages", [])
+        system = str(messages[0].get("content", "")) if messages else ""
+        last = messages[-1].get("content", "") if messages else ""
+        if isinstance(last, list):
+            text = VISION_REPLY
+        elif "[ИНСТРУКЦИЯ]" in system:
+            text = reply_for(str(last))  # диалог движка chat
+        elif "наиболее похожее" in system:
+            text = MATCH_REPLY
+        elif messages and messages[0].get("role") == "system":
+            text = EXTRACT_REPLY  # flds: системный промпт — шаблон извлечения полей
+        else:
+            text = reply_for(str(last))
+        usage = _usage(str(messages), text)
+        if body.get("stream"):
+            return await stream_completion(request, body, text, usage)
+        return web.json_response({
+            "id": f"chatcmpl_{next(ids)}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+            "usage": usage,
+        })
+
+    async def stream_completion(request, body, text, usage):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        base = {"id": f"chatcmpl_{next(ids)}", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model")}
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            chunk = base | {"choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await response.write(f"data: {json.dumps(base | {'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n".encode())
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await response.write(f"data: {json.dumps(base | {'choices': [], 'usage': usage})}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def transcriptions(request):
+        await request.read()
+        await delay(run_sample)
+        return web.json_response({"text": TRANSCRIPT, "language": "russian", "duration": 4.2})
+
+    async def embeddings(request):
+        await delay(sample)
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        return web.json_response({
+            "object": "list", "model": body.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": embedding(text)} for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app.router.add_post("/v1/assistants", create_assistant)
+    app.router.add_post("/v1/assistants/{assistant_id}", update_assistant)
+    app.router.add_delete("/v1/assistants/{assistant_id}", delete_assistant)
+    app.router.add_post("/v1/threads", create_thread)
+    app.router.add_post("/v1/threads/{thread_id}/messages", create_message)
+    app.router.add_get("/v1/threads/{thread_id}/messages", list_messages)
+    app.router.add_delete("/v1/threads/{thread_id}/messages/{message_id}", delete_message)
+    app.router.add_post("/v1/threads/{thread_id}/runs", create_run)
+    app.router.add_get("/v1/threads/{thread_id}/runs", list_runs)
+    app.router.add_get("/v1/threads/{thread_id}/runs/{run_id}", retrieve_run)
+    app.router.add_post("/v1/threads/{thread_id}/runs/{run_id}/cancel", cancel_run)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/audio/transcriptions", transcriptions)
+    app.router.add_post("/v1/embeddings", embeddings)
+    return app
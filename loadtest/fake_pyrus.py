@@ -0,0 +1,78 @@
+"""Локальная замена Pyrus API: auth, catalogs, forms/register, tasks, файлы вложений"""
+from aiohttp import web
+from loadtest.latency import parse_latency, delay
+
+CATALOG_SIZE = 5000
+REGISTER_SIZE = 3000
+GROUP_ID = 900
+
+
+def make_catalog(size=CATALOG_SIZE):
+    return {
+        "catalog_id": 1,
+        "items": [
+            {"item_id": 100 + i, "values": [f"Кафе {i}", f"г. Алматы, ул. Абая {i}", "active" if i % 5 else "archive"]}
+            for i in range(size)
+        ],
+    }
+
+def make_register(field_id, size=REGISTER_SIZE):
+    return {
+        "tasks": [
+            {"id": 5000 + i, "fields": [{"id": field_id, "value": f"Ресторан {i}, пр. Достык {i}"}]}
+            for i in range(size)
+        ]
+    }
+
+def make_task_fields(task_id):
+    return {
+        "task": {
+            "id": task_id,
+            "fields": [
+                {"id": GROUP_ID, "name": "Клиент", "type": "title", "value": {"fields": [
+                    {"id": 901, "name": "Телефон", "type": "phone", "value": "+77001234567"},
+                    {"id": 902, "name": "Город", "type": "catalog", "value": {"item_id": 42}},
+                ]}},
+            ],
+        }
+    }
+
+
+def create_app(latency="none"):
+    sample = parse_latency(latency)
+    catalog = make_catalog()
+    registers = {}
+    jpeg = bytes.fromhex("ffd8ffe000104a46494600010100000100010000ffd9")
+    ogg = b"OggS" + bytes(60)
+
+    async def auth(request):
+        await delay(sample)
+        return web.json_response({"access_token": "fake-pyrus-token"})
+
+    async def get_catalog(request):
+        await delay(sample)
+        return web.json_response(catalog)
+
+    async def get_register(request):
+        await delay(sample)
+        field_id = int(request.query.get("field_ids", "1"))
+        if field_id not in registers:
+            registers[field_id] = make_register(field_id)
+        return web.json_response(registers[field_id])
+
+    async def get_task(request):
+        await delay(sample)
+        return web.json_response(make_task_fields(int(request.match_info["task_id"])))
+
+    async def get_file(request):
+        await delay(sample)
+        name = request.match_info["name"]
+        return web.Response(body=jpeg if name.endswith(".jpg") else ogg)
+
+    app = web.Application()
+    app.router.add_post("/v4/auth", auth)
+    app.router.add_get("/v4/catalogs/{catalog_id}", get_catalog)
+    app.router.add_get("/v4/forms/{form_id}/register", get_register)
+    app.router.add_get("/v4/tasks/{task_id}", get_task)
+    app.router.add_get("/files/{name}", get_file)
+    return app
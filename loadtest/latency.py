@@ -0,0 +1,29 @@
+import asyncio, math, random
+
+
+def parse_latency(spec):
+    """Задержка ответа фейкового сервера в секундах.
+
+    fixed:0.2 | uniform:0.1,0.5 | lognormal:0.8,0.4 (медиана, сигма) | none
+    """
+    kind, _, args = (spec or "none").partition(":")
+    values = [float(v) for v in args.split(",") if v]
+
+    if kind == "none":
+        return lambda: 0.0
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == "lognormal":
+        median, sigma = values
+        mu = math.log(median)
+        return lambda: random.lognormvariate(mu, sigma)
+    raise ValueError(f"unknown latency spec: {spec}")
+
+
+async def delay(sample):
+    seconds = sample()
+    if seconds > 0:
+        await asyncio.sleep(seconds)
@@ -0,0 +1,104 @@
+"""Воспроизведение записанных вебхуков (WEBHOOK_CAPTURE_DIR) на локальный экземпляр.
+
+Payload подписывается заново ключом локальной организации, интервалы между вебхуками сохраняются
+(--speed 2 — вдвое быстрее, --speed 0 — без пауз). Примеры:
+    python -m loadtest.replay captures/*.jsonl.gz --target http://127.0.0.1:8000
+    python -m loadtest.replay captures/ --target http://127.0.0.1:8000 --tenant loadtest --key loadtest-key --speed 5
+"""
+import argparse, asyncio, json, time
+import aiohttp
+from logic.capture import read, capture_files, FILES_URL
+from loadtest.run import percentile, signed
+from loadtest.seed import TENANT_ID, PYRUS_KEY
+
+
+def rewrite_files(value, files_url):
+    """Адреса вложений из записи -> файловый сервер фейкового Pyrus"""
+    if isinstance(value, dict):
+        return {k: rewrite_files(v, files_url) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rewrite_files(v, files_url) for v in value]
+    if isinstance(value, str) and value.startswith(FILES_URL):
+        return files_url + value[len(FILES_URL):]
+    return value
+
+
+async def replay(records, target, tenant, key, speed, concurrency):
+    """Отправляет записи с исходными интервалами; возвращает [(исходное время, новое время, статус)]"""
+    results = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(session, record):
+        body, signature = signed(record["payload"], key)
+        url = f"{target}/webhook/{tenant or record['tenant']}"
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, data=body, headers={"x-pyrus-sig": signature, "Content-Type": "application/json"}) as resp:
+                    await resp.read()
+                    status = resp.status
+            except aiohttp.ClientError:
+                status = 0
+            results.append((record["duration"], time.perf_counter() - started, status))
+
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        pending = []
+        first_ts, started = records[0]["ts"], time.monotonic()
+        for record in records:
+            if speed > 0:
+                wait = (record["ts"] - first_ts) / speed - (time.monotonic() - started)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            pending.append(asyncio.create_task(send(session, record)))
+        await asyncio.gather(*pending)
+    return results
+
+
+def summary(results, wall):
+    original = [r[0] for r in results]
+    replayed = [r[1] for r in results if r[2] == 200]
+    return {
+        "requests": len(results),
+        "errors": sum(1 for r in results if r[2] != 200),
+        "rps": round(len(replayed) / wall, 2) if wall else 0.0,
+        **{f"{name}_p{q}": round(percentile(values, q / 100), 3)
+           for name, values in (("original", original), ("replay", replayed)) for q in (50, 95, 99)},
+    }
+
+
+async def main(args):
+    records = read(capture_files(args.paths))
+    if args.limit:
+        records = records[:args.limit]
+    if args.files_url:
+        for record in records:
+            record["payload"] = rewrite_files(record["payload"], args.files_url.rstrip("/"))
+    if not records:
+        print("no records")
+        return
+    started = time.perf_counter()
+    results = await replay(records, args.target, args.tenant, args.key, args.speed, args.concurrency)
+    result = summary(results, time.perf_counter() - started)
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных вебхуков")
+    parser.add_argument("paths", nargs="+", help="файлы capture-*.jsonl.gz или каталоги с ними")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--tenant", default=TENANT_ID, help="организация в URL (пусто — как в записи)")
+    parser.add_argument("--key", default=PYRUS_KEY, help="pyrus_key для подписи")
+    parser.add_argument("--speed", type=float, default=1.0, help="множитель скорости, 0 — без пауз")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--files-url", help="куда направить скачивание вложений, например http://127.0.0.1:18081/files")
+    parser.add_argument("--json", help="сохранить сводку в файл")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
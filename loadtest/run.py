@@ -0,0 +1,184 @@
+"""Нагрузочный тест вебхука: фейковые Pyrus и OpenAI + подписанные вебхуки на app:app.
+
+База должна быть подготовлена (python -m loadtest.seed). Примеры:
+    python -m loadtest.run --requests 200 --concurrency 20
+    python -m loadtest.run --scenarios approval --openai-latency lognormal:0.3,0.5 --run-latency fixed:2
+    python -m loadtest.run --target http://127.0.0.1:8000   # приложение уже запущено с нужными PYRUS_API_URL/OPENAI_BASE_URL
+"""
+import argparse, asyncio, hashlib, hmac, itertools, json, os, subprocess, sys, time, uuid
+import aiohttp
+from aiohttp import web
+from loadtest import fake_pyrus, fake_openai
+from loadtest.seed import TENANT_ID, PYRUS_KEY
+
+PYRUS_PORT = 18081
+OPENAI_PORT = 18082
+APP_PORT = 18080
+
+SCENARIOS = ("text", "attachments", "approval")
+
+_task_ids = itertools.count(int(time.time()) * 1000)
+_comment_ids = itertools.count(1)
+
+
+def make_task(task_id, text="", attachments=None):
+    return {
+        "task": {
+            "id": task_id,
+            "form_id": 1,
+            "is_closed": False,
+            "fields": [{"id": fake_pyrus.GROUP_ID, "name": "Клиент", "type": "title", "value": {"fields": []}}],
+            "attachments": attachments or [],
+            "comments": [{
+                "id": next(_comment_ids),
+                "text": text,
+                "channel": {"type": "telegram"},
+                "author": {"id": 1, "first_name": "Клиент"},
+            }],
+        }
+    }
+
+def signed(payload, key=PYRUS_KEY):
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    return body, hmac.new(key.encode(), msg=body, digestmod=hashlib.sha1).hexdigest()
+
+
+async def post(session, url, payload):
+    body, signature = signed(payload)
+    started = time.perf_counter()
+    async with session.post(url, data=body, headers={"x-pyrus-sig": signature, "Content-Type": "application/json"}) as resp:
+        data = await resp.read()
+    return time.perf_counter() - started, resp.status, data
+
+async def run_one(scenario, session, url, pyrus_url):
+    """Одна задача сценария; возвращает (время измеряемого вебхука, статус, тело ответа)"""
+    task_id = next(_task_ids)
+    if scenario == "text":
+        return await post(session, url, make_task(task_id, "Касса не печатает чек"))
+    if scenario == "attachments":
+        attachments = [{"url": f"{pyrus_url}/files/{uuid.uuid4().hex}.jpg", "name": "photo.jpg"}]
+        return await post(session, url, make_task(task_id, "", attachments))
+    # approval: первое сообщение открывает диалог (не измеряется), второе вызывает передачу и заполнение полей
+    await post(session, url, make_task(task_id, "Кафе 37, г. Алматы, ул. Абая 37. Касса не печатает чек"))
+    return await post(session, url, make_task(task_id, "Соедините с оператором"))
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+async def run_scenario(scenario, url, pyrus_url, total, concurrency):
+    latencies, errors, approved = [], 0, 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker(session):
+        nonlocal errors, approved
+        while not queue.empty():
+            queue.get_nowait()
+            try:
+                elapsed, status, data = await run_one(scenario, session, url, pyrus_url)
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            if status != 200:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            approved += b"approval_choice" in data
+
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        "scenario": scenario,
+        "requests": total,
+        "errors": errors,
+        "approved": approved,
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50": round(percentile(latencies, 0.50), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+    }
+
+
+async def start_fake(app, port):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+def spawn_app(pyrus_url, openai_url):
+    env = dict(os.environ, PYRUS_API_URL=pyrus_url, OPENAI_BASE_URL=openai_url)
+    return subprocess.Popen(
+        [sys.executable, "-m", "hypercorn", "app:app", "--bind", f"127.0.0.1:{APP_PORT}"],
+        env=env,
+    )
+
+async def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/metrics") as resp:
+                    if resp.status in (200, 401):
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.3)
+    raise RuntimeError(f"app did not start at {base_url}")
+
+
+async def main(args):
+    pyrus_url = f"http://127.0.0.1:{PYRUS_PORT}"
+    openai_url = f"http://127.0.0.1:{OPENAI_PORT}/v1"
+    runners = [
+        await start_fake(fake_pyrus.create_app(args.pyrus_latency), PYRUS_PORT),
+        await start_fake(fake_openai.create_app(args.openai_latency, args.run_latency), OPENAI_PORT),
+    ]
+    process = None
+    base_url = args.target
+    if not base_url:
+        process = spawn_app(f"{pyrus_url}/v4", openai_url)
+        base_url = f"http://127.0.0.1:{APP_PORT}"
+    try:
+        await wait_ready(base_url)
+        url = f"{base_url}/webhook/{args.tenant}"
+        results = []
+        for scenario in args.scenarios.split(","):
+            result = await run_scenario(scenario.strip(), url, pyrus_url, args.requests, args.concurrency)
+            results.append(result)
+            print(" ".join(f"{k}={v}" for k, v in result.items()), flush=True)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=15)
+        for runner in runners:
+            await runner.cleanup()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест вебхука Pyrus")
+    parser.add_argument("--target", help="URL уже запущенного приложения (по умолчанию запускается hypercorn app:app)")
+    parser.add_argument("--tenant", default=TENANT_ID)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=100, help="задач на сценарий")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--pyrus-latency", default="lognormal:0.15,0.5")
+    parser.add_argument("--openai-latency", default="lognormal:0.2,0.5", help="задержка обычных запросов OpenAI")
+    parser.add_argument("--run-latency", default="lognormal:1.5,0.4", help="время выполнения run / completion")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
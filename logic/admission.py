@@ -0,0 +1,142 @@
+import asyncio, heapq, os, time
+from collections import Counter
+from contextlib import asynccontextmanager
+from itertools import count
+from logic.metrics import inc, observe, set_gauge
+from logic.throttle import TokenBucket
+from logic import log
+
+# Допуск работы с моделью (ответ, разбор вложений, заполнение полей) в воркере. Все организации делят
+# SLOTS одновременных вызовов; у каждой свой предел одновременных (tenants.admission_concurrency),
+# token bucket на число вызовов в минуту (tenants.admission_rate) и вес (tenants.admission_weight).
+# Ожидающие получают слот по взвешенной справедливой очереди (WFQ): метка — виртуальное время завершения,
+# поэтому массовый сбой у одной организации не задерживает ответы остальным.
+# Если очередь организации переполнена, лимит исчерпан или ожидание дольше MAX_WAIT — Overloaded,
+# дальше политика организации (tenants.overload): defer — 503, Pyrus доставит вебхук повторно,
+# handoff — передача сотруднику, busy — шаблон «много обращений».
+SLOTS = int(os.getenv("ADMISSION_SLOTS", "32"))
+DEFAULT_CONCURRENCY = int(os.getenv("ADMISSION_TENANT_CONCURRENCY", "8"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "50"))  # ожидающих на организацию
+MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "20"))  # секунд в очереди
+RETRY_AFTER = 30  # секунд, заголовок ответа defer
+POLICIES = ("defer", "handoff", "busy")
+BUSY_REPLY = "Сейчас очень много обращений. Мы ответим вам, как только освободится специалист."
+
+
+class Overloaded(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Waiter:
+    __slots__ = ("tenant", "cap", "future")
+
+    def __init__(self, tenant, cap, future):
+        self.tenant, self.cap, self.future = tenant, cap, future
+
+
+class Scheduler:
+    """Слоты и очередь одного воркера (один event loop — без блокировок)"""
+
+    def __init__(self, slots=SLOTS):
+        self.slots = slots
+        self.busy = 0
+        self.running = Counter()
+        self.waiting = Counter()
+        self.finish = {}  # последняя метка организации
+        self.virtual = 0.0  # метка последнего получившего слот
+        self.queue = []  # heap (метка, порядок, Waiter)
+        self._seq = count()
+
+    async def acquire(self, tenant, weight=1.0, cap=DEFAULT_CONCURRENCY, max_wait=MAX_WAIT):
+        if self.waiting[tenant] >= MAX_QUEUE:
+            raise Overloaded("queue")
+        tag = max(self.virtual, self.finish.get(tenant, 0.0)) + 1.0 / max(weight, 0.01)
+        self.finish[tenant] = tag
+        waiter = Waiter(tenant, cap, asyncio.get_running_loop().create_future())
+        heapq.heappush(self.queue, (tag, next(self._seq), waiter))
+        self.waiting[tenant] += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, max_wait)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(tenant)  # слот выдан в момент отмены
+            else:
+                self.waiting[tenant] -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise Overloaded("wait") from None
+            raise
+        finally:
+            self._gauges(tenant)
+
+    def release(self, tenant):
+        self.busy -= 1
+        self.running[tenant] -= 1
+        self._dispatch()
+        self._gauges(tenant)
+
+    def _dispatch(self):
+        """Свободные слоты — ожидающим с наименьшей меткой, у кого не исчерпан свой предел"""
+        blocked = []
+        while self.queue and self.busy < self.slots:
+            item = heapq.heappop(self.queue)
+            waiter = item[2]
+            if waiter.future.done():
+                continue  # ожидание отменено
+            if self.running[waiter.tenant] >= waiter.cap:
+                blocked.append(item)
+                continue
+            self.virtual = item[0]
+            self.busy += 1
+            self.running[waiter.tenant] += 1
+            self.waiting[waiter.tenant] -= 1
+            waiter.future.set_result(None)
+            self._gauges(waiter.tenant)
+        for item in blocked:
+            heapq.heappush(self.queue, item)
+
+    def _gauges(self, tenant):
+        set_gauge("barry_admission_queue_depth", self.waiting[tenant], tenant)
+        set_gauge("barry_admission_running", self.running[tenant], tenant)
+
+
+_scheduler = Scheduler()
+_buckets = {}  # {tenant_id: TokenBucket}
+
+
+def limits(config):
+    tenant = config["tenant"]
+    return (tenant.get("admission_concurrency") or DEFAULT_CONCURRENCY, tenant.get("admission_rate") or 0,
+            tenant.get("admission_weight") or 1.0)
+
+def policy(config):
+    return config["tenant"].get("overload") or "defer"
+
+def _bucket(tenant, rate):
+    """Бакет на rate вызовов в минуту с запасом на минуту; пересоздаётся при смене лимита"""
+    bucket = _buckets.get(tenant)
+    if bucket is None or bucket.capacity != rate:
+        bucket = _buckets[tenant] = TokenBucket(rate, rate / 60)
+    return bucket
+
+@asynccontextmanager
+async def admit(config, kind):
+    """async with admit(config, "question"): — слот на время вызова модели"""
+    tenant = config["tenant"]["tenant_id"] or "-"
+    cap, rate, weight = limits(config)
+    started = time.perf_counter()
+    try:
+        if rate and not _bucket(tenant, rate).take():
+            raise Overloaded("rate")
+        await _scheduler.acquire(tenant, weight, cap)
+    except Overloaded as e:
+        inc("barry_admission_rejected_total", kind, e.reason, tenant)
+        log.warning("admission rejected", kind=kind, reason=e.reason, policy=policy(config))
+        raise
+    observe("barry_admission_wait_seconds", time.perf_counter() - started, kind, tenant)
+    try:
+        yield
+    finally:
+        _scheduler.release(tenant)
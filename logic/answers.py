@@ -0,0 +1,121 @@
+import hashlib, math, os, time
+from collections import OrderedDict
+from itertools import count
+from operator import mul
+from logic.atts import run_blocking
+from logic.metrics import inc, observe, current_tenant
+from logic.prompts import memoized
+from logic.retrieval import tokenize
+from logic.usage import record as record_usage
+from logic import log, resilience
+
+# Кэш ответов на частые вопросы (tenants.answer_cache). Первое сообщение диалога сравнивается по эмбеддингу
+# с прошлыми вопросами организации; если есть похожий (косинус >= THRESHOLD) с хорошим ответом
+# и шаблон с тех пор не менялся — ответ отдаётся без запуска модели.
+# Хорошим ответ становится, когда модель CONFIRMATIONS раз ответила на похожие вопросы одинаково по смыслу
+# (совпадение слов >= AGREEMENT) или когда его отметили через mark_good.
+# Кэш в памяти воркера: TTL и вытеснение давно не использованных записей сверх SIZE на организацию.
+MODEL = os.getenv("ANSWER_CACHE_MODEL", "text-embedding-3-small")
+THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "500"))
+CONFIRMATIONS = int(os.getenv("ANSWER_CACHE_CONFIRMATIONS", "2"))
+AGREEMENT = 0.6
+
+_caches = {}  # {tenant_id: OrderedDict{номер: запись}} — от давно использованных к недавним
+_ids = count(1)
+
+
+def enabled(config):
+    return bool(config["tenant"].get("answer_cache"))
+
+def first_turn(sessions, id):
+    """Кэшируются только ответы на первое сообщение: они не зависят от предыдущей переписки"""
+    return not sessions.get(id, {}).get("history")
+
+def template_version(config):
+    return memoized("answers:template", config, lambda: hashlib.sha1((config.get("template") or "").encode()).hexdigest())
+
+def agree(a, b):
+    a, b = set(tokenize(a)), set(tokenize(b))
+    return len(a & b) / (len(a | b) or 1) >= AGREEMENT
+
+
+async def embed(client, text):
+    # одна попытка: без эмбеддинга ход просто идёт мимо кэша
+    resp = await resilience.call(client, MODEL, lambda: client.embeddings.create(model=MODEL, input=[text]), attempts=1)
+    record_usage(MODEL, "embedding", resp.usage)
+    vector = resp.data[0].embedding
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+def _candidates(cache, version):
+    """Удаляет устаревшие записи и записи старого шаблона; остальные — снимок (номер, вектор) для поиска"""
+    now = time.time()
+    for key, entry in list(cache.items()):
+        if entry["template"] != version or now - entry["created"] > TTL:
+            del cache[key]
+    return [(key, entry["vector"]) for key, entry in cache.items()]
+
+def _nearest(candidates, vector):
+    """(номер, сходство) ближайшего вопроса. SIZE векторов по 1536 чисел — десятки мс на чистом Python,
+    поэтому выполняется в потоке (run_blocking) по снимку, а не в event loop"""
+    best, best_score = None, 0.0
+    for key, other in candidates:
+        score = sum(map(mul, vector, other))
+        if score > best_score:
+            best, best_score = key, score
+    return best, best_score
+
+
+async def lookup(config, text, client, task_id=None):
+    """(ответ или None, probe) — probe (эмбеддинг и ближайшая запись) потом передаётся в store"""
+    tenant = current_tenant.get()
+    started = time.perf_counter()
+    try:
+        vector = await embed(client, text)
+    except Exception as e:
+        log.warning("answer cache embedding error", task=task_id, stage="answer_cache", error=e)
+        inc("barry_answer_cache_total", "error", tenant)
+        return None, None
+
+    cache = _caches.setdefault(config["tenant"]["tenant_id"], OrderedDict())
+    candidates = _candidates(cache, template_version(config))
+    key, score = await run_blocking(_nearest, candidates, vector) if candidates else (None, 0.0)
+    entry = cache.get(key)
+    result = "hit" if entry and entry["good"] and score >= THRESHOLD else "miss"
+    if result == "hit":
+        cache.move_to_end(key)
+        entry["hits"] += 1
+        log.info("answer cache hit", task=task_id, stage="answer_cache", score=round(score, 3), question=entry["question"])
+    inc("barry_answer_cache_total", result, tenant)
+    observe("barry_answer_cache_seconds", time.perf_counter() - started, result, tenant)
+    return (entry["reply"] if result == "hit" else None), {"vector": vector, "key": key, "score": score}
+
+
+def store(config, text, probe, reply):
+    """Ответ модели на первое сообщение: подтверждает ближайшую запись, найденную lookup, или добавляет новую.
+    Возвращает номер записи"""
+    cache = _caches.setdefault(config["tenant"]["tenant_id"], OrderedDict())
+    version = template_version(config)
+    key, score = probe["key"], probe["score"]
+    entry = cache.get(key)  # за время ответа модели запись могла быть вытеснена
+    if entry and entry["template"] == version and score >= THRESHOLD and agree(entry["reply"], reply):
+        entry["confirmations"] += 1
+        entry["good"] = entry["good"] or entry["confirmations"] >= CONFIRMATIONS
+        cache.move_to_end(key)
+        return key
+
+    key = next(_ids)
+    cache[key] = {
+        "vector": probe["vector"], "question": text, "reply": reply, "template": version,
+        "created": time.time(), "confirmations": 1, "good": CONFIRMATIONS <= 1, "hits": 0,
+    }
+    while len(cache) > SIZE:
+        cache.popitem(last=False)
+    return key
+
+def mark_good(tenant_id, key):
+    entry = _caches.get(tenant_id, {}).get(key)
+    if entry:
+        entry["good"] = True
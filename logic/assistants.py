@@ -0,0 +1,180 @@
+import asyncio, hashlib
+from logic.cache import get_mysql_connection, get_pyrus_key, load_configs
+from logic.atts import run_blocking
+from logic.chat import instructions
+from logic import log
+
+# Реестр assistant'ов организаций (таблица assistants): переживает перезапуски и общий для всех воркеров.
+# Хэш инструкций и модели — если шаблон или модель поменялись, assistant обновляется, а не создаётся заново.
+# Вместе с хэшем хранится версия конфигурации: воркер, ещё не перечитавший конфигурацию
+# (до CONFIG_CHECK_INTERVAL), видит другой хэш, но более новую версию и assistant не трогает.
+_registry = {}  # {(tenant_id, assistant_type): (assistant_id, instructions_hash, config_version)}
+_locks = {}  # {tenant_id: asyncio.Lock} — организации не ждут друг друга
+
+
+def instructions_hash(text, model):
+    return hashlib.sha256(f"{model}\n{text}".encode()).hexdigest()
+
+def _lock(tenant_id):
+    lock = _locks.get(tenant_id)
+    if lock is None:
+        lock = _locks[tenant_id] = asyncio.Lock()
+    return lock
+
+
+def load_registry():
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    c.execute("SELECT tenant_id, assistant_type, assistant_id, instructions_hash, config_version FROM assistants")
+    rows = c.fetchall()
+    conn.close()
+    _registry.clear()
+    for tenant_id, assistant_type, *entry in rows:
+        _registry[(tenant_id, assistant_type)] = tuple(entry)
+    return len(rows)
+
+def _load_one(tenant_id, assistant_type):
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT assistant_id, instructions_hash, config_version FROM assistants
+        WHERE tenant_id=%s AND assistant_type=%s
+    """, (tenant_id, assistant_type))
+    row = c.fetchone()
+    conn.close()
+    return tuple(row) if row else None
+
+def _save(tenant_id, assistant_type, assistant_id, digest, version, expected_id=None):
+    """Записывает assistant; при expected_id обновляет только если строку не изменил другой воркер
+    и в ней не более новая версия конфигурации. Возвращает True, если запись принята"""
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    if expected_id is None:
+        c.execute("""
+            INSERT IGNORE INTO assistants (tenant_id, assistant_type, assistant_id, instructions_hash, config_version)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (tenant_id, assistant_type, assistant_id, digest, version))
+    else:
+        c.execute("""
+            UPDATE assistants SET assistant_id=%s, instructions_hash=%s, config_version=%s
+            WHERE tenant_id=%s AND assistant_type=%s AND assistant_id=%s AND config_version<=%s
+        """, (assistant_id, digest, version, tenant_id, assistant_type, expected_id, version))
+    saved = c.rowcount > 0
+    conn.commit()
+    conn.close()
+    return saved
+
+def forget_tenant(c, tenant_id):
+    """Удаление записей организации (курсор вызывающего, коммит там же)"""
+    c.execute("DELETE FROM assistants WHERE tenant_id=%s", (tenant_id,))
+    for key in [k for k in _registry if k[0] == tenant_id]:
+        del _registry[key]
+
+def rename_tenant(c, old_tenant_id, new_tenant_id):
+    c.execute("UPDATE assistants SET tenant_id=%s WHERE tenant_id=%s", (new_tenant_id, old_tenant_id))
+    for key in [k for k in _registry if k[0] == old_tenant_id]:
+        _registry[(new_tenant_id, key[1])] = _registry.pop(key)
+
+
+async def _delete(client, tenant_id, assistant_id):
+    try:
+        await client.beta.assistants.delete(assistant_id)
+    except Exception as e:
+        log.warning("assistant delete failed", tenant=tenant_id, assistant=assistant_id, error=e)
+
+
+def _current(entry, digest, version):
+    """Запись подходит: инструкции совпадают или конфигурация вызывающего старее записанной"""
+    return entry is not None and (entry[1] == digest or entry[2] > version)
+
+
+async def _reapply(client, tenant_id, assistant_type, row):
+    """Наш update перезаписал assistant, а в таблице уже более новая конфигурация другого воркера —
+    возвращаем assistant'у инструкции по свежей конфигурации организации. Возвращает запись реестра"""
+    pyrus_key, _ = await run_blocking(get_pyrus_key, tenant_id)
+    fresh = (await run_blocking(load_configs, [pyrus_key])).get(pyrus_key) if pyrus_key else None
+    if not fresh:
+        return row
+    model = fresh["tenant"]["gpt_model"]
+    text = instructions(assistant_type, fresh)
+    digest, version = instructions_hash(text, model), fresh.get("version") or 0
+    await client.beta.assistants.update(row[0], instructions=text, model=model)
+    if await run_blocking(_save, tenant_id, assistant_type, row[0], digest, version, row[0]):
+        return (row[0], digest, version)
+    return row
+
+
+async def warm():
+    try:
+        count = await run_blocking(load_registry)
+        log.info("assistants registry loaded", count=count)
+    except Exception as e:
+        log.error("assistants registry load error", error=e)
+
+
+async def get_assistant(tenant_id, assistant_type, config, model, client):
+    text = instructions(assistant_type, config)
+    digest = instructions_hash(text, model)
+    version = config.get("version") or 0
+    key = (tenant_id, assistant_type)
+
+    entry = _registry.get(key)
+    if _current(entry, digest, version):
+        return entry[0]
+
+    async with _lock(tenant_id):
+        entry = _registry.get(key)
+        if _current(entry, digest, version):
+            return entry[0]
+
+        # Другой воркер мог уже создать или обновить assistant
+        row = await run_blocking(_load_one, tenant_id, assistant_type)
+        if _current(row, digest, version):
+            _registry[key] = row
+            return row[0]
+
+        name = f"Support Bot - {tenant_id}" if assistant_type == "main" else f"Integrations Bot - {tenant_id}"
+        if row:
+            try:
+                await client.beta.assistants.update(row[0], name=name, instructions=text, model=model)
+            except Exception as e:
+                log.warning("assistant update failed, creating new", tenant=tenant_id, kind=assistant_type, error=e)
+            else:
+                if await run_blocking(_save, tenant_id, assistant_type, row[0], digest, version, row[0]):
+                    _registry[key] = (row[0], digest, version)
+                    log.info("assistant updated", tenant=tenant_id, kind=assistant_type, assistant=row[0])
+                    return row[0]
+                # Пока шло обновление, запись изменил другой воркер: новый assistant не нужен
+                other = await run_blocking(_load_one, tenant_id, assistant_type)
+                if not other:
+                    return row[0]  # организацию удалили
+                if other[0] == row[0] and other[1] != digest:
+                    # в таблице более новая конфигурация, а инструкции assistant'а только что заменены нашими
+                    log.warning("assistant update raced with newer config", tenant=tenant_id, kind=assistant_type, assistant=row[0])
+                    other = await _reapply(client, tenant_id, assistant_type, other)
+                _registry[key] = other
+                return other[0]
+
+        assistant = await client.beta.assistants.create(name=name, instructions=text, model=model)
+        replaced = row[0] if row else None
+        saved = await run_blocking(_save, tenant_id, assistant_type, assistant.id, digest, version, replaced)
+        if not saved:
+            # Гонка с другим воркером: его запись подходит или новее — берём её, свой assistant удаляем
+            other = await run_blocking(_load_one, tenant_id, assistant_type)
+            replaced = other[0] if other else None
+            if not _current(other, digest, version):
+                saved = await run_blocking(_save, tenant_id, assistant_type, assistant.id, digest, version, replaced)
+            if not saved:
+                other = await run_blocking(_load_one, tenant_id, assistant_type)
+                if other:
+                    await _delete(client, tenant_id, assistant.id)
+                    _registry[key] = other
+                    return other[0]
+                replaced = None  # строку удалили вместе с организацией — свой assistant не удаляем
+
+        # Заменённый assistant больше не нужен — не оставляем его в OpenAI
+        if replaced and replaced != assistant.id:
+            await _delete(client, tenant_id, replaced)
+        _registry[key] = (assistant.id, digest, version)
+        log.info("assistant created", tenant=tenant_id, kind=assistant_type, assistant=assistant.id)
+        return assistant.id
@@ -1,27 +1,34 @@
-import uuid
-from openai import AsyncOpenAI
+import uuid, os
 import base64
 import requests, asyncio
 from functools import partial
 from logic.cache import get_cache_config
+from logic.metrics import stage
+from logic import log, resilience, fastjson
+
+# Переопределяется для нагрузочных тестов (loadtest/)
+PYRUS_API_URL = os.getenv("PYRUS_API_URL", "https://api.pyrus.com/v4")
 
 async def run_blocking(func, *args, **kwargs):
     loop = asyncio.get_event_loop()
     return await loop.run_in_executor(None, partial(func, *args, **kwargs))
 
+@stage("pyrus_auth")
 async def acs(config, pyrus_key):
     def get_token():
         return requests.post(
-            "https://api.pyrus.com/v4/auth",
+            f"{PYRUS_API_URL}/auth",
             json={"login": config["config"]["bot_login"], "security_key": pyrus_key},
             timeout=10
-        ).json().get("access_token")
-    return await run_blocking(get_token)
+        ).content
+    return fastjson.loads(await run_blocking(get_token)).get("access_token")
 
+@stage("inf")
 async def inf(url, name, pyrus_key):
     config = get_cache_config(pyrus_key)
     token = await acs(config, pyrus_key)
-    client = AsyncOpenAI(api_key=config["api_keys"]["openai_api_key"])
+    from logic import keys  # keys импортирует atts
+    client = keys.client(config, stateless=True)
 
     def download():
         return requests.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=20).content
@@ -33,16 +40,26 @@ async def inf(url, name, pyrus_key):
     with open(path, "wb") as f:
         f.write(await run_blocking(download))
 
-    text = await (extract(path, client) if ext == ".jpg" else transcript(path, client))
+    if ext == ".jpg":
+        from logic import routing  # routing -> context -> usage импортирует atts
+        model = routing.vision_model(config)
+        text = await extract(path, client, model)
+        if not text and model != routing.VISION_MODEL:
+            routing.escalate(None, "vision")
+            text = await extract(path, client, routing.VISION_MODEL)
+    else:
+        text = await transcript(path, client)
     return text
 
 
-async def extract(path, client):
+@stage("vision")
+async def extract(path, client, model="gpt-4o"):
+    from logic import usage  # logic.usage импортирует atts
     try:
         with open(path, "rb") as img:
             img_b64 = base64.b64encode(img.read()).decode()
-            response = await client.chat.completions.create(
-                model="gpt-4o",
+            response = await resilience.call(client, model, lambda: client.chat.completions.create(
+                model=model,
                 messages=[
                     {
                         "role": "system",
@@ -68,21 +85,27 @@ async def extract(path, client):
                     }
                 ],
                 max_tokens=150
-            )
+            ))
+            usage.record(model, "vision", response.usage)
             return response.choices[0].message.content.strip()
     except Exception as e:
-        print("Extraction error:", e)
+        log.error("extraction error", stage="vision", error=e)
         return ""
 
 
+@stage("whisper")
 async def transcript(path, client):
+    from logic import usage
     try:
         with open(path, "rb") as f:
-            resp = await client.audio.transcriptions.create(
-                model="whisper-1",
-                file=f
-            )
-            return resp.text.strip()
+            audio = (os.path.basename(path), f.read())  # байты, а не файл: повтор отправляет запись заново
+        resp = await resilience.call(client, "whisper-1", lambda: client.audio.transcriptions.create(
+            model="whisper-1",
+            file=audio,
+            response_format="verbose_json"  # с длительностью записи для учёта расхода
+        ))
+        usage.record("whisper-1", "audio", audio_seconds=getattr(resp, "duration", 0) or 0)
+        return resp.text.strip()
     except Exception as e:
-        print("Transcription error:", e)
+        log.error("transcription error", stage="whisper", error=e)
         return ""
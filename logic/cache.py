@@ -1,11 +1,19 @@
-import mysql.connector, os, json
+import mysql.connector, os, threading
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
 from urllib.parse import urlparse
+from logic import fastjson
 
 _cache = {}
+_tenants = {}  # {tenant_id: (pyrus_key, gpt_model)}
+_pool = None
+_pool_lock = threading.Lock()
 
-def get_mysql_connection():
+POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "8"))
+
+def _connection_args():
     url = urlparse(os.getenv("MYSQL_URL"))
-    return mysql.connector.connect(
+    return dict(
         user=url.username,
         password=url.password,
         host=url.hostname,
@@ -13,108 +21,194 @@ def get_mysql_connection():
         database=url.path[1:]
     )
 
+def get_mysql_connection():
+    """Соединение из пула; close() возвращает его в пул. Если пул занят — обычное соединение"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(pool_name="barry", pool_size=POOL_SIZE, **_connection_args())
+    try:
+        return _pool.get_connection()
+    except PoolError:
+        return mysql.connector.connect(**_connection_args())
+
 def clear_cache(pyrus_key):
     if pyrus_key in _cache:
         del _cache[pyrus_key]
 
+def clear_tenant(tenant_id):
+    _tenants.pop(tenant_id, None)
+
 def clear_all_cache():
     _cache.clear()
+    _tenants.clear()
+
+
+def bump_config_version(c, pyrus_key=None):
+    """Отмечает изменение конфигурации (в той же транзакции); без pyrus_key — для всех организаций"""
+    if pyrus_key is None:
+        c.execute("UPDATE tenants SET config_version = config_version + 1")
+    else:
+        c.execute("UPDATE tenants SET config_version = config_version + 1 WHERE pyrus_key=%s", (pyrus_key,))
+
+def refresh_changed_configs():
+    """Одним запросом сверяет версии всех организаций и перезагружает только изменившиеся.
+    Вызывается из шедулера в отдельном потоке, поэтому вебхуки не ждут загрузки"""
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    c.execute("SELECT tenant_id, pyrus_key, gpt_model, config_version FROM tenants")
+    rows = c.fetchall()
+    conn.close()
+
+    versions = {}
+    for tenant_id, pyrus_key, gpt_model, version in rows:
+        versions[pyrus_key] = version
+        if tenant_id in _tenants:
+            _tenants[tenant_id] = (pyrus_key, gpt_model)
+    for tenant_id in [t for t, (key, _) in list(_tenants.items()) if key not in versions]:
+        _tenants.pop(tenant_id, None)
+
+    changed = [key for key, config in list(_cache.items()) if config["version"] != versions.get(key)]
+    if not changed:
+        return []
+    loaded = load_configs([key for key in changed if key in versions])
+    for key in changed:
+        if key in loaded:
+            _cache[key] = loaded[key]
+        else:
+            _cache.pop(key, None)
+    return changed
 
 
 def get_pyrus_key(tenant_id):
+    if tenant_id in _tenants:
+        return _tenants[tenant_id]
+
     conn = get_mysql_connection()
     c = conn.cursor()
     c.execute("SELECT pyrus_key, gpt_model FROM tenants WHERE tenant_id=%s", (tenant_id,))
     row = c.fetchone()
     conn.close()
-    return (row[0], row[1]) if row else (None, None)
+    if not row:
+        return None, None
+    _tenants[tenant_id] = (row[0], row[1])
+    return _tenants[tenant_id]
+
+# Вся конфигурация организации одним запросом
+CONFIG_SQL = """
+    SELECT
+        t.pyrus_key, t.tenant_id, t.gpt_model, t.allow_attachments_toggle, t.allow_multi_channel_toggle,
+        t.config_version, t.engine, t.retrieval_top_k, t.answer_cache, t.intents, t.intent_threshold,
+        t.fast_model, t.routing_max_chars, t.routing_keywords, t.key_group,
+        t.admission_concurrency, t.admission_rate, t.admission_weight, t.overload, t.busy_template,
+        o.ofd_enabled, o.ofd_day, o.ofd_greeting, o.ofd_template,
+        ot.is_attachments_enabled, ot.is_multi_channel_enabled, ot.is_emergency_enabled, ot.emergency_template,
+        cf.bot_login, cf.temperature, cf.stop_words, cf.bot_stop_words, cf.time_zone,
+        cf.work_from, cf.work_to, cf.work_from_weekend, cf.work_to_weekend, cf.offmsg,
+        fc.form_enabled, fc.form_or_card, fc.form_template, fc.dynamic_fields,
+        ca.card_id, ca.field_id, ca.card_field_id, ca.group_id,
+        f.dictionary_id, f.dict_field_id, f.name_column, f.filter_column, f.filter_words,
+        tp.template, rf.parsed_reg
+    FROM tenants t
+    LEFT JOIN ofd o ON o.pyrus_key = t.pyrus_key
+    LEFT JOIN other ot ON ot.pyrus_key = t.pyrus_key
+    LEFT JOIN config cf ON cf.pyrus_key = t.pyrus_key
+    LEFT JOIN form_config fc ON fc.pyrus_key = t.pyrus_key
+    LEFT JOIN card ca ON ca.pyrus_key = t.pyrus_key
+    LEFT JOIN form f ON f.pyrus_key = t.pyrus_key
+    LEFT JOIN template tp ON tp.pyrus_key = t.pyrus_key
+    LEFT JOIN reg_form rf ON rf.pyrus_key = t.pyrus_key
+    WHERE t.pyrus_key IN ({keys})
+"""
+
+def load_configs(pyrus_keys):
+    """{pyrus_key: config} для нескольких организаций одним запросом"""
+    if not pyrus_keys:
+        return {}
+    conn = get_mysql_connection()
+    c = conn.cursor(dictionary=True)
+    c.execute(CONFIG_SQL.format(keys=", ".join(["%s"] * len(pyrus_keys))), tuple(pyrus_keys))
+    rows = c.fetchall()
+    conn.close()
+    return {row["pyrus_key"]: build_config(row) for row in rows}
 
 def get_cache_config(pyrus_key):
     if pyrus_key in _cache:
         return _cache[pyrus_key]
 
-    conn = get_mysql_connection()
-    c = conn.cursor()
-
-    c.execute("SELECT ofd_enabled, ofd_day, ofd_greeting, ofd_template FROM ofd WHERE pyrus_key=%s", (pyrus_key,))
-    ofd = c.fetchone() or (None,) * 4
-
-    c.execute("SELECT is_attachments_enabled, is_multi_channel_enabled, is_emergency_enabled, emergency_template FROM other WHERE pyrus_key=%s", (pyrus_key,))
-    other = c.fetchone() or (False, False, False, None)
-
-    c.execute("SELECT bot_login, temperature, stop_words, bot_stop_words, time_zone, work_from, work_to, work_from_weekend, work_to_weekend, offmsg FROM config WHERE pyrus_key=%s", (pyrus_key,))
-    config = c.fetchone() or (None,) * 11
-
-    c.execute("SELECT form_enabled, form_or_card, form_template, dynamic_fields FROM form_config WHERE pyrus_key=%s", (pyrus_key,))
-    form_config = c.fetchone() or (None, None, None, "[]")
-
-    c.execute("SELECT card_id, field_id, card_field_id, group_id FROM card WHERE pyrus_key=%s", (pyrus_key,))
-    card = c.fetchone() or (None, None, None, None)
-    
-
-    c.execute("SELECT dictionary_id, dict_field_id, name_column, filter_column, filter_words FROM form WHERE pyrus_key=%s", (pyrus_key,))
-    form = c.fetchone() or (None,) * 5
-
-    c.execute("SELECT openai_api_key FROM api_keys WHERE id=1")
-    api_keys = c.fetchone() or (None)
-
-    c.execute("SELECT template FROM template WHERE pyrus_key=%s", (pyrus_key,))
-    template = c.fetchone()
-        
-    c.execute("SELECT parsed_reg FROM reg_form WHERE pyrus_key=%s", (pyrus_key,))
-    parsed_reg = c.fetchone()
-    
-    conn.close()
+    _cache[pyrus_key] = load_configs([pyrus_key]).get(pyrus_key) or build_config({})
+    return _cache[pyrus_key]
 
-    _cache[pyrus_key] = {
+def build_config(row):
+    from logic.serv import template as read_template
+
+    return {
+        "version": row.get("config_version"),
+        "tenant": {
+            "tenant_id": row.get("tenant_id"),
+            "gpt_model": row.get("gpt_model"),
+            "allow_attachments_toggle": bool(row.get("allow_attachments_toggle")),
+            "allow_multi_channel_toggle": bool(row.get("allow_multi_channel_toggle")),
+            "engine": row.get("engine") or "assistants",
+            "retrieval_top_k": row.get("retrieval_top_k") or 0,
+            "answer_cache": bool(row.get("answer_cache")),
+            "intents": row.get("intents") or "off",
+            "intent_threshold": row.get("intent_threshold"),
+            "fast_model": row.get("fast_model"),
+            "routing_max_chars": row.get("routing_max_chars"),
+            "routing_keywords": row.get("routing_keywords"),
+            "key_group": row.get("key_group"),
+            "admission_concurrency": row.get("admission_concurrency"),
+            "admission_rate": row.get("admission_rate"),
+            "admission_weight": row.get("admission_weight"),
+            "overload": row.get("overload") or "defer",
+            "busy_template": row.get("busy_template"),
+        },
         "ofd": {
-            "enabled": ofd[0],
-            "day": ofd[1],
-            "greeting": ofd[2],
-            "template": ofd[3]
+            "enabled": row.get("ofd_enabled"),
+            "day": row.get("ofd_day"),
+            "greeting": row.get("ofd_greeting"),
+            "template": row.get("ofd_template")
         },
+        # Запрещённые админом функции выключены, даже если в other осталось старое значение
         "other": {
-            "attachments_enabled": other[0],
-            "multi_channel_enabled": other[1],
-            "emergency_enabled": other[2],
-            "emergency_template": other[3]
+            "attachments_enabled": bool(row.get("is_attachments_enabled") and row.get("allow_attachments_toggle")),
+            "multi_channel_enabled": bool(row.get("is_multi_channel_enabled") and row.get("allow_multi_channel_toggle")),
+            "emergency_enabled": bool(row.get("is_emergency_enabled")),
+            "emergency_template": row.get("emergency_template")
         },
         "config": {
-            "bot_login": config[0],
-            "temperature": config[1],
-            "stop_words": config[2],
-            "bot_stop_words": config[3],
-            "time_zone": config[4],
-            "work_from": config[5],
-            "work_to": config[6],
-            "work_from_weekend": config[7],
-            "work_to_weekend": config[8],
-            "offmsg": config[9]
+            "bot_login": row.get("bot_login"),
+            "temperature": row.get("temperature"),
+            "stop_words": row.get("stop_words"),
+            "bot_stop_words": row.get("bot_stop_words"),
+            "time_zone": row.get("time_zone"),
+            "work_from": row.get("work_from"),
+            "work_to": row.get("work_to"),
+            "work_from_weekend": row.get("work_from_weekend"),
+            "work_to_weekend": row.get("work_to_weekend"),
+            "offmsg": row.get("offmsg")
         },
         "form_config": {
-            "enabled": form_config[0],
-            "form_or_card": form_config[1],
-            "form_template": form_config[2],
-            "dynamic_fields": json.loads(form_config[3] or "[]")
+            "enabled": row.get("form_enabled"),
+            "form_or_card": row.get("form_or_card"),
+            "form_template": row.get("form_template") or read_template("logic/service.txt"),
+            "dynamic_fields": fastjson.loads(row.get("dynamic_fields") or "[]")
         },
         "form": {
-            "dictionary_id": form[0],
-            "dict_field_id": form[1],
-            "name_column": form[2],
-            "filter_column": form[3],
-            "filter_words": form[4],
+            "dictionary_id": row.get("dictionary_id"),
+            "dict_field_id": row.get("dict_field_id"),
+            "name_column": row.get("name_column"),
+            "filter_column": row.get("filter_column"),
+            "filter_words": row.get("filter_words"),
         },
         "card": {
-            "card_id": card[0],
-            "field_id": card[1],
-            "card_field_id": card[2],
-            "group_id": card[3],
+            "card_id": row.get("card_id"),
+            "field_id": row.get("field_id"),
+            "card_field_id": row.get("card_field_id"),
+            "group_id": row.get("group_id"),
         },
-        "api_keys": {
-            "openai_api_key": api_keys[0],
-        },
-        "template": template[0] if template else None,
-        "parsed_reg": parsed_reg[0] if parsed_reg else None
+        "template": row.get("template"),
+        "parsed_reg": row.get("parsed_reg")
     }
-
-    return _cache[pyrus_key]
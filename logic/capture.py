@@ -0,0 +1,160 @@
+import gzip, os, queue, re, threading, time, glob, atexit, itertools
+from logic import log, fastjson
+
+# Запись входящих вебхуков для воспроизведения (loadtest/replay.py). Включается WEBHOOK_CAPTURE_DIR.
+# Пишет отдельный поток в сжатые JSONL-файлы с ротацией; персональные данные маскируются.
+CAPTURE_DIR = os.getenv("WEBHOOK_CAPTURE_DIR", "")
+CAPTURE_TENANTS = {t.strip() for t in os.getenv("WEBHOOK_CAPTURE_TENANTS", "").split(",") if t.strip()}
+CAPTURE_MAX_BYTES = int(os.getenv("WEBHOOK_CAPTURE_MAX_MB", "50")) * 1024 * 1024  # несжатых данных на файл
+CAPTURE_KEEP = int(os.getenv("WEBHOOK_CAPTURE_KEEP", "20"))  # сколько файлов хранить каждому воркеру
+CAPTURE_QUEUE_SIZE = 5000
+
+ENABLED = bool(CAPTURE_DIR)
+
+FILES_URL = "https://files.invalid"  # подставляется вместо адресов вложений
+# Вебхуки без проверенной организации не пишутся: иначе любой может заполнить диск мусором
+SKIP_OUTCOMES = {"unknown_tenant", "bad_signature"}
+
+dropped = 0
+_sequence = itertools.count()
+_queue = queue.Queue(CAPTURE_QUEUE_SIZE)
+_thread = None
+_thread_lock = threading.Lock()
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+PHONE_RE = re.compile(r"\+?\d[\d\s()-]{8,}\d")
+# Поля с персональными данными: значение заменяется целиком
+PERSONAL_KEYS = {"first_name", "last_name", "email", "phone", "login", "avatar_id", "external_avatar_id"}
+
+
+def _mask(match):
+    return re.sub(r"\w", "x", match.group(0))
+
+def sanitize(value, key=None):
+    """Копия payload без персональных данных; структура и длины строк сохраняются"""
+    if isinstance(value, dict):
+        return {k: sanitize(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize(v) for v in value]
+    if isinstance(value, str):
+        if key in PERSONAL_KEYS:
+            return "x" * len(value)
+        if key == "url":
+            return f"{FILES_URL}/" + value.rsplit("/", 1)[-1][-40:]
+        return PHONE_RE.sub(_mask, EMAIL_RE.sub(_mask, value))
+    return value
+
+
+def record(tenant_id, body, duration, outcome):
+    """Ставит вебхук в очередь на запись; не блокирует и не бросает исключений"""
+    global dropped
+    if not ENABLED or outcome in SKIP_OUTCOMES or (CAPTURE_TENANTS and tenant_id not in CAPTURE_TENANTS):
+        return
+    _ensure_writer()
+    try:
+        _queue.put_nowait((time.time(), tenant_id, body, duration, outcome))
+    except queue.Full:
+        dropped += 1
+
+
+def _ensure_writer():
+    global _thread
+    if _thread is None:
+        with _thread_lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_writer, name="webhook-capture", daemon=True)
+                _thread.start()
+                atexit.register(_queue.put, None)
+
+
+def _open_file():
+    os.makedirs(CAPTURE_DIR, exist_ok=True)
+    name = time.strftime("capture-%Y%m%d-%H%M%S") + f"-{os.getpid()}-{next(_sequence)}.jsonl.gz"
+    path = os.path.join(CAPTURE_DIR, name)
+    return gzip.open(path, "ab"), path
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # процесс есть, но чужой
+    return True
+
+def _cleanup(current):
+    """Удаляет старые закрытые файлы: свои и завершившихся воркеров. Файлы, которые пишут
+    другие воркеры, не трогаются. Вместе с открытым остаётся CAPTURE_KEEP своих файлов"""
+    own, orphaned = [], []
+    for path in glob.glob(os.path.join(CAPTURE_DIR, "capture-*.jsonl.gz")):
+        try:
+            pid = int(os.path.basename(path).split("-")[3])
+        except (IndexError, ValueError):
+            continue
+        if pid == os.getpid():
+            if path != current:
+                own.append(path)
+        elif not _alive(pid):
+            orphaned.append(path)
+    own.sort(key=os.path.getmtime)
+    for path in own[:max(len(own) - CAPTURE_KEEP + 1, 0)] + orphaned:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _writer():
+    file, written = None, 0
+    while True:
+        item = _queue.get()
+        if item is None:
+            break
+        ts, tenant_id, body, duration, outcome = item
+        try:
+            payload = sanitize(fastjson.loads(body))
+        except ValueError:
+            continue
+        line = fastjson.dumpb({"ts": round(ts, 3), "tenant": tenant_id, "duration": round(duration, 4),
+                               "outcome": outcome, "payload": payload}) + b"\n"
+        try:
+            if file is None or written >= CAPTURE_MAX_BYTES:
+                if file:
+                    file.close()
+                (file, path), written = _open_file(), 0
+                _cleanup(path)
+            file.write(line)
+            if _queue.empty():
+                file.flush()
+            written += len(line)
+        except OSError as e:
+            log.error("capture write error", error=e)
+            file = None
+    if file:
+        file.close()
+
+
+def capture_files(paths):
+    """Файлы захвата: каталоги раскрываются в capture-*.jsonl.gz"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "capture-*.jsonl.gz"))))
+        else:
+            files.append(path)
+    return files
+
+def read(paths):
+    """Записи из файлов захвата по порядку времени"""
+    records = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    try:
+                        records.append(fastjson.loads(line))
+                    except ValueError:
+                        pass  # обрезанная последняя строка после падения процесса
+            except EOFError:
+                pass  # файл ещё пишется: нет завершающего блока gzip
+    records.sort(key=lambda r: r["ts"])
+    return records
@@ -0,0 +1,98 @@
+import asyncio, time
+from logic.metrics import stage, observe_stage
+from logic.context import bounded, get_history, remember, schedule_summary, track
+from logic.usage import record as record_usage
+from logic.prompts import memoized
+from logic import resilience, retrieval, routing
+from logic import log
+
+# Движок диалога организации (tenants.engine):
+#   assistants — Assistants API (thread + run, история хранится в OpenAI)
+#   chat — один потоковый запрос chat.completions, контекст — sessions[id] (logic/context.py)
+ENGINES = ("assistants", "chat")
+
+
+def instructions(assistant_type, config):
+    """Системный промпт: шаблон организации или шаблон интеграций (собирается раз на версию конфигурации).
+    При включённом поиске по шаблону — только общие правила, разделы по теме подставляет retrieval"""
+    def build():
+        if retrieval.top_k(config, assistant_type):
+            text = retrieval.pinned_text(config)
+        elif assistant_type == "main":
+            text = config["template"]
+        else:
+            from logic.serv import template
+            text = template("logic/integrations_template.txt")
+        return f"ВНИМАНИЕ! ВСЕ ОТВЕТЫ ТОЛЬКО НА РУССКОМ. Ты — сотрудник техподдержки. Отвечай вежливо и кратко.\n\n[ИНСТРУКЦИЯ]\n{text}"
+    return memoized(f"instructions:{assistant_type}", config, build)
+
+def get_session(sessions, id):
+    session = sessions.setdefault(id, {})
+    session.setdefault("lock", asyncio.Lock())  # сообщения одной задачи обрабатываются по очереди
+    return session
+
+
+async def complete(client, model, messages, temperature):
+    """Один потоковый запрос chat.completions; возвращает полный текст ответа.
+    Дедлайн — на весь поток, оборванный поток повторяется целиком (logic/resilience.py)"""
+    async def request():
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        parts, usage = [], None
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            if chunk.usage:
+                usage = chunk.usage
+        record_usage(model, "chat", usage)
+        return "".join(parts).strip()
+    return await resilience.call(client, model, request)
+
+@stage("question")
+async def chat_question(id, text, sessions, config, model, client, tenant_id, assistant_type="main", max_retries=2, run_model=None):
+    from logic.core import eng_ratio
+
+    session = get_session(sessions, id)
+    try:
+        async with session["lock"]:
+            system = instructions(assistant_type, config)
+            context = bounded(session)
+            # разделы шаблона по теме — после постоянного префикса, перед сообщением клиента
+            if retrieval.top_k(config, assistant_type):
+                found = await retrieval.relevant(config, retrieval.query_text(get_history(session), text), client, id)
+                if found:
+                    context.append({"role": "system", "content": found})
+            context.append({"role": "user", "content": text})
+            messages = [{"role": "system", "content": system}, *context]
+            track("question", session, system, context)
+
+            current = run_model or model  # быстрая модель маршрутизации (logic/routing.py) или модель организации
+            for retry in range(max_retries + 1):
+                started = time.perf_counter()
+                resptext = await complete(client, current, messages, config["config"]["temperature"])
+                observe_stage("completion", started)
+
+                # Проверка доли английских символов (повтор без записи в историю); пустой ответ быстрой модели тоже повторяется
+                failed = not resptext or eng_ratio(resptext) > 0.5
+                if not failed or retry == max_retries or (not resptext and current == model):
+                    break
+                if current != model:
+                    routing.escalate(session, "english" if resptext else "empty")
+                    current = model
+                log.warning("reply rejected, retrying", task=id, attempt=f"{retry+1}/{max_retries}", model=current, text=resptext)
+
+            if resptext:
+                remember(session, text, resptext)
+                schedule_summary(session, client, id)
+            return resptext
+
+    except resilience.Unavailable:
+        raise
+    except Exception as e:
+        log.error("openai error", task=id, stage="question", error=e)
+        return ""
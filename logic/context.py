@@ -0,0 +1,98 @@
+import asyncio, os
+from logic.metrics import observe, current_tenant
+from logic.usage import record as record_usage
+from logic import log, resilience
+
+# Ограниченный контекст диалога: краткая сводка и дословно все сообщения, ещё не вошедшие в неё.
+# В history остаются только такие сообщения: когда их набирается KEEP_MESSAGES + SUMMARY_BATCH,
+# фоновая задача сворачивает всё, кроме последних KEEP_TURNS ходов, и не задерживает сам ответ.
+KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "6"))
+KEEP_MESSAGES = KEEP_TURNS * 2
+SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "4"))  # сколько сообщений копится сверх KEEP перед сводкой
+HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "60"))  # жёсткий предел, если сводка не получается
+SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+
+SUMMARY_PROMPT = (
+    "Кратко перескажи переписку клиента с техподдержкой для продолжения диалога: заведение и адрес, "
+    "проблема, что уже предложено и сделано, о чём договорились. Не больше 120 слов, только факты из переписки."
+)
+
+
+def estimate_tokens(text):
+    """Грубая оценка без токенизатора (кириллица ≈ 3 символа на токен)"""
+    return len(text) // 3 + 1
+
+def _tokens(messages):
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+def get_history(session):
+    session.setdefault("history", [])
+    session.setdefault("summary", "")
+    session.setdefault("full_tokens", 0)  # все сообщения диалога, как если бы отправлялись целиком
+    return session["history"]
+
+def summary_message(session):
+    if not session.get("summary"):
+        return []
+    return [{"role": "system", "content": f"Краткое содержание предыдущей переписки:\n{session['summary']}"}]
+
+def bounded(session):
+    """Сводка (если есть) + все сообщения после неё: ни одно сообщение не выпадает из контекста,
+    пока копится пакет для сводки или она ещё строится"""
+    return summary_message(session) + get_history(session)
+
+def last_messages(session):
+    """truncation_strategy run'а Assistants: сообщения thread после сводки и новое сообщение клиента"""
+    return len(get_history(session)) + 1
+
+
+def remember(session, user_text, reply):
+    history = get_history(session)
+    messages = [{"role": "user", "content": user_text}, {"role": "assistant", "content": reply}]
+    history += messages
+    session["full_tokens"] += _tokens(messages)
+    del history[:-HISTORY_LIMIT]
+
+def track(stage, session, system, sent):
+    """Токены хода: полный диалог против фактически отправленного контекста"""
+    tenant = current_tenant.get()
+    observe("barry_context_tokens", estimate_tokens(system) + session.get("full_tokens", 0) + _tokens(sent[-1:]), stage, "full", tenant)
+    observe("barry_context_tokens", estimate_tokens(system) + _tokens(sent), stage, "sent", tenant)
+
+
+def schedule_summary(session, client, task_id):
+    """Запускает фоновое обновление сводки, если старых сообщений накопилось достаточно"""
+    history = get_history(session)
+    if len(history) < KEEP_MESSAGES + SUMMARY_BATCH:
+        return
+    running = session.get("summarizing")
+    if running and not running.done():
+        return
+    older = history[:-KEEP_MESSAGES]
+    session["summarizing"] = asyncio.create_task(_summarize(session, older, client, task_id))
+
+async def _summarize(session, older, client, task_id):
+    dialog = "\n".join(f"{'Клиент' if m['role'] == 'user' else 'Поддержка'}: {m['content']}" for m in older)
+    previous = f"Предыдущая сводка:\n{session['summary']}\n\n" if session.get("summary") else ""
+    try:
+        resp = await resilience.call(client, SUMMARY_MODEL, lambda: client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"{previous}Переписка:\n{dialog}"},
+            ],
+            max_tokens=300,
+            temperature=0.2
+        ))
+        record_usage(SUMMARY_MODEL, "summary", resp.usage)
+        summary = resp.choices[0].message.content.strip()
+    except Exception as e:
+        log.warning("summary error", task=task_id, stage="summary", error=e)
+        return
+
+    history = session["history"]
+    if summary and history[:len(older)] == older:
+        session["summary"] = summary
+        del history[:len(older)]
+        log.debug("context summarized", task=task_id, folded=len(older), stage="summary")
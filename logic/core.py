@@ -1,16 +1,27 @@
 import openai # linganguliguliguliwacalingangulingang8
-import asyncio
+import asyncio, time
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from quart import jsonify
 from logic.atts import inf
 from logic.serv import flds, template
 from logic.cache import get_cache_config
-from logic.regform_updater import tasks_today
+from logic.stats import count_task
+from logic.metrics import stage, observe_stage, set_outcome
+from logic.usage import record as record_usage
+from logic.chat import chat_question, instructions
+from logic.context import bounded, get_history, last_messages, remember, schedule_summary, summary_message, track
+from logic.assistants import get_assistant
+from logic import admission, answers, intents, resilience, retrieval, routing
+from logic import log
 
 # Thread-safe state management
 approved = set()
 processed = set()
+# Распознанные вложения, ответ на которые отложен при перегрузке (defer): повторно доставленный вебхук
+# берёт текст отсюда — вложение помечается обработанным только после ответа
+_attach_texts = {}  # {url: текст}
+ATTACH_PENDING_LIMIT = 1000
 _approved_lock = asyncio.Lock()
 _processed_lock = asyncio.Lock()
 
@@ -36,21 +47,38 @@ async def mark_processed(url: str):
         processed.add(url)
 
 # Вспомогательные функции для Assistants API
+@stage("thread")
 async def create_or_get_thread(sessions, id, client):
     """Создает новый thread или возвращает существующий"""
     if id not in sessions:
-        thread = await client.beta.threads.create()
+        thread = await resilience.call(client, "threads", lambda: client.beta.threads.create())
         sessions[id] = {"thread_id": thread.id}
     return sessions[id]["thread_id"]
 
+async def cached_turn(sessions, id, text, reply, config, client):
+    """Ответ из кэша записывается в историю диалога (и в thread), чтобы следующий ход шёл с контекстом"""
+    if config["tenant"]["engine"] != "chat":
+        messages = [{"role": "user", "content": text}, {"role": "assistant", "content": reply}]
+        thread_id = sessions.get(id, {}).get("thread_id")
+        if thread_id:
+            for message in messages:
+                await resilience.call(client, "threads", lambda: client.beta.threads.messages.create(thread_id=thread_id, **message), attempts=1)
+        else:
+            thread = await resilience.call(client, "threads", lambda: client.beta.threads.create(messages=messages))
+            sessions[id] = {"thread_id": thread.id}
+    remember(sessions.setdefault(id, {}), text, reply)
+    return reply
+
 async def get_thread_messages(client, thread_id):
     """Получает все сообщения из thread для заполнения полей"""
     messages = await client.beta.threads.messages.list(thread_id=thread_id)
     return [{"role": msg.role, "content": msg.content[0].text.value} for msg in reversed(messages.data)]
 
 # Одобрение задачи
-async def approve(sessions, id, config, pyrus_key, task, tenant_id): # https://surl.li/gbpscn
+async def approve(sessions, id, config, pyrus_key, task, tenant_id, text=None, channel=None): # https://surl.li/gbpscn
     response = {"approval_choice": "approved"}
+    if text:
+        response.update({"text": text, "channel": {"type": channel}})
     # Обновление полей задачи
     if id in sessions:
         if config["form_config"]["enabled"]:
@@ -58,10 +86,23 @@ async def approve(sessions, id, config, pyrus_key, task, tenant_id): # https://s
 
     sessions.pop(id, None)
     await mark_approved(id)
-    tasks_today[tenant_id] = tasks_today.get(tenant_id, 0) + 1
+    count_task(tenant_id)
+    set_outcome("approved")
 
     return jsonify(response)
 
+def split_words(words):
+    return [w.strip().lower() for w in words.split(",")]
+
+def has_stop_word(task, stop_words):
+    """Есть ли стоп-слово где-либо в задаче (включая все комментарии)"""
+    text = str(task).lower()
+    return any(word in text for word in split_words(stop_words))
+
+def eng_ratio(text):
+    """Доля латинских букв в ответе"""
+    return sum(c.isascii() and c.isalpha() for c in text) / max(1, len(text))
+
 def is_working_now(config: dict):
     tz = ZoneInfo(f"Etc/GMT{-int(config['config']['time_zone'])}")
     now = datetime.now(tz)
@@ -80,6 +121,7 @@ def is_working_now(config: dict):
 
 # Обработка задачи
 async def processing(task, id, sessions, pyrus_key, model, client, tenant_id):
+    url, deferred = None, False
     try:
         if task["is_closed"] or await is_approved(id):
             return jsonify({})
@@ -103,21 +145,20 @@ async def processing(task, id, sessions, pyrus_key, model, client, tenant_id):
 
         # Получение последнего комментария
         comment = task["comments"][-1]
-        stop_words = [w.strip().lower() for w in config["config"]["stop_words"].split(",")]
-        if any(word in str(task).lower() for word in stop_words):
-            print("restoit or thanks")
+        if has_stop_word(task, config["config"]["stop_words"]):
+            log.info("stop word, approving", task=id)
             return await approve(sessions, id, config, pyrus_key, task, tenant_id)
 
         # Проверка, является ли автор комментария инженером
         if comment.get("author", {}).get("position"):
-            print("Engineer")
+            log.info("engineer replied, approving", task=id)
 
             return await approve(sessions, id, config, pyrus_key, task, tenant_id)
 
         # Получение текста комментария
         text = comment.get("text", "")
         if text=="test":
-            print(task)
+            log.debug("test task", task=id, payload=task)
             
         attach_text = ""
         attachs = task.get("attachments") or []
@@ -127,107 +168,207 @@ async def processing(task, id, sessions, pyrus_key, model, client, tenant_id):
 
         if attachs:
             if (url := attachs[-1].get("url")) and not await is_processed(url):
-                attach_text = await inf(url, attachs[-1].get("name"), pyrus_key)
-                await mark_processed(url)
+                attach_text = _attach_texts.get(url)
+                if attach_text is None:
+                    async with admission.admit(config, "inf"):
+                        attach_text = await inf(url, attachs[-1].get("name"), pyrus_key)
+                    _attach_texts[url] = attach_text
+                    while len(_attach_texts) > ATTACH_PENDING_LIMIT:
+                        _attach_texts.pop(next(iter(_attach_texts)))
 
         if not text and not attach_text:
             return await approve(sessions, id, config, pyrus_key, task, tenant_id)
 
         full_text = f"{attach_text}\n{text}".strip()
 
-        print(f"{tenant_id}: ({channel}: {full_text})")
+        log.info("incoming message", task=id, channel=channel, text=full_text)
 
         if tenant_id == "restoit" and task["form_id"] == 2328354:
-            print("integrations")
-            return await integrations(sessions, full_text, channel, id, config, model, task, client, tenant_id)
-        
-        return await prep(sessions, full_text, channel, id, pyrus_key, config, model, task, client, tenant_id)
-
-    except KeyError as e: print(f"KeyError: {e}")
+            log.info("routing to integrations", task=id)
+            return await integrations(sessions, full_text, channel, id, pyrus_key, config, model, task, client, tenant_id)
+
+        # Спасибо, приветствие, просьба позвать сотрудника — без запуска модели (logic/intents.py)
+        if not attach_text:
+            intent = intents.decide(config, text, answers.first_turn(sessions, id))
+            if intent:
+                return await shortcut(intent, sessions, text, channel, id, pyrus_key, config, task, client, tenant_id)
+
+        return await prep(sessions, full_text, channel, id, pyrus_key, config, model, task, client, tenant_id, bool(attach_text))
+
+    except admission.Overloaded as e:
+        deferred = admission.policy(config) == "defer"
+        return await overloaded(e.reason, sessions, id, pyrus_key, config, task, channel, tenant_id)
+    except KeyError as e: log.error("missing key in task", task=id, error=e)
+    finally:
+        if url and not deferred:
+            _attach_texts.pop(url, None)
+            await mark_processed(url)
     return jsonify({})
 
 
 
 
-async def integrations(sessions, text, channel, id, config, model, task, client, tenant_id):
-    resptext = await integrations_question(id, text, sessions, config, model, client, tenant_id)
+async def integrations(sessions, text, channel, id, pyrus_key, config, model, task, client, tenant_id):
+    started = time.perf_counter()
+    try:
+        async with admission.admit(config, "question"):
+            if config["tenant"]["engine"] == "chat":
+                resptext = await chat_question(id, text, sessions, config, model, client, tenant_id, "integrations")
+            else:
+                resptext = await integrations_question(id, text, sessions, config, model, client, tenant_id)
+    except resilience.Unavailable as e:
+        return await handoff(sessions, id, pyrus_key, config, task, channel, tenant_id, e.reason)
     response = {"text": resptext, "channel": {"type": channel}, "form_id": "2328354",}
     if not is_working_now(config):
         response["text"] += f"\n\n{config['config']['offmsg']}"
     
-    bot_stop_words = [w.strip().lower() for w in config["config"]["bot_stop_words"].split(",")]
+    bot_stop_words = split_words(config["config"]["bot_stop_words"])
     if any(word in resptext.lower() for word in bot_stop_words):
         response["approval_choice"] = "approved"
         sessions.pop(id, None)
         await mark_approved(id)
-        tasks_today[tenant_id] = tasks_today.get(tenant_id, 0) + 1
+        count_task(tenant_id)
+        set_outcome("approved")
+    else:
+        set_outcome("answered")
 
-    print("integrations:", resptext)
+    log.info("integrations reply", task=id, stage="question", duration=time.perf_counter() - started, text=resptext)
     return jsonify(response)
 
-async def integrations_question(id, text, sessions, config, model, client, tenant_id, retry=0, max_retries=2):
+@stage("question")
+async def integrations_question(id, text, sessions, config, model, client, tenant_id, max_retries=2):
     try:
         thread_id = await create_or_get_thread(sessions, id, client)
         assistant_id = await get_or_create_assistant(tenant_id, "integrations", config, model, client)
 
-        # Проверяем активные runs и ждем их завершения
-        runs = await client.beta.threads.runs.list(thread_id=thread_id, limit=1)
-        if runs.data and runs.data[0].status in ["queued", "in_progress"]:
-            print(f"Waiting for active run {runs.data[0].id} to complete...")
-            active_run = runs.data[0]
-            while active_run.status in ["queued", "in_progress"]:
-                await asyncio.sleep(0.3)
-                active_run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=active_run.id)
-
-        # Добавляем сообщение пользователя
-        await client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=text
-        )
+        # В контексте run только последние сообщения thread и сводка более ранних
+        session = sessions[id]
+        track("question", session, instructions("integrations", config), [*bounded(session), {"role": "user", "content": text}])
+        summary = summary_message(session)
+        resptext = await ask_assistant(id, text, session, thread_id, assistant_id, config, model, client,
+                                       summary[0]["content"] if summary else "", max_retries=max_retries)
+        remember(session, text, resptext)
+        schedule_summary(session, client, id)
+        return resptext
+
+    except resilience.Unavailable:
+        raise
+    except Exception as e:
+        log.error("openai error", task=id, stage="question", error=e)
+        return ""
 
-        # Запускаем assistant
-        run = await client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
-            temperature=config["config"]["temperature"]
-        )
 
-        # Ждем завершения
-        while run.status in ["queued", "in_progress"]:
-            await asyncio.sleep(0.3)
-            run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+async def ask_assistant(id, text, session, thread_id, assistant_id, config, model, client, extra="", run_model=None, max_retries=2):
+    """Сообщение клиента в thread и run assistant'а. Сообщение добавляется один раз; ответ не на русском
+    удаляется из thread и run повторяется (после ответа быстрой модели — на модели организации)"""
+    current = run_model or model
+    threads = client.beta.threads
 
-        if run.status == "completed":
-            messages = await client.beta.threads.messages.list(thread_id=thread_id)
-            resptext = messages.data[0].content[0].text.value.strip()
+    # Проверяем активные runs и ждем их завершения
+    runs = await resilience.call(client, current, lambda: threads.runs.list(thread_id=thread_id, limit=1))
+    if runs.data and runs.data[0].status in resilience.ACTIVE:
+        log.info("waiting for active run", task=id, run=runs.data[0].id)
+        await resilience.wait_run(client, current, thread_id, runs.data[0])
 
-            # Проверка доли английских символов
-            eng_ratio = sum(c.isascii() and c.isalpha() for c in resptext) / max(1, len(resptext))
-            if eng_ratio > 0.5 and retry < max_retries:
-                print(f"Ответ слишком на английском, повторяем запрос {retry+1}/{max_retries}")
-                print("Ответ:", resptext)
-                return await integrations_question(id, text, sessions, config, model, client, tenant_id, retry + 1, max_retries)
+    # без повторов: POST мог выполниться до таймаута (см. logic/resilience.py)
+    await resilience.call(client, current, lambda: threads.messages.create(thread_id=thread_id, role="user", content=text), attempts=1)
 
+    for retry in range(max_retries + 1):
+        run_started = time.perf_counter()
+        run = await resilience.call(client, current, lambda: threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            temperature=config["config"]["temperature"],
+            truncation_strategy={"type": "last_messages", "last_messages": last_messages(session)},
+            **({"additional_instructions": extra} if extra else {}),
+            **({"model": current} if current != model else {})  # assistant остаётся на модели организации
+        ), attempts=1)
+        run = await resilience.wait_run(client, current, thread_id, run)
+        observe_stage("run", run_started)
+        record_usage(current, "assistant", run.usage)
+        if run.status != "completed":
+            raise resilience.unavailable(f"run_{run.status}", current, task=id, error=getattr(run, "last_error", None))
+
+        messages = await resilience.call(client, current, lambda: threads.messages.list(thread_id=thread_id, limit=1))
+        reply = messages.data[0]
+        resptext = reply.content[0].text.value.strip()
+
+        # Проверка доли английских символов
+        if eng_ratio(resptext) <= 0.5 or retry == max_retries:
             return resptext
-        else:
-            print(f"Run failed: {run.status}")
-            return ""
-
-    except Exception as e:
-        print("openai error:", e)
-        return ""
-
-
+        log.warning("reply is mostly english, retrying", task=id, attempt=f"{retry+1}/{max_retries}", text=resptext)
+        await resilience.call(client, current, lambda: threads.messages.delete(reply.id, thread_id=thread_id))
+        if current != model:
+            routing.escalate(session, "english")
+            current = model
 
 
+# Передача сотруднику с сообщением клиенту: по интенту или когда модель не ответит (logic/resilience.py)
+async def handoff(sessions, id, pyrus_key, config, task, channel, tenant_id, reason):
+    log.info("handoff", task=id, reason=reason)
+    resptext = intents.HANDOFF_REPLY
+    if not is_working_now(config):
+        resptext += f"\n\n{config['config']['offmsg']}"
+    return await approve(sessions, id, config, pyrus_key, task, tenant_id, resptext, channel)
+
+
+# Нет слота для вызова модели (logic/admission.py): ответ по политике организации
+async def overloaded(reason, sessions, id, pyrus_key, config, task, channel, tenant_id):
+    rule = admission.policy(config)
+    log.warning("overloaded", task=id, reason=reason, policy=rule)
+    if rule == "handoff":
+        return await handoff(sessions, id, pyrus_key, config, task, channel, tenant_id, "overload")
+    if rule == "busy":
+        set_outcome("busy")
+        return jsonify({"text": config["tenant"].get("busy_template") or admission.BUSY_REPLY, "channel": {"type": channel}})
+    # defer: ничего не записано в thread и историю — повторно доставленный вебхук обработается с начала
+    set_outcome("deferred")
+    return jsonify({}), 503, {"Retry-After": str(admission.RETRY_AFTER)}
+
+
+# Ответ по интенту локального классификатора
+async def shortcut(intent, sessions, text, channel, id, pyrus_key, config, task, client, tenant_id):
+    log.info("intent shortcut", task=id, intent=intent, text=text)
+    if intent == "greeting":
+        try:
+            resptext = await cached_turn(sessions, id, text, intents.GREETING_REPLY, config, client)
+        except resilience.Unavailable as e:
+            return await handoff(sessions, id, pyrus_key, config, task, channel, tenant_id, e.reason)
+        set_outcome("answered")
+        return jsonify({"text": resptext, "channel": {"type": channel}})
+
+    if intent == "thanks":
+        # благодарность после ответа из кэша подтверждает этот ответ
+        if key := sessions.get(id, {}).get("answer_key"):
+            answers.mark_good(tenant_id, key)
+        return await approve(sessions, id, config, pyrus_key, task, tenant_id)
+
+    return await handoff(sessions, id, pyrus_key, config, task, channel, tenant_id, "intent")
 
 # Подготовка ответа
-async def prep(sessions, text, channel, id, pyrus_key, config, model, task, client, tenant_id):
+async def prep(sessions, text, channel, id, pyrus_key, config, model, task, client, tenant_id, attachment=False):
 
-    resptext = await question(id, text, sessions, config, model, client, tenant_id)
+    started = time.perf_counter()
+    cached, probe = None, None
+    if answers.enabled(config) and answers.first_turn(sessions, id):
+        cached, probe = await answers.lookup(config, text, client, id)
+    try:
+        if cached:
+            resptext = await cached_turn(sessions, id, text, cached, config, client)
+        else:
+            # Модель под сообщение: быстрая для простых, модель организации для сложных (logic/routing.py)
+            run_model, route, reason = routing.choose(config, model, sessions.get(id, {}), text, attachment)
+            async with admission.admit(config, "question"):
+                if config["tenant"]["engine"] == "chat":
+                    resptext = await chat_question(id, text, sessions, config, model, client, tenant_id, run_model=run_model)
+                else:
+                    resptext = await question(id, text, sessions, config, model, client, tenant_id, run_model=run_model)
+            routing.observe_route(route, started)
+    except resilience.Unavailable as e:
+        # OpenAI не ответит в разумное время — клиента сразу передаём сотруднику, а не оставляем без ответа
+        return await handoff(sessions, id, pyrus_key, config, task, channel, tenant_id, e.reason)
     if not resptext:
-        print("not resptext")
+        log.warning("empty reply", task=id, stage="question")
         return jsonify({})
     response = {"text": resptext, "channel": {"type": channel}}
     
@@ -239,7 +380,7 @@ async def prep(sessions, text, channel, id, pyrus_key, config, model, task, clie
         response["text"] += f"\n\n{config['other']['emergency_template']}"
 
     # Проверка на наличие Anydesk или ..
-    bot_stop_words = [w.strip().lower() for w in config["config"]["bot_stop_words"].split(",")]
+    bot_stop_words = split_words(config["config"]["bot_stop_words"])
     if any(word in resptext.lower() for word in bot_stop_words):
         response["approval_choice"] = "approved"
 
@@ -248,89 +389,44 @@ async def prep(sessions, text, channel, id, pyrus_key, config, model, task, clie
             response.update(await flds(sessions, id, pyrus_key, task))
         sessions.pop(id, None)
         await mark_approved(id)
-        tasks_today[tenant_id] = tasks_today.get(tenant_id, 0) + 1 
-
-    print(resptext)
+        count_task(tenant_id)
+        set_outcome("approved")
+    else:
+        set_outcome("answered")
+        if probe is not None and not cached:
+            sessions.setdefault(id, {})["answer_key"] = answers.store(config, text, probe, resptext)
+    intents.compare("approval_choice" in response, id)
+
+    log.info("reply", task=id, stage="question", duration=time.perf_counter() - started, text=resptext, approved="approval_choice" in response, cached=bool(cached))
     return jsonify(response)
 
-# Создание или получение assistant для tenant
+# Создание или получение assistant для tenant (реестр в MySQL, см. logic/assistants.py)
+@stage("assistant")
 async def get_or_create_assistant(tenant_id, assistant_type, config, model, client):
-    from app import tenant_assistants, assistants_lock
-
-    async with assistants_lock:
-        if tenant_id not in tenant_assistants:
-            tenant_assistants[tenant_id] = {}
-
-        if assistant_type not in tenant_assistants[tenant_id]:
-            if assistant_type == "main":
-                instructions = f"ВНИМАНИЕ! ВСЕ ОТВЕТЫ ТОЛЬКО НА РУССКОМ. Ты — сотрудник техподдержки. Отвечай вежливо и кратко.\n\n[ИНСТРУКЦИЯ]\n{config['template']}"
-                name = f"Support Bot - {tenant_id}"
-            else:  # integrations
-                from logic.serv import template
-                template_text = template("logic/integrations_template.txt")
-                instructions = f"ВНИМАНИЕ! ВСЕ ОТВЕТЫ ТОЛЬКО НА РУССКОМ. Ты — сотрудник техподдержки. Отвечай вежливо и кратко.\n\n[ИНСТРУКЦИЯ]\n{template_text}"
-                name = f"Integrations Bot - {tenant_id}"
-
-            assistant = await client.beta.assistants.create(
-                name=name,
-                instructions=instructions,
-                model=model
-            )
-            tenant_assistants[tenant_id][assistant_type] = assistant.id
-            print(f"Created {assistant_type} assistant for {tenant_id}: {assistant.id}")
-
-        return tenant_assistants[tenant_id][assistant_type]
+    return await get_assistant(tenant_id, assistant_type, config, model, client)
 
 # Обработка вопроса
-async def question(id, text, sessions, config, model, client, tenant_id, retry=0, max_retries=2):
+@stage("question")
+async def question(id, text, sessions, config, model, client, tenant_id, max_retries=2, run_model=None):
     try:
         thread_id = await create_or_get_thread(sessions, id, client)
         assistant_id = await get_or_create_assistant(tenant_id, "main", config, model, client)
 
-        # Проверяем активные runs и ждем их завершения
-        runs = await client.beta.threads.runs.list(thread_id=thread_id, limit=1)
-        if runs.data and runs.data[0].status in ["queued", "in_progress"]:
-            print(f"Waiting for active run {runs.data[0].id} to complete...")
-            active_run = runs.data[0]
-            while active_run.status in ["queued", "in_progress"]:
-                await asyncio.sleep(0.3)
-                active_run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=active_run.id)
-
-        # Добавляем сообщение пользователя
-        await client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=text
-        )
-
-        # Запускаем assistant
-        run = await client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
-            temperature=config["config"]["temperature"]
-        )
-
-        # Ждем завершения
-        while run.status in ["queued", "in_progress"]:
-            await asyncio.sleep(0.3)
-            run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-
-        if run.status == "completed":
-            messages = await client.beta.threads.messages.list(thread_id=thread_id)
-            resptext = messages.data[0].content[0].text.value.strip()
-
-            # Проверка доли английских символов
-            eng_ratio = sum(c.isascii() and c.isalpha() for c in resptext) / max(1, len(resptext))
-            if eng_ratio > 0.5 and retry < max_retries:
-                print(f"Ответ слишком на английском, повторяем запрос {retry+1}/{max_retries}")
-                print("Ответ:", resptext)
-                return await question(id, text, sessions, config, model, client, tenant_id, retry + 1, max_retries)
-
-            return resptext
-        else:
-            print(f"Run failed: {run.status}")
-            return ""
-
+        # В контексте run только последние сообщения thread и сводка более ранних
+        # Разделы шаблона по теме вопроса (поиск по шаблону) добавляются к инструкциям только этого run
+        session = sessions[id]
+        found = ""
+        if retrieval.top_k(config):
+            found = await retrieval.relevant(config, retrieval.query_text(get_history(session), text), client, id)
+        track("question", session, instructions("main", config) + found, [*bounded(session), {"role": "user", "content": text}])
+        extra = "\n\n".join(part for part in [found, *(m["content"] for m in summary_message(session))] if part)
+        resptext = await ask_assistant(id, text, session, thread_id, assistant_id, config, model, client, extra, run_model, max_retries)
+        remember(session, text, resptext)
+        schedule_summary(session, client, id)
+        return resptext
+
+    except resilience.Unavailable:
+        raise
     except Exception as e:
-        print("openai error:", e)
+        log.error("openai error", task=id, stage="question", error=e)
         return ""
@@ -0,0 +1,65 @@
+import json
+from decimal import Decimal
+from quart.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+# JSON вебхуков, ответов Pyrus (задачи с длинной историей, каталоги, реестры) и ответов бота.
+# orjson, если установлен, иначе стандартный json. loads принимает bytes без .decode();
+# dumps — компактно, без \u-экранирования кириллицы, ключи не сортируются.
+# Ошибки разбора — json.JSONDecodeError (orjson.JSONDecodeError — его подкласс), то есть ValueError.
+BACKEND = "orjson" if orjson else "json"
+
+
+def _default(obj):
+    """Типы, которых нет в JSON: Decimal из MySQL, Markup"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson:
+    OPTIONS = orjson.OPT_NON_STR_KEYS  # числовые ключи — строками, как в json
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumpb(obj):
+        return orjson.dumps(obj, default=_default, option=OPTIONS)
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=OPTIONS).decode()
+else:
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj):
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+    def dumpb(obj):
+        return dumps(obj).encode()
+
+
+async def read_json(response):
+    """Тело ответа aiohttp без промежуточной строки (вместо response.json())"""
+    return loads(await response.read())
+
+
+class Provider(DefaultJSONProvider):
+    """jsonify и request.get_json в Quart через этот модуль: app.json = Provider(app)"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)  # indent и sort_keys Quart не нужны для ответов Pyrus
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        # тело сразу в bytes, без промежуточной строки
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumpb(obj), mimetype=self.mimetype)
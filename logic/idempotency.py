@@ -0,0 +1,75 @@
+import asyncio, os, time
+from collections import OrderedDict
+from quart import Response, make_response
+from logic.metrics import inc, set_outcome, current_tenant, current_outcome
+from logic import log
+
+# Pyrus повторяет вебхук, если бот не ответил вовремя, а ответ ждёт модель — повтор приходит, пока первый
+# ещё обрабатывается. Ключ (организация, задача, последний комментарий): повтор во время обработки ждёт
+# задачу первого и получает тот же ответ, повтор после — сохранённый ответ. Ответ не 200 (отложенный
+# при перегрузке, ошибка) не сохраняется, следующий повтор обрабатывается заново.
+# Обработка идёт в отдельной задаче: Pyrus, не дождавшись ответа, обрывает соединение, Quart отменяет
+# задачу запроса — но не вызов модели, и повтор получает его результат.
+# Кэш в памяти воркера: повтор, попавший в другой воркер, обработается отдельно.
+TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", "600"))  # секунд
+
+_entries = OrderedDict()  # {ключ: (истекает, задача с ((тело, статус, заголовки), итог))}
+
+
+def _expire(now):
+    # TTL общий, поэтому записи истекают в порядке добавления
+    while _entries and next(iter(_entries.values()))[0] <= now:
+        _entries.popitem(last=False)
+
+async def _freeze(result):
+    response = await make_response(result)
+    return await response.get_data(), response.status_code, dict(response.headers)
+
+def _thaw(frozen):
+    data, status, headers = frozen
+    return Response(data, status, headers)
+
+
+async def _run(key, handler):
+    """Обработка в отдельной задаче; итог (metrics.current_outcome) возвращается вызвавшему запросу"""
+    try:
+        frozen = await _freeze(await handler())
+    except BaseException:
+        _drop(key)
+        raise
+    if frozen[1] != 200:
+        _drop(key)
+    return frozen, current_outcome.get()
+
+def _drop(key):
+    entry = _entries.get(key)
+    if entry and entry[1] is asyncio.current_task():
+        del _entries[key]
+
+def _retrieve(task):
+    # исключение получают ожидающие; если все отменены — без предупреждения asyncio
+    if not task.cancelled():
+        task.exception()
+
+
+async def once(key, handler):
+    """Ответ на вебхук с ключом key; handler() вызывается один раз на ключ в пределах TTL"""
+    now = time.monotonic()
+    _expire(now)
+    entry = _entries.get(key)
+    if entry:
+        task = entry[1]
+        state = "completed" if task.done() else "inflight"
+        inc("barry_webhook_duplicates_total", state, current_tenant.get())
+        set_outcome("duplicate")
+        log.info("duplicate webhook", task=key[1], comment=key[2], state=state)
+        # shield: отмена повтора (клиент Pyrus оборвал соединение) не отменяет обработку
+        frozen, _ = await asyncio.shield(task)
+        return _thaw(frozen)
+
+    task = asyncio.ensure_future(_run(key, handler))
+    task.add_done_callback(_retrieve)
+    _entries[key] = (now + TTL, task)
+    frozen, outcome = await asyncio.shield(task)
+    set_outcome(outcome)
+    return _thaw(frozen)
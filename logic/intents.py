@@ -0,0 +1,170 @@
+"""Локальный классификатор коротких сообщений: thanks / greeting / handoff / other.
+
+Символьные n-граммы и слова + линейная модель (softmax-регрессия), обучается за доли секунды
+на logic/intents.txt и дополнительных размеченных файлах (INTENTS_DATA, через запятую).
+Режим организации (tenants.intents): off, shadow — только метрики согласия с моделью, on — сообщение
+обрабатывается без запуска модели. Порог уверенности — tenants.intent_threshold.
+
+    python -m logic.intents eval extra.tsv           # точность на размеченном файле (intent<TAB>text)
+    python -m logic.intents extract captures/ > new.tsv  # короткие сообщения клиентов из записанных вебхуков для разметки
+"""
+import contextvars, math, os, random, re, sys
+from logic.metrics import inc, current_tenant
+from logic import log
+
+INTENTS = ("thanks", "greeting", "handoff", "other")
+MODES = ("off", "shadow", "on")
+DEFAULT_THRESHOLD = 0.9
+MAX_CHARS = 60  # длинные сообщения — всегда other
+DATA = [os.path.join(os.path.dirname(__file__), "intents.txt")] + [p for p in os.getenv("INTENTS_DATA", "").split(",") if p]
+EPOCHS, RATE, L2 = 12, 0.3, 1e-4
+
+GREETING_REPLY = "Здравствуйте! Подскажите, пожалуйста, название заведения, адрес и с какой проблемой вы столкнулись."
+HANDOFF_REPLY = "..Соединяю вас с сотрудником техподдержки"
+
+# предсказание текущего вебхука в режиме shadow — сверяется с итогом в prep
+shadow = contextvars.ContextVar("intent_shadow", default=None)
+
+_weights = None  # {признак: [вес по классам]}
+REPEATS = re.compile(r"(.)\1{2,}")
+NOISE = re.compile(r"[\s.,!?;:()\"'«»\-]+")
+
+
+def normalize(text):
+    text = REPEATS.sub(r"\1", text.lower().replace("ё", "е"))
+    return NOISE.sub(" ", text).strip()
+
+def features(text):
+    text = normalize(text)
+    padded = f"^{text}$"
+    words = text.split()
+    feats = [f"w:{w}" for w in words]
+    feats += [padded[i:i + n] for n in (2, 3, 4) for i in range(len(padded) - n + 1)]
+    feats.append(f"len:{min(len(words), 5)}")
+    feats.append("bias")
+    return feats
+
+
+def load(paths=DATA):
+    examples = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                intent, _, text = line.rstrip("\n").partition("\t")
+                if intent in INTENTS and text:
+                    examples.append((features(text), INTENTS.index(intent)))
+    return examples
+
+def _softmax(scores):
+    top = max(scores)
+    exps = [math.exp(s - top) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+def _scores(weights, feats):
+    scores = [0.0] * len(INTENTS)
+    for feat in feats:
+        row = weights.get(feat)
+        if row:
+            for i, w in enumerate(row):
+                scores[i] += w
+    return scores
+
+def train(examples, epochs=EPOCHS, seed=0):
+    """SGD по логистической функции потерь; веса только у встреченных признаков"""
+    weights = {}
+    rng = random.Random(seed)
+    examples = list(examples)
+    for epoch in range(epochs):
+        rng.shuffle(examples)
+        rate = RATE / (1 + epoch * 0.1)
+        for feats, label in examples:
+            probs = _softmax(_scores(weights, feats))
+            for feat in feats:
+                row = weights.setdefault(feat, [0.0] * len(INTENTS))
+                for i, p in enumerate(probs):
+                    row[i] -= rate * (p - (i == label) + L2 * row[i])
+    return weights
+
+
+async def warm():
+    """Обучение при старте в отдельном потоке, чтобы первый вебхук не ждал"""
+    from logic.atts import run_blocking
+    try:
+        await run_blocking(get_model)
+    except Exception as e:
+        log.error("intent model training error", error=e)
+
+def get_model():
+    global _weights
+    if _weights is None:
+        _weights = train(load())
+        log.info("intent model trained", features=len(_weights))
+    return _weights
+
+def classify(text):
+    """(intent, уверенность)"""
+    if len(text) > MAX_CHARS:
+        return "other", 1.0
+    probs = _softmax(_scores(get_model(), features(text)))
+    best = max(range(len(INTENTS)), key=probs.__getitem__)
+    return INTENTS[best], probs[best]
+
+
+def mode(config):
+    return config["tenant"].get("intents") or "off"
+
+def decide(config, text, first_turn):
+    """Интент для обработки без модели или None. В режиме shadow — всегда None, предсказание запоминается"""
+    shadow.set(None)
+    tenant_mode = mode(config)
+    if tenant_mode == "off":
+        return None
+    intent, confidence = classify(text)
+    threshold = config["tenant"].get("intent_threshold") or DEFAULT_THRESHOLD
+    # приветствие отвечается шаблоном только в начале диалога, дальше его обрабатывает модель
+    if intent == "other" or confidence < threshold or (intent == "greeting" and not first_turn):
+        inc("barry_intent_total", intent, tenant_mode, "skipped", current_tenant.get())
+        return None
+    if tenant_mode == "shadow":
+        shadow.set((intent, confidence, text))
+        return None
+    inc("barry_intent_total", intent, tenant_mode, "applied", current_tenant.get())
+    return intent
+
+def compare(approved, task_id=None):
+    """Shadow: совпал ли итог модели (передача сотруднику или нет) с предсказанным интентом"""
+    predicted = shadow.get()
+    if predicted is None:
+        return
+    intent, confidence, text = predicted
+    agree = approved == (intent in ("thanks", "handoff"))
+    inc("barry_intent_total", intent, "shadow", "agree" if agree else "disagree", current_tenant.get())
+    if not agree:
+        log.info("intent shadow disagreement", task=task_id, intent=intent, confidence=round(confidence, 3), approved=approved, text=text)
+
+
+def _extract(paths):
+    """Короткие сообщения клиентов из записей вебхуков (logic/capture.py) с текущим предсказанием"""
+    from logic.capture import read, capture_files
+    seen = set()
+    for record in read(capture_files(paths)):
+        comments = record.get("payload", {}).get("task", {}).get("comments") or []
+        comment = comments[-1] if comments else {}
+        text = (comment.get("text") or "").strip()
+        if not text or "\n" in text or len(text) > MAX_CHARS or comment.get("author", {}).get("position"):
+            continue
+        if normalize(text) not in seen:
+            seen.add(normalize(text))
+            print(f"{classify(text)[0]}\t{text}")
+
+def _eval(paths):
+    weights = get_model()
+    examples = load(paths)
+    correct = sum(max(range(len(INTENTS)), key=_scores(weights, feats).__getitem__) == label for feats, label in examples)
+    print(f"{correct}/{len(examples)} = {correct / max(1, len(examples)):.3f}")
+
+
+if __name__ == "__main__":
+    command, paths = sys.argv[1], sys.argv[2:]
+    {"eval": _eval, "extract": _extract}[command](paths)
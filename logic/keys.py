@@ -0,0 +1,150 @@
+import hashlib, re, time
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from logic.cache import get_mysql_connection
+from logic.atts import run_blocking
+from logic.metrics import inc
+from logic import log
+
+# Пул ключей OpenAI (таблица api_keys). Лимиты OpenAI считаются на организацию/проект, поэтому ключи
+# разных проектов складывают пропускную способность. По заголовкам x-ratelimit-* каждого ответа известен
+# остаток запросов и токенов ключа; вызовы идут на ключ с наибольшим запасом, ключ с 429 выводится
+# из ротации до сброса лимита. Организацию можно закрепить за группой ключей (tenants.key_group).
+# Threads и assistant'ы существуют только в проекте, где созданы: для движка assistants организация
+# всегда работает через один ключ группы (выбирается хэшем), остальные вызовы распределяются.
+DEFAULT_GROUP = "default"
+COOLDOWN = 20.0  # секунд, если в ответе 429 нет времени сброса
+DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+_keys = {}  # {id: Key}
+
+
+def parse_duration(value):
+    """'6m0s', '1.5s', '20ms' -> секунды"""
+    return sum(float(number) * UNITS[unit] for number, unit in DURATION.findall(value or ""))
+
+def mask(secret):
+    return f"{secret[:7]}…{secret[-4:]}" if secret and len(secret) > 12 else "…"
+
+
+class Key:
+    def __init__(self, id, secret, group):
+        self.id, self.secret, self.group = id, secret, group
+        self.enabled = True
+        self.limits = {"requests": None, "tokens": None}
+        self.remaining = {"requests": None, "tokens": None}
+        self.cooldown_until = 0.0
+        self.requests = self.throttled = 0
+        # повторы и дедлайны — в logic/resilience.py, не в SDK
+        self.client = AsyncOpenAI(api_key=secret, max_retries=0,
+                                  http_client=DefaultAsyncHttpxClient(event_hooks={"response": [self._on_response]}))
+
+    async def _on_response(self, response):
+        headers = response.headers
+        self.requests += 1
+        for kind in ("requests", "tokens"):
+            if f"x-ratelimit-remaining-{kind}" in headers:
+                self.remaining[kind] = int(headers[f"x-ratelimit-remaining-{kind}"])
+                self.limits[kind] = int(headers.get(f"x-ratelimit-limit-{kind}") or 0) or None
+        if response.status_code == 429:
+            self.throttled += 1
+            wait = max(parse_duration(headers.get("x-ratelimit-reset-requests")),
+                       parse_duration(headers.get("x-ratelimit-reset-tokens")),
+                       float(headers.get("retry-after") or 0)) or COOLDOWN
+            self.cooldown_until = time.monotonic() + wait
+            inc("barry_openai_key_requests_total", self.id, "throttled")
+            log.warning("openai key throttled", key=self.id, group=self.group, wait=round(wait, 1))
+        else:
+            inc("barry_openai_key_requests_total", self.id, "ok" if response.status_code < 400 else "error")
+
+    def headroom(self):
+        """Доля оставшегося лимита (по худшему из запросов и токенов); 1.0, пока заголовков не было"""
+        shares = [self.remaining[k] / self.limits[k] for k in self.limits if self.limits[k] and self.remaining[k] is not None]
+        return min(shares) if shares else 1.0
+
+    def reserve(self):
+        # до следующего ответа с заголовками считаем запрос уже потраченным — параллельные вызовы расходятся по ключам
+        if self.remaining["requests"]:
+            self.remaining["requests"] -= 1
+
+    def cooling(self, now=None):
+        return self.cooldown_until > (now or time.monotonic())
+
+    def snapshot(self):
+        return {
+            "id": self.id, "key": mask(self.secret), "group": self.group, "enabled": self.enabled,
+            "requests": self.requests, "throttled": self.throttled,
+            "remaining_requests": self.remaining["requests"], "limit_requests": self.limits["requests"],
+            "remaining_tokens": self.remaining["tokens"], "limit_tokens": self.limits["tokens"],
+            "headroom": round(self.headroom(), 3),
+            "cooldown": max(0.0, round(self.cooldown_until - time.monotonic(), 1)),
+        }
+
+
+def load_keys():
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, openai_api_key, key_group, enabled FROM api_keys WHERE openai_api_key IS NOT NULL AND openai_api_key != ''")
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def sync(rows):
+    """Обновляет пул по строкам api_keys; счётчики и состояние лимитов уцелевших ключей сохраняются.
+    Возвращает True, если состав пула изменился"""
+    before = {id: (k.secret, k.group, k.enabled) for id, k in _keys.items()}
+    for id, secret, group, enabled in rows:
+        key = _keys.get(id)
+        if key is None or key.secret != secret:
+            key = _keys[id] = Key(id, secret, group or DEFAULT_GROUP)
+        key.group, key.enabled = group or DEFAULT_GROUP, bool(enabled)
+    for id in set(_keys) - {row[0] for row in rows}:
+        del _keys[id]
+    return before != {id: (k.secret, k.group, k.enabled) for id, k in _keys.items()}
+
+async def refresh():
+    """При старте и из шедулера вместе с проверкой версий конфигурации"""
+    try:
+        if sync(await run_blocking(load_keys)):
+            log.info("openai keys loaded", count=len(_keys), groups=sorted({k.group for k in _keys.values()}))
+    except Exception as e:
+        log.error("openai keys load error", error=e)
+
+
+def _group(group):
+    keys = [k for k in _keys.values() if k.enabled and k.group == group]
+    if not keys and group != DEFAULT_GROUP:
+        return _group(DEFAULT_GROUP)
+    if not keys:
+        keys = [k for k in _keys.values() if k.enabled]
+    if not keys:
+        raise RuntimeError("no OpenAI API keys configured")
+    return keys
+
+def pick(group=DEFAULT_GROUP):
+    """Ключ группы с наибольшим запасом лимита; если все на паузе после 429 — тот, что освободится первым"""
+    keys = _group(group)
+    now = time.monotonic()
+    ready = [k for k in keys if not k.cooling(now)]
+    key = max(ready, key=Key.headroom) if ready else min(keys, key=lambda k: k.cooldown_until)
+    key.reserve()
+    return key
+
+def pinned(tenant_id, group=DEFAULT_GROUP):
+    """Постоянный ключ организации в группе (rendezvous-хэш: при добавлении ключа переезжает мало организаций)"""
+    keys = _group(group)
+    return max(keys, key=lambda k: hashlib.sha1(f"{tenant_id}:{k.id}".encode()).hexdigest())
+
+def client(config, stateless=False):
+    """Клиент OpenAI для организации. stateless — вызов без threads/assistants (completions, эмбеддинги, аудио)"""
+    group = config["tenant"].get("key_group") or DEFAULT_GROUP
+    if config["tenant"].get("engine") == "assistants" and not stateless:
+        return pinned(config["tenant"]["tenant_id"], group).client
+    return pick(group).client
+
+def key_id(client):
+    """Номер ключа пула по его клиенту (метка предохранителя в logic/resilience.py)"""
+    return next((key.id for key in _keys.values() if key.client is client), "-")
+
+def snapshot():
+    return [key.snapshot() for key in sorted(_keys.values(), key=lambda k: k.id)]
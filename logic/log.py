@@ -0,0 +1,93 @@
+import logging, logging.handlers, queue, os, sys, random, atexit
+from datetime import datetime
+from logic.metrics import current_tenant
+
+# Неблокирующее логирование: запись кладётся в очередь, в stdout пишет отдельный поток.
+# Если stdout тормозит и очередь заполнилась — записи отбрасываются, а не держат event loop.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_FIELD = int(os.getenv("LOG_MAX_FIELD", "300"))  # длинные значения обрезаются
+
+# Доля записей, которые попадают в лог, по уровням (LOG_SAMPLE_DEBUG=0.1 и т.д.)
+SAMPLING = {
+    logging.DEBUG: float(os.getenv("LOG_SAMPLE_DEBUG", "1")),
+    logging.INFO: float(os.getenv("LOG_SAMPLE_INFO", "1")),
+}
+
+dropped = 0
+
+
+def truncate(value, limit=None):
+    limit = limit or LOG_MAX_FIELD
+    text = value if isinstance(value, str) else str(value)
+    return text if len(text) <= limit else f"{text[:limit]}…(+{len(text) - limit})"
+
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record):
+        rate = SAMPLING.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        global dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped += 1
+
+
+class StructuredFormatter(logging.Formatter):
+    """2025-06-01T12:00:00 INFO message tenant=x task=1 stage=question duration=0.52"""
+
+    def format(self, record):
+        fields = getattr(record, "fields", None) or {}
+        parts = [datetime.fromtimestamp(record.created).isoformat(timespec="seconds"), record.levelname, record.getMessage()]
+        parts.extend(f"{k}={_quote(v)}" for k, v in fields.items() if v is not None and v != "")
+        line = " ".join(parts)
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+def _quote(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    text = truncate(value).replace("\n", "\\n")
+    return f'"{text}"' if " " in text or not text else text
+
+
+logger = logging.getLogger("barry")
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+
+_queue = queue.Queue(LOG_QUEUE_SIZE)
+_handler = DroppingQueueHandler(_queue)
+_handler.addFilter(SamplingFilter())
+logger.addHandler(_handler)
+
+_stream = logging.StreamHandler(sys.stdout)
+_stream.setFormatter(StructuredFormatter())
+_listener = logging.handlers.QueueListener(_queue, _stream)
+_listener.start()
+atexit.register(_listener.stop)
+
+
+def log(level, message, **fields):
+    if not logger.isEnabledFor(level):
+        return
+    if "tenant" not in fields:
+        fields["tenant"] = current_tenant.get()
+    logger.log(level, message, extra={"fields": fields})
+
+def debug(message, **fields):
+    log(logging.DEBUG, message, **fields)
+
+def info(message, **fields):
+    log(logging.INFO, message, **fields)
+
+def warning(message, **fields):
+    log(logging.WARNING, message, **fields)
+
+def error(message, **fields):
+    log(logging.ERROR, message, **fields)
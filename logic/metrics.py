@@ -0,0 +1,117 @@
+import bisect, contextvars, time
+from functools import wraps
+
+# Границы бакетов гистограмм (секунды)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+# Описание метрик: имя -> (тип, имена меток, описание[, бакеты])
+METRICS = {
+    "barry_stage_seconds": ("histogram", ("stage", "tenant"), "Время этапов обработки вебхука"),
+    "barry_webhook_seconds": ("histogram", ("tenant", "outcome"), "Полное время обработки вебхука"),
+    "barry_webhooks_total": ("counter", ("tenant", "outcome"), "Количество обработанных вебхуков"),
+    "barry_prompt_tokens_total": ("counter", ("kind", "tenant", "cache"),
+                                  "Входные токены OpenAI: cache=hit — из кэша промптов, miss — без кэша"),
+    "barry_context_tokens": ("histogram", ("stage", "context", "tenant"),
+                             "Оценка токенов контекста за ход: full — вся история, sent — отправлено", TOKEN_BUCKETS),
+    "barry_answer_cache_total": ("counter", ("result", "tenant"), "Поиск в кэше ответов: hit, miss, error"),
+    "barry_intent_total": ("counter", ("intent", "mode", "result", "tenant"),
+                           "Локальный классификатор: applied — обработано без модели, skipped — ниже порога, shadow agree/disagree"),
+    "barry_route_total": ("counter", ("route", "reason", "tenant"), "Выбор модели: fast — быстрая, strong — модель организации"),
+    "barry_route_escalations_total": ("counter", ("reason", "tenant"), "Повторы на модели организации после ответа быстрой модели"),
+    "barry_route_seconds": ("histogram", ("route", "tenant"), "Время ответа модели по маршруту"),
+    "barry_openai_key_requests_total": ("counter", ("key", "result"), "Ответы OpenAI по ключам пула: ok, error, throttled (429)"),
+    "barry_openai_retries_total": ("counter", ("error", "tenant"), "Повторы вызовов OpenAI после сбоя"),
+    "barry_openai_unavailable_total": ("counter", ("reason", "tenant"),
+                                       "Вызовы OpenAI без результата: breaker — предохранитель открыт, deadline, retries"),
+    "barry_openai_breaker_total": ("counter", ("model",), "Срабатывания предохранителя вызовов OpenAI"),
+    "barry_admission_queue_depth": ("gauge", ("tenant",), "Ожидающие слота для вызова модели"),
+    "barry_admission_running": ("gauge", ("tenant",), "Занятые организацией слоты вызова модели"),
+    "barry_admission_wait_seconds": ("histogram", ("kind", "tenant"), "Ожидание слота: question, inf, flds"),
+    "barry_admission_rejected_total": ("counter", ("kind", "reason", "tenant"),
+                                       "Отказы в допуске: queue — очередь полна, rate — лимит в минуту, wait — долгое ожидание"),
+    "barry_webhook_duplicates_total": ("counter", ("state", "tenant"),
+                                       "Повторы вебхука того же комментария: inflight — во время обработки, completed — после"),
+    "barry_answer_cache_seconds": ("histogram", ("result", "tenant"), "Время поиска в кэше ответов (с эмбеддингом)"),
+}
+
+# Организация и итог текущего вебхука (видны во всех await внутри запроса)
+current_tenant = contextvars.ContextVar("current_tenant", default="")
+current_outcome = contextvars.ContextVar("current_outcome", default="skipped")
+
+# {имя: {метки: [счётчики бакетов..., +Inf, сумма]}} и {имя: {метки: значение}}
+_histograms = {name: {} for name, (kind, *_) in METRICS.items() if kind == "histogram"}
+_counters = {name: {} for name, (kind, *_) in METRICS.items() if kind == "counter"}
+_gauges = {name: {} for name, (kind, *_) in METRICS.items() if kind == "gauge"}
+_bounds = {name: spec[3] if len(spec) > 3 else BUCKETS for name, spec in METRICS.items()}
+
+
+def observe(name, value, *labels):
+    """Добавляет значение в гистограмму: O(log бакетов), без новых объектов после первого вызова"""
+    series = _histograms[name]
+    bounds = _bounds[name]
+    slot = series.get(labels)
+    if slot is None:
+        slot = series[labels] = [0] * (len(bounds) + 2)
+    slot[bisect.bisect_left(bounds, value)] += 1
+    slot[-1] += value
+
+def inc(name, *labels, amount=1):
+    series = _counters[name]
+    series[labels] = series.get(labels, 0) + amount
+
+def set_gauge(name, value, *labels):
+    _gauges[name][labels] = value
+
+
+def set_outcome(outcome):
+    current_outcome.set(outcome)
+
+def stage(name):
+    """Декоратор для async-функций: время этапа с меткой текущей организации"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                observe("barry_stage_seconds", time.perf_counter() - started, name, current_tenant.get())
+        return wrapper
+    return decorator
+
+def observe_stage(name, started):
+    """Для синхронных участков: observe_stage("sign", t0) после t0 = time.perf_counter()"""
+    observe("barry_stage_seconds", time.perf_counter() - started, name, current_tenant.get())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, le=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}"
+
+def render():
+    """Текстовый формат Prometheus"""
+    lines = []
+    for name, (kind, label_names, help_text, *_) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind in ("counter", "gauge"):
+            for labels, value in list((_counters if kind == "counter" else _gauges)[name].items()):
+                lines.append(f"{name}{_labels(label_names, labels)} {value}")
+            continue
+        bounds = _bounds[name]
+        for labels, slot in list(_histograms[name].items()):
+            cumulative = 0
+            for bound, count in zip(bounds, slot):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(label_names, labels, bound)} {cumulative}")
+            cumulative += slot[len(bounds)]
+            lines.append(f"{name}_bucket{_labels(label_names, labels, '+Inf')} {cumulative}")
+            lines.append(f"{name}_sum{_labels(label_names, labels)} {slot[-1]}")
+            lines.append(f"{name}_count{_labels(label_names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
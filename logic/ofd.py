@@ -1,7 +1,9 @@
 from quart import jsonify
 from logic.core import approve, is_approved
 from logic.cache import get_cache_config
-from logic.regform_updater import tasks_today
+from logic.stats import count_task
+from logic.metrics import set_outcome
+from logic import log
 
 question = {}
 positive_answers = {"да", "конечно", "ага", "угу", "разумеется", "согласен", "похож", "1"}
@@ -10,7 +12,7 @@ negative_answers = {"нет", "неа", "никак", "ни в коем случ
 async def check(task, id, sessions, answer, pyrus_key, tenant_id):
     try:
         if task["is_closed"] or await is_approved(id):
-            print("Closed"); return jsonify({})
+            log.info("task closed or approved", task=id, stage="ofd"); return jsonify({})
         config = get_cache_config(pyrus_key)
         
         # Получение типа канала
@@ -32,16 +34,16 @@ async def check(task, id, sessions, answer, pyrus_key, tenant_id):
         comment = task["comments"][-1]
         stop_words = [w.strip().lower() for w in config["config"]["stop_words"].split(",")]
         if any(word in str(task).lower() for word in stop_words):
-            print("restoit or thanks")
+            log.info("stop word, approving", task=id, stage="ofd")
             return await approve(sessions, id, config, pyrus_key, task, tenant_id)
         
         # Проверка, является ли автор комментария инженером
         if comment.get("author", {}).get("position"):
-            print("Engineer")
+            log.info("engineer replied, approving", task=id, stage="ofd")
 
             return await approve(sessions, id, config, pyrus_key, task, tenant_id)
 
-        if text := comment.get("text"): print(f"{channel}\n{text}")
+        if text := comment.get("text"): log.info("incoming message", task=id, channel=channel, text=text, stage="ofd")
 
         if attachs := task.get('attachments'):
             if (url := attachs[-1].get('url')):
@@ -54,6 +56,7 @@ async def check(task, id, sessions, answer, pyrus_key, tenant_id):
                 "channel": {"type": channel}
             }
             question[id] = True
+            set_outcome("answered")
             return jsonify(resp)
 
         lowtext = text.lower()
@@ -68,15 +71,18 @@ async def check(task, id, sessions, answer, pyrus_key, tenant_id):
                 }
 
                 answer[id] = True
-                tasks_today[tenant_id] = tasks_today.get(tenant_id, 0) + 1 
+                count_task(tenant_id)
+                set_outcome("approved")
                 return jsonify(resp)
             
             if lowtext in negative_answers:
                 resp = {"text": "Уточните название заведения и ваш вопрос", "channel": {"type": channel}}
                 answer[id] = True
+                set_outcome("answered")
                 return jsonify(resp)
             
+            set_outcome("answered")
             return jsonify({"text": "Ответьте да или нет", "channel": {"type": channel}})
         
-    except KeyError as e: print(f"KeyError: {e}")
+    except KeyError as e: log.error("missing key in task", task=id, stage="ofd", error=e)
     return jsonify({})
\ No newline at end of file
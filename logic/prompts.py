@@ -0,0 +1,33 @@
+# Промпты с постоянным префиксом: всё, что одинаково для организации (инструкции, шаблоны, списки),
+# идёт первым и собирается один раз на версию конфигурации, а меняющееся (вопрос, ключевое слово) — в конце.
+# Тогда кэш промптов OpenAI срабатывает на префиксе (от 1024 токенов) и первый токен приходит быстрее.
+MATCH_INSTRUCTION = (
+    "Твоя задача - проанализировать входящее значение и найти наиболее похожее в предоставленном списке. "
+    "Верни ТОЛЬКО числовой ID найденного элемента. "
+    "Если подходящих элементов нет или их несколько — верни '-'"
+)
+
+_memo = {}  # {(вид, организация): (версия, промпт)}
+
+
+def memoized(kind, config, build, version=None):
+    """Промпт из кэша, пока не изменилась версия конфигурации организации (или переданная версия)"""
+    key = (kind, config["tenant"]["tenant_id"])
+    version = (config["version"], version)
+    cached = _memo.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    prompt = build()
+    _memo[key] = (version, prompt)
+    return prompt
+
+
+def match_system(items_text):
+    return f"{MATCH_INSTRUCTION}\n\nСписок элементов:\n{items_text}"
+
+def match_messages(system, keyword):
+    """Список элементов — в системном сообщении (префикс), искомое значение — последним"""
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": f"Искомое значение: {keyword}"},
+    ]
@@ -1,47 +1,26 @@
-import aiohttp
+import aiohttp, os
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from zoneinfo import ZoneInfo
-from logic.cache import get_cache_config, clear_all_cache, get_mysql_connection
-from logic.atts import acs
-
-requests_today = {}
-tasks_today = {}
-
-async def dump_stats():
-    print("dump_stats started")
-    if not requests_today and not tasks_today:
-        return
-
-    conn = get_mysql_connection()
-    c = conn.cursor()
-    tenant_ids = set(requests_today) | set(tasks_today)
-
-    for tenant_id in tenant_ids:
-        request_count = requests_today.get(tenant_id, 0)
-        task_count = tasks_today.get(tenant_id, 0)
-        c.execute("""
-            INSERT INTO statistics (tenant_id, request_count, task_count)
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE 
-                request_count = request_count + VALUES(request_count),
-                task_count = task_count + VALUES(task_count)
-        """, (tenant_id, request_count, task_count))
-
-    conn.commit()
-    c.close()
-    conn.close()
-    requests_today.clear()
-    tasks_today.clear()
-
-async def reset_stats():
-    print("reset_stats started")
-    conn = get_mysql_connection()
-    c = conn.cursor()
-    c.execute("UPDATE statistics SET request_count = 0, task_count = 0")
-    conn.commit()
-    c.close()
-    conn.close()
+from logic.cache import get_cache_config, get_mysql_connection, bump_config_version, refresh_changed_configs
+from logic.atts import acs, run_blocking, PYRUS_API_URL
+from logic.stats import flush_stats, FLUSH_INTERVAL
+from logic.usage import flush_usage
+from logic.keys import refresh as refresh_keys
+from logic.fastjson import read_json
+from logic import log
+
+CONFIG_CHECK_INTERVAL = int(os.getenv("CONFIG_CHECK_INTERVAL", "5"))  # секунды
+
+async def check_config_versions():
+    try:
+        changed = await run_blocking(refresh_changed_configs)
+        if changed:
+            log.info("config reloaded", count=len(changed))
+    except Exception as e:
+        log.error("check_config_versions error", error=e)
+    await refresh_keys()
 
 
 def get_all_pyrus_keys():
@@ -54,15 +33,14 @@ def get_all_pyrus_keys():
     return keys
 
 async def form_register():
-    print("form_register started")
+    log.info("form_register started")
     keys = get_all_pyrus_keys()
     for pyrus_key in keys:
         config = get_cache_config(pyrus_key)
         if config["form_config"]["form_or_card"] == "card":
-            print("updating")
+            log.info("updating reg_form", tenant=config["tenant"]["tenant_id"])
             await update_reg_form(pyrus_key, config)
-    print("success")
-    clear_all_cache()
+    log.info("form_register finished")
 
 async def update_reg_form(pyrus_key, config):
     token = await acs(config, pyrus_key)
@@ -72,17 +50,17 @@ async def update_reg_form(pyrus_key, config):
         form_id = int(form_id)
         field_id = int(field_id)
     else:
-        print("missing key")
+        log.warning("reg_form: card_id or field_id missing", tenant=config["tenant"]["tenant_id"])
         return
 
-    url = f'https://api.pyrus.com/v4/forms/{form_id}/register'
+    url = f'{PYRUS_API_URL}/forms/{form_id}/register'
     params = {
         "include_archived": "y",
         "field_ids": str(field_id)
     }
     async with aiohttp.ClientSession() as session:
         async with session.get(url, headers={"Authorization": f"Bearer {token}"}, params=params) as resp:
-            data = await resp.json()
+            data = await read_json(resp)
 
     rows = []
     for task in data.get("tasks", []):
@@ -99,6 +77,7 @@ async def update_reg_form(pyrus_key, config):
         VALUES (%s, %s)
         ON DUPLICATE KEY UPDATE parsed_reg = VALUES(parsed_reg)
     """, (pyrus_key, list_str))
+    bump_config_version(c, pyrus_key)
     conn.commit()
     c.close()
     conn.close()
@@ -108,9 +87,9 @@ scheduler = AsyncIOScheduler()
 trigger = CronTrigger(hour=3, minute=0, timezone=ZoneInfo("Asia/Almaty"))
 scheduler.add_job(form_register, trigger)
 
-dump_trigger = CronTrigger(hour=23, minute=59, timezone=ZoneInfo("Asia/Almaty"))
-scheduler.add_job(dump_stats, dump_trigger)
+# Сброс накопленной статистики и расхода OpenAI в БД каждые FLUSH_INTERVAL секунд
+scheduler.add_job(flush_stats, IntervalTrigger(seconds=FLUSH_INTERVAL), max_instances=1, coalesce=True)
+scheduler.add_job(flush_usage, IntervalTrigger(seconds=FLUSH_INTERVAL), max_instances=1, coalesce=True)
 
-# 1-го числа каждого месяца в 00:00
-reset_trigger = CronTrigger(day=1, hour=0, minute=0, timezone=ZoneInfo("Asia/Almaty"))
-scheduler.add_job(reset_stats, reset_trigger)
\ No newline at end of file
+# Подхват изменений конфигурации, сделанных через другие воркеры
+scheduler.add_job(check_config_versions, IntervalTrigger(seconds=CONFIG_CHECK_INTERVAL), max_instances=1, coalesce=True)
@@ -0,0 +1,141 @@
+import asyncio, os, random, time
+import openai
+from logic.metrics import inc, current_tenant
+from logic.throttle import KeyedBuckets
+from logic import log
+
+# Обёртка вызовов OpenAI: дедлайн на каждый запрос, повторы с экспоненциальной задержкой и полным джиттером,
+# бюджет повторов на организацию (token bucket — при массовом сбое повторы не умножают нагрузку) и
+# предохранитель на пару ключ + модель: после BREAKER_FAILURES сбоев подряд вызовы сразу завершаются
+# Unavailable, через BREAKER_COOLDOWN секунд пропускается один пробный вызов.
+# Unavailable в диалоге — передача задачи сотруднику (logic/core.py), в остальных местах — как раньше пустой результат.
+# Повторы SDK отключены (logic/keys.py), повторяет только этот модуль.
+# Неидемпотентные POST с состоянием (сообщение в thread, создание run) вызываются с attempts=1: после
+# таймаута запрос мог уже выполниться, и повтор продублировал бы сообщение или упал на активном run.
+CALL_TIMEOUT = float(os.getenv("OPENAI_CALL_TIMEOUT", "30"))  # секунд на один запрос (потоковый — целиком)
+RUN_DEADLINE = float(os.getenv("OPENAI_RUN_DEADLINE", "90"))  # секунд на выполнение run, потом он отменяется
+ATTEMPTS = int(os.getenv("OPENAI_ATTEMPTS", "3"))
+BACKOFF, BACKOFF_MAX = 0.5, 8.0
+RETRY_BUDGET = float(os.getenv("OPENAI_RETRY_BUDGET", "10"))  # повторов в запасе у организации
+RETRY_RATE = float(os.getenv("OPENAI_RETRY_RATE", "0.2"))  # пополнение бюджета в секунду
+BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("OPENAI_BREAKER_COOLDOWN", "30"))
+POLL = 0.3  # опрос статуса run
+ACTIVE = ("queued", "in_progress", "cancelling")
+
+# сеть, таймауты, 429 и 5xx; остальные ответы API (400, 401, 404) повторять бесполезно
+RETRYABLE = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, asyncio.TimeoutError)
+
+_budget = KeyedBuckets(RETRY_BUDGET, RETRY_RATE)
+
+
+class Unavailable(Exception):
+    """OpenAI сейчас не ответит: предохранитель открыт, дедлайн или повторы исчерпаны"""
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Breaker:
+    __slots__ = ("failures", "opened_at", "probing")
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def state(self, now=None):
+        if self.opened_at is None:
+            return "closed"
+        return "open" if self.probing or (now or time.monotonic()) - self.opened_at < BREAKER_COOLDOWN else "half-open"
+
+    def allow(self, now):
+        state = self.state(now)
+        if state == "half-open":
+            self.probing = True  # один пробный вызов, остальные ждут его результата
+        return state != "open"
+
+    def success(self):
+        self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self, now):
+        """True — предохранитель только что открылся"""
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= BREAKER_FAILURES):
+            self.opened_at, self.probing = now, False
+            return True
+        return False
+
+    def release(self):
+        # пробный вызов отменён, не дождавшись ответа — следующий вызов снова пробный
+        self.probing = False
+
+
+_breakers = {}  # {(ключ, модель): Breaker}
+
+def breaker(client, model):
+    from logic.keys import key_id  # keys -> atts -> resilience
+    key = (key_id(client), model)
+    found = _breakers.get(key)
+    if found is None:
+        found = _breakers[key] = Breaker()
+    return found
+
+def unavailable(reason, model, **fields):
+    inc("barry_openai_unavailable_total", reason, current_tenant.get())
+    log.warning("openai unavailable", reason=reason, model=model, **fields)
+    return Unavailable(reason)
+
+async def call(client, model, request, timeout=CALL_TIMEOUT, attempts=ATTEMPTS, deadline=None):
+    """Вызов OpenAI с дедлайном и повторами. request — функция без аргументов, создающая корутину запроса
+    заново на каждую попытку. deadline — общий срок (time.monotonic()) для всех попыток"""
+    guard = breaker(client, model)
+    tenant = current_tenant.get()
+    for attempt in range(1, attempts + 1):
+        now = time.monotonic()
+        if not guard.allow(now):
+            raise unavailable("breaker", model)
+        left = min(timeout, deadline - now) if deadline else timeout
+        if left <= 0:
+            guard.release()
+            raise unavailable("deadline", model)
+        try:
+            result = await asyncio.wait_for(request(), left)
+        except RETRYABLE as e:
+            if guard.failure(time.monotonic()):
+                inc("barry_openai_breaker_total", model)
+                log.error("openai circuit opened", model=model, failures=guard.failures, error=e)
+            if attempt == attempts or not _budget.take(tenant):
+                raise unavailable("retries", model, attempts=attempt, error=e) from e
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF * 2 ** attempt))
+            if deadline and time.monotonic() + delay >= deadline:
+                raise unavailable("deadline", model, error=e) from e
+            inc("barry_openai_retries_total", type(e).__name__, tenant)
+            log.warning("openai call failed, retrying", model=model, attempt=f"{attempt}/{attempts}", delay=round(delay, 2), error=e)
+            await asyncio.sleep(delay)
+        except openai.APIStatusError:
+            guard.success()  # API ответил: ошибка в запросе, а не в доступности
+            raise
+        except BaseException:
+            guard.release()
+            raise
+        else:
+            guard.success()
+            return result
+
+
+async def wait_run(client, model, thread_id, run, deadline=None):
+    """Опрос run до завершения. По истечении RUN_DEADLINE run отменяется — повисший в queued run
+    не держит вебхук и не блокирует thread для следующих сообщений"""
+    deadline = deadline or time.monotonic() + RUN_DEADLINE
+    while run.status in ACTIVE:
+        if time.monotonic() >= deadline:
+            try:
+                await asyncio.wait_for(client.beta.threads.runs.cancel(run.id, thread_id=thread_id), CALL_TIMEOUT)
+            except Exception as e:
+                log.warning("run cancel error", run=run.id, error=e)
+            raise unavailable("deadline", model, run=run.id, status=run.status)
+        await asyncio.sleep(POLL)
+        run_id = run.id
+        run = await call(client, model, lambda: client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id))
+    return run
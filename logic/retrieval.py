@@ -0,0 +1,150 @@
+import hashlib, math, os, re
+from collections import Counter
+from logic.prompts import memoized
+from logic.usage import record as record_usage
+from logic import log, resilience
+
+# Поиск по шаблону организации вместо передачи всего шаблона в инструкции (tenants.retrieval_top_k > 0).
+# Шаблон делится на разделы по заголовкам и пустым строкам; общие правила (первый раздел
+# и нумерованные разделы «1.», «2.», …) передаются всегда и остаются в постоянном префиксе промпта,
+# остальные разделы — только top-K подходящих к сообщению клиента.
+# Индекс BM25 (и, если задана RETRIEVAL_EMBEDDINGS, эмбеддинги разделов) перестраивается только при изменении текста шаблона.
+EMBEDDINGS_MODEL = os.getenv("RETRIEVAL_EMBEDDINGS", "")  # например text-embedding-3-small; пусто — только BM25
+EMBEDDINGS_WEIGHT = float(os.getenv("RETRIEVAL_EMBEDDINGS_WEIGHT", "0.5"))  # доля косинусной близости в итоговой оценке
+STEM = 6  # грубый стемминг: окончание отбрасывается, основа обрезается до STEM символов («весами» и «весы» совпадают)
+K1, B = 1.5, 0.75
+
+RELEVANT_HEADER = "Разделы инструкции, относящиеся к вопросу клиента:"
+PINNED_NOTE = "Подробные разделы инструкции по теме вопроса передаются вместе с сообщением клиента."
+
+HEADING = re.compile(r"^(#+\s|\d+\.\s|\S.*:\s*$)")
+NUMBERED = re.compile(r"\d+\.\s")
+WORD = re.compile(r"\w+")
+ENDINGS = re.compile(r"(ами|ями|ого|его|ому|ему|ыми|ими|ах|ях|ов|ев|ой|ей|ом|ем|ам|ям|ую|юю|ая|яя|ое|ее|ые|ие|ый|ий|[аяоеыиуюь])$")
+STOP_WORDS = {"не", "на", "по", "за", "из", "от", "до", "ли", "же", "то", "или", "что", "как", "при", "для", "вы", "мы", "есть"}
+
+_indexes = {}  # {tenant_id: Index}
+
+
+def stem(word):
+    base = ENDINGS.sub("", word)
+    return (base if len(base) > 2 else word)[:STEM]
+
+def tokenize(text):
+    return [stem(w) for w in WORD.findall(text.lower().replace("ё", "е")) if len(w) > 1 and w not in STOP_WORDS]
+
+def split_sections(text):
+    """Разделы шаблона: [(заголовок, текст)]; заголовок — строка без отступа с «:» в конце, «N. » или «# »"""
+    sections, lines = [], []
+    for line in text.splitlines():
+        if not line.strip() or (HEADING.match(line) and lines):
+            if lines:
+                sections.append(lines)
+            lines = []
+        if line.strip():
+            lines.append(line)
+    if lines:
+        sections.append(lines)
+    return [(lines[0].strip(), "\n".join(lines)) for lines in sections]
+
+
+class Index:
+    def __init__(self, text):
+        self.digest = hashlib.sha1(text.encode()).hexdigest()
+        sections = split_sections(text)
+        # первый раздел и нумерованные разделы — общие правила
+        pinned = {i for i, (title, _) in enumerate(sections) if i == 0 or NUMBERED.match(title)}
+        self.pinned = [body for i, (_, body) in enumerate(sections) if i in pinned]
+        self.sections = [body for i, (_, body) in enumerate(sections) if i not in pinned]
+        # слова заголовка учитываются дважды
+        self.docs = [Counter(tokenize(body) + tokenize(body.split("\n", 1)[0])) for body in self.sections]
+        self.lengths = [sum(doc.values()) for doc in self.docs]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        df = Counter(term for doc in self.docs for term in doc)
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+        self.embeddings = None
+
+    def bm25(self, query):
+        terms = set(tokenize(query)) & self.idf.keys()
+        scores = []
+        for doc, length in zip(self.docs, self.lengths):
+            score = 0.0
+            for term in terms:
+                tf = doc.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / self.avg_length))
+            scores.append(score)
+        return scores
+
+    def top(self, scores, k):
+        ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:k]
+        # порядок разделов как в шаблоне
+        return [self.sections[i] for i in sorted(ranked) if scores[i] > 0]
+
+
+def top_k(config, assistant_type="main"):
+    """Сколько разделов подставлять; 0 — поиск выключен (шаблон целиком в инструкциях)"""
+    if assistant_type != "main" or not config.get("template"):
+        return 0
+    return config["tenant"].get("retrieval_top_k") or 0
+
+def get_index(config):
+    def build():
+        tenant_id = config["tenant"]["tenant_id"]
+        index = _indexes.get(tenant_id)
+        digest = hashlib.sha1(config["template"].encode()).hexdigest()
+        if index is None or index.digest != digest:
+            index = _indexes[tenant_id] = Index(config["template"])
+            log.info("retrieval index built", tenant=tenant_id, sections=len(index.sections), pinned=len(index.pinned))
+        return index
+    return memoized("retrieval", config, build)
+
+def pinned_text(config):
+    """Постоянная часть инструкции при включённом поиске"""
+    index = get_index(config)
+    return "\n".join(index.pinned + [PINNED_NOTE])
+
+def query_text(history, text):
+    """Запрос для поиска: сообщение клиента и его предыдущая реплика (короткие ответы вроде «USB» без неё не найти)"""
+    previous = next((m["content"] for m in reversed(history) if m["role"] == "user"), "")
+    return f"{previous}\n{text}" if previous else text
+
+
+async def _embed(client, texts):
+    resp = await resilience.call(client, EMBEDDINGS_MODEL, lambda: client.embeddings.create(model=EMBEDDINGS_MODEL, input=texts), attempts=1)
+    record_usage(EMBEDDINGS_MODEL, "embedding", resp.usage)
+    vectors = []
+    for item in resp.data:
+        norm = math.sqrt(sum(x * x for x in item.embedding)) or 1.0
+        vectors.append([x / norm for x in item.embedding])
+    return vectors
+
+async def _semantic(index, query, client):
+    if index.embeddings is None:
+        index.embeddings = await _embed(client, index.sections)
+    vector = (await _embed(client, [query]))[0]
+    return [sum(a * b for a, b in zip(vector, section)) for section in index.embeddings]
+
+
+async def relevant(config, query, client=None, task_id=None):
+    """Текст top-K разделов для подстановки в запрос; пустая строка, если подходящих нет"""
+    k = top_k(config)
+    index = get_index(config)
+    if not index.sections:
+        return ""
+
+    scores = index.bm25(query)
+    if EMBEDDINGS_MODEL and client is not None:
+        try:
+            semantic = await _semantic(index, query, client)
+            best = max(scores) or 1.0
+            scores = [(1 - EMBEDDINGS_WEIGHT) * s / best + EMBEDDINGS_WEIGHT * max(c, 0.0) for s, c in zip(scores, semantic)]
+        except Exception as e:
+            log.warning("retrieval embeddings error", task=task_id, stage="retrieval", error=e)
+
+    sections = index.top(scores, k)
+    log.debug("retrieval", task=task_id, stage="retrieval", sections=[s.split("\n", 1)[0] for s in sections])
+    if not sections:
+        return ""
+    return RELEVANT_HEADER + "\n" + "\n".join(sections)
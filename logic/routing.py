@@ -0,0 +1,72 @@
+import os, time
+from logic.context import get_history
+from logic.metrics import inc, observe, current_tenant
+
+# Выбор модели на каждое сообщение (tenants.fast_model). Короткие простые сообщения идут в быструю дешёвую модель,
+# а в модель организации — длинные, технические (ключевые слова), с вложениями, поздние ходы и всё после
+# неудачного ответа. После эскалации диалог до конца остаётся на модели организации.
+# Фото описывает VISION_MODEL; при включённой маршрутизации сначала быстрая модель, пустой ответ — повтор на VISION_MODEL.
+DEFAULT_MAX_CHARS = 150
+MAX_TURN = int(os.getenv("ROUTING_MAX_TURN", "4"))  # с какого хода клиента диалог считается сложным
+VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4o")
+
+KEYWORDS = (
+    "ошибк", "error", "код", "anydesk", "анидеск", "лиценз", "офд", "интеграц", "настро", "отчет",
+    "склад", "себестоим", "сервер", "обновлен", "терминал", "фискал", "смен", "базе", "база",
+)
+# признаки того, что предыдущий ответ не помог
+FAILURE = ("не помог", "не получ", "не выходит", "все равно", "опять", "снова", "не то", "не понял")
+
+
+def policy(config, model):
+    """Быстрая модель организации или None, если маршрутизация выключена"""
+    fast = config["tenant"].get("fast_model")
+    return fast if fast and fast != model else None
+
+def _reason(config, session, text, attachment):
+    """Почему сообщение нужно модели организации; None — хватит быстрой"""
+    if session.get("escalated"):
+        return "escalated"
+    if attachment:
+        return "attachment"
+    if len(text) > (config["tenant"].get("routing_max_chars") or DEFAULT_MAX_CHARS):
+        return "length"
+    lowered = text.lower().replace("ё", "е")
+    keywords = KEYWORDS + tuple(w.strip().lower() for w in (config["tenant"].get("routing_keywords") or "").split(",") if w.strip())
+    if any(word in lowered for word in keywords):
+        return "keyword"
+    turn = len(get_history(session)) // 2 + 1
+    if turn > 1 and any(word in lowered for word in FAILURE):
+        return "failure"
+    if turn >= MAX_TURN:
+        return "turn"
+    return None
+
+
+def choose(config, model, session, text, attachment=False):
+    """(модель, маршрут, причина) для сообщения"""
+    fast = policy(config, model)
+    if not fast:
+        return model, "default", "off"
+    reason = _reason(config, session, text, attachment)
+    if reason == "failure":
+        escalate(session, reason)
+    route = ("strong", reason) if reason else ("fast", "simple")
+    inc("barry_route_total", *route, current_tenant.get())
+    return (model if reason else fast), *route
+
+def escalate(session, reason):
+    """Ответ быстрой модели не подошёл: повтор и остаток диалога — на модели организации"""
+    if session is not None:
+        session["escalated"] = reason
+    inc("barry_route_escalations_total", reason, current_tenant.get())
+
+def observe_route(route, started):
+    observe("barry_route_seconds", time.perf_counter() - started, route, current_tenant.get())
+
+
+def vision_model(config):
+    fast = policy(config, VISION_MODEL)
+    if fast:
+        inc("barry_route_total", "fast", "vision", current_tenant.get())
+    return fast or VISION_MODEL
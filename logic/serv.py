@@ -1,7 +1,12 @@
 import re, aiohttp
-from openai import AsyncOpenAI
-from logic.atts import acs
+from logic.atts import acs, PYRUS_API_URL
 from logic.cache import get_cache_config
+from logic.metrics import stage
+from logic.context import bounded, track
+from logic.prompts import match_messages, match_system, memoized
+from logic.usage import record as record_usage
+from logic.fastjson import read_json
+from logic import admission, log, keys, resilience
 
 def normalize_phone(phone):
     phone = phone.strip()
@@ -15,69 +20,62 @@ def template(file_path):
         return file.read().strip()
 
 
-# Поиск заведения по названию
-async def match(keyword, config, token, session, api_key):
-    data = await catalog(config, token, session)
-    name_col = int(config["form"]["name_column"]) - 1
-    filter_col = config["form"].get("filter_column")
-    filter_words_raw = config["form"].get("filter_words", "").strip()
+# Строки справочника с непустым названием (и нужным значением в колонке фильтра)
+def filter_rows(items, form):
+    name_col = int(form["name_column"]) - 1
+    filter_col = form.get("filter_column")
+    filter_words_raw = (form.get("filter_words") or "").strip()
 
     if filter_col and filter_words_raw:
         filter_col = int(filter_col) - 1
         filter_words = [w.strip() for w in filter_words_raw.split(",")]
-        rows = [
+        return [
             {"id": item["item_id"], "name": item["values"][name_col]}
-            for item in data["items"]
+            for item in items
             if item["values"][name_col].strip() and item["values"][filter_col] in filter_words
         ]
-    else:
-        rows = [
-            {"id": item["item_id"], "name": item["values"][name_col]}
-            for item in data["items"]
-            if item["values"][name_col].strip()
-        ]
-
-    template = [
-        {"role": "system", "content": "Твоя задача - проанализировать входящее значение и найти наиболее похожее в предоставленном списке. Верни ТОЛЬКО числовой ID найденного элемента. Если подходящих элементов нет или их несколько — верни '-'"},
-        {"role": "user", "content": f"Искомое значение: {keyword}\n\nСписок элементов:\n" + "\n".join([f"{item['id']}: {item['name']}" for item in rows])}
+    return [
+        {"id": item["item_id"], "name": item["values"][name_col]}
+        for item in items
+        if item["values"][name_col].strip()
     ]
-    return await openai_name(template, api_key)
 
-async def match_card(keyword, config, api_key):
+# Поиск заведения по названию
+@stage("match")
+async def match(keyword, config, token, session, client):
+    data = await catalog(config, token, session)
+    rows = filter_rows(data["items"], config["form"])
+
+    # Список справочника одинаков между вызовами, пока каталог не изменился
+    items_text = "\n".join(f"{item['id']}: {item['name']}" for item in rows)
+    template = match_messages(match_system(items_text), keyword)
+    return await openai_name(template, client)
+
+@stage("match")
+async def match_card(keyword, config, client):
     if not config["parsed_reg"]:
-        print("-")
+        log.info("match_card: register is empty", stage="match")
         return "-"
-    list_str = config["parsed_reg"]
-    template = [
-        {
-            "role": "system",
-            "content": (
-                "Твоя задача - проанализировать входящее значение и найти наиболее похожее в предоставленном списке. "
-                "Верни ТОЛЬКО числовой ID найденного элемента. "
-                "Если подходящих элементов нет или их несколько — верни '-'"
-            )
-        },
-        {
-            "role": "user",
-            "content": f"Искомое значение: {keyword}\n\nСписок элементов:\n{list_str}"
-        },
-    ]
+    # Реестр меняется только с версией конфигурации (ночное обновление reg_form)
+    system = memoized("match_card", config, lambda: match_system(config["parsed_reg"]))
+    template = match_messages(system, keyword)
 
-    return await openai_name(template, api_key)
+    return await openai_name(template, client)
 
 
 # Получение каталога заведений
+@stage("catalog")
 async def catalog(config, token, session):
     dictionary_id = config["form"]["dictionary_id"]
-    url = f"https://api.pyrus.com/v4/catalogs/{dictionary_id}"
+    url = f"{PYRUS_API_URL}/catalogs/{dictionary_id}"
     async with aiohttp.ClientSession() as session:
         async with session.get(url, headers={"Authorization": f"Bearer {token}"}) as response:
-            return await response.json()
+            return await read_json(response)
 
 async def get_task_fields(task_id, token, session):
-    url = f"https://api.pyrus.com/v4/tasks/{task_id}"
+    url = f"{PYRUS_API_URL}/tasks/{task_id}"
     async with session.get(url, headers={"Authorization": f"Bearer {token}"}) as resp:
-        data = await resp.json()
+        data = await read_json(resp)
     return data["task"]["fields"]
 
 async def fill_task_fields(gid, item_fields_data, current_task_fields):
@@ -106,19 +104,50 @@ async def fill_task_fields(gid, item_fields_data, current_task_fields):
 
 
 
-# Получение полей задачи
+# Значения из ответа GPT -> обновления полей по типам dynamic_fields
+def coerce_fields(matches, dynamic_fields):
+    updates = []
+    for i, field in enumerate(dynamic_fields):
+        val = matches[i] if i < len(matches) else ""
+        if field["type"] == "phone":
+            value = normalize_phone(val)
+        elif field["type"] == "money":
+            try: value = float(val.replace(",", "."))
+            except: value = 0.0
+        elif field["type"] == "select":
+            value = {"item_name": val}
+        else:
+            value = val
+        updates.append({"id": field["id"], "value": value})
+    return updates
+
+
+# Получение полей задачи: вызовы модели — через допуск организации (logic/admission.py)
+@stage("flds")
 async def flds(sessions, id, pyrus_key, task):
+    config = get_cache_config(pyrus_key)
     try:
-        config = get_cache_config(pyrus_key)
-        api_key = config["api_keys"]["openai_api_key"]
+        async with admission.admit(config, "flds"):
+            return await fill_fields(sessions, id, pyrus_key, task, config)
+    except admission.Overloaded:
+        return ""  # задача передаётся сотруднику без заполненных полей
 
-        # Получаем всю историю диалога из thread для анализа
-        if id in sessions and "thread_id" in sessions[id]:
-            from openai import AsyncOpenAI
-            client = AsyncOpenAI(api_key=api_key)
+async def fill_fields(sessions, id, pyrus_key, task, config):
+    try:
+        # извлечение полей и поиск заведения не используют threads — любой ключ группы
+        client = keys.client(config, stateless=True)
 
-            # Получаем все сообщения из thread
-            messages = await client.beta.threads.messages.list(thread_id=sessions[id]["thread_id"])
+        # История есть локально: сводка + сообщения после неё (logic/context.py)
+        if id in sessions and sessions[id].get("history"):
+            context = bounded(sessions[id])
+            track("flds", sessions[id], config["form_config"]["form_template"], context)
+            field_extraction_messages = [
+                {"role": "system", "content": config["form_config"]["form_template"]}
+            ] + context
+        # Получаем всю историю диалога из thread для анализа
+        elif id in sessions and "thread_id" in sessions[id]:
+            # Thread живёт в проекте ключа организации
+            messages = await keys.client(config).beta.threads.messages.list(thread_id=sessions[id]["thread_id"])
             dialog_history = []
             for msg in reversed(messages.data):
                 role = "user" if msg.role == "user" else "assistant"
@@ -136,23 +165,9 @@ async def flds(sessions, id, pyrus_key, task):
                 {"role": "user", "content": "Нет истории диалога"}
             ]
 
-        fields = await openai_resp_direct(field_extraction_messages, api_key)
+        fields = await openai_resp_direct(field_extraction_messages, client)
         matches = re.findall(r'"(.*?)"', fields)
-        dynamic_fields = config["form_config"].get("dynamic_fields", [])
-        resp = {"field_updates": []}
-
-        for i, field in enumerate(dynamic_fields):
-            val = matches[i] if i < len(matches) else ""
-            if field["type"] == "phone":
-                value = normalize_phone(val)
-            elif field["type"] == "money":
-                try: value = float(val.replace(",", "."))
-                except: value = 0.0
-            elif field["type"] == "select":
-                value = {"item_name": val}
-            else:
-                value = val
-            resp["field_updates"].append({"id": field["id"], "value": value})
+        resp = {"field_updates": coerce_fields(matches, config["form_config"].get("dynamic_fields", []))}
 
         if config["form_config"]["form_or_card"] != "":
             keyword = matches[0] if len(matches) > 0 else ""
@@ -162,15 +177,15 @@ async def flds(sessions, id, pyrus_key, task):
             token = await acs(config, pyrus_key)
             async with aiohttp.ClientSession() as session:
                 if config["form_config"]["form_or_card"] == "form":
-                    item_id = await match(keyword, config, token, session, api_key)
-                    print("form filling finished:", item_id)
+                    item_id = await match(keyword, config, token, session, client)
+                    log.info("form filling finished", task=id, item=item_id, stage="flds")
                     if item_id != "-":
                         resp["field_updates"].append({"id": config["form"]["dict_field_id"], "value": {"item_id": int(item_id)}})
                 elif config["form_config"]["form_or_card"] == "card":
-                    item_id = await match_card(keyword, config, api_key)
+                    item_id = await match_card(keyword, config, client)
                     if item_id != "-":
                         resp["field_updates"].append({"id": config["card"]["card_field_id"], "value": {"task_id": item_id}})
-                        print("card filling finished:", item_id)
+                        log.info("card filling finished", task=id, item=item_id, stage="flds")
                         if config["card"]["group_id"]:
                             gr_id = int(config["card"]["group_id"])
                             updates = await fill_task_fields(gr_id, await get_task_fields(item_id, token, session), task["fields"])
@@ -179,50 +194,50 @@ async def flds(sessions, id, pyrus_key, task):
         return resp
 
     except Exception as e:
-        print("error:", e)
+        log.error("flds error", task=id, stage="flds", error=e)
         return ""
 
 
 # Получение полей от GPT (старая функция для совместимости)
-async def openai_resp(sessions, id, api_key):
+async def openai_resp(sessions, id, client):
     try:
-        client = AsyncOpenAI(api_key=api_key)
-        resp = await client.chat.completions.create(
+        resp = await resilience.call(client, "gpt-4o-mini", lambda: client.chat.completions.create(
             model="gpt-4o-mini",
             messages=sessions[id],
             max_tokens=80,
             temperature=0.1
-        )
+        ))
+        record_usage("gpt-4o-mini", "extract", resp.usage)
         return resp.choices[0].message.content.strip()
     except Exception as e:
-        print("openai error", e)
+        log.error("openai error", stage="extract", error=e)
         return ""
 
 # Новая функция для прямого вызова с messages
-async def openai_resp_direct(messages, api_key):
+async def openai_resp_direct(messages, client):
     try:
-        client = AsyncOpenAI(api_key=api_key)
-        resp = await client.chat.completions.create(
+        resp = await resilience.call(client, "gpt-4o-mini", lambda: client.chat.completions.create(
             model="gpt-4o-mini",
             messages=messages,
             max_tokens=80,
             temperature=0.1
-        )
+        ))
+        record_usage("gpt-4o-mini", "extract", resp.usage)
         return resp.choices[0].message.content.strip()
     except Exception as e:
-        print("openai error", e)
+        log.error("openai error", stage="extract", error=e)
         return ""
 
-async def openai_name(template, api_key):
+async def openai_name(template, client):
     try:
-        client = AsyncOpenAI(api_key=api_key)
-        resp = await client.chat.completions.create(
+        resp = await resilience.call(client, "gpt-4o-mini", lambda: client.chat.completions.create(
             model="gpt-4o-mini",
             messages=template,
             max_tokens=40,
             temperature=0.2
-        )
+        ))
+        record_usage("gpt-4o-mini", "match", resp.usage)
         return resp.choices[0].message.content.strip()
     except Exception as e:
-        print("openai error", e)
+        log.error("openai error", stage="extract", error=e)
         return ""
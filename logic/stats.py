@@ -0,0 +1,104 @@
+import os, asyncio
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from mysql.connector.errors import IntegrityError
+from logic.cache import get_mysql_connection
+from logic.atts import run_blocking
+from logic import log
+
+FLUSH_INTERVAL = int(os.getenv("STATS_FLUSH_INTERVAL", "30"))  # секунды между сбросами
+FLUSH_RETRIES = 3
+FLUSH_BACKOFF = 1  # секунды, удваивается с каждой попыткой
+STATS_TZ = ZoneInfo("Asia/Almaty")
+
+# Дельты счётчиков с последнего сброса {tenant_id: count}.
+# Каждый воркер копит свои дельты, в БД они складываются через upsert.
+requests_today = {}
+tasks_today = {}
+
+# Дневной ряд и помесячные агрегаты обновляются одной транзакцией
+DAILY_UPSERT_SQL = """
+    INSERT INTO statistics_daily (tenant_id, day, request_count, task_count)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        request_count = request_count + VALUES(request_count),
+        task_count = task_count + VALUES(task_count)
+"""
+
+MONTHLY_UPSERT_SQL = """
+    INSERT INTO statistics_monthly (tenant_id, month, request_count, task_count)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        request_count = request_count + VALUES(request_count),
+        task_count = task_count + VALUES(task_count)
+"""
+
+
+def count_request(tenant_id):
+    requests_today[tenant_id] = requests_today.get(tenant_id, 0) + 1
+
+def count_task(tenant_id):
+    tasks_today[tenant_id] = tasks_today.get(tenant_id, 0) + 1
+
+
+def _take():
+    """Забирает накопленные дельты и обнуляет счётчики (без await — атомарно для event loop)"""
+    rows = [(t, requests_today.get(t, 0), tasks_today.get(t, 0)) for t in requests_today.keys() | tasks_today.keys()]
+    requests_today.clear()
+    tasks_today.clear()
+    return rows
+
+def _merge_back(rows):
+    """Возвращает несохранённые дельты, чтобы отправить их при следующем сбросе"""
+    for tenant_id, request_count, task_count in rows:
+        if request_count:
+            requests_today[tenant_id] = requests_today.get(tenant_id, 0) + request_count
+        if task_count:
+            tasks_today[tenant_id] = tasks_today.get(tenant_id, 0) + task_count
+
+def _write(rows):
+    """Пакет одной транзакцией. Если пакет нарушает целостность (организация удалена, FK на tenants) —
+    по строке: такие строки отбрасываются, остальные сохраняются. Записанные и отброшенные строки
+    удаляются из rows, поэтому повтор после обрыва соединения не запишет их второй раз"""
+    today = datetime.now(STATS_TZ).date()
+    month = today.replace(day=1)
+    conn = get_mysql_connection()
+    try:
+        c = conn.cursor()
+        try:
+            c.executemany(DAILY_UPSERT_SQL, [(t, today, r, k) for t, r, k in rows])
+            c.executemany(MONTHLY_UPSERT_SQL, [(t, month, r, k) for t, r, k in rows])
+            conn.commit()
+            rows.clear()
+        except IntegrityError:
+            conn.rollback()
+            while rows:
+                t, r, k = rows[0]
+                try:
+                    c.execute(DAILY_UPSERT_SQL, (t, today, r, k))
+                    c.execute(MONTHLY_UPSERT_SQL, (t, month, r, k))
+                    conn.commit()
+                except IntegrityError as e:
+                    conn.rollback()
+                    log.warning("stats row dropped", tenant=t, requests=r, tasks=k, error=e)
+                rows.pop(0)
+        c.close()
+    finally:
+        conn.close()
+
+
+async def flush_stats():
+    rows = _take()
+    if not rows:
+        return
+
+    for attempt in range(FLUSH_RETRIES):
+        try:
+            await run_blocking(_write, rows)
+            return
+        except Exception as e:
+            log.error("flush_stats error", attempt=f"{attempt + 1}/{FLUSH_RETRIES}", error=e)
+            if attempt + 1 < FLUSH_RETRIES:
+                await asyncio.sleep(FLUSH_BACKOFF * 2 ** attempt)
+
+    _merge_back(rows)
@@ -0,0 +1,59 @@
+import time
+
+
+class TokenBucket:
+    """Классический token bucket: capacity токенов, пополняется со скоростью rate в секунду"""
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount=1):
+        """Списывает токены; False — если их не хватает"""
+        self._refill(time.monotonic())
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def wait_time(self, amount=1):
+        """Сколько секунд ждать, пока накопится amount токенов"""
+        self._refill(time.monotonic())
+        return max(0.0, (amount - self.tokens) / self.rate) if self.rate else float("inf")
+
+
+class KeyedBuckets:
+    """Набор bucket'ов по ключу (IP, логин, tenant). Полные и давно не тронутые удаляются"""
+
+    def __init__(self, capacity, rate, max_keys=10000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = {}
+
+    def get(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict()
+            bucket = self._buckets[key] = TokenBucket(self.capacity, self.rate)
+        return bucket
+
+    def take(self, key, amount=1):
+        return self.get(key).take(amount)
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [k for k, b in self._buckets.items() if b.tokens + (now - b.updated) * b.rate >= b.capacity]:
+            del self._buckets[key]
+        # Если все bucket'ы активны — выкидываем самые старые
+        if len(self._buckets) >= self.max_keys:
+            for key in sorted(self._buckets, key=lambda k: self._buckets[k].updated)[:len(self._buckets) // 10 + 1]:
+                del self._buckets[key]
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime
+from logic.cache import get_mysql_connection
+from logic.atts import run_blocking
+from logic.metrics import current_tenant, inc
+from logic.stats import STATS_TZ, FLUSH_RETRIES
+from logic import stats, log
+
+# Расход OpenAI по организациям и моделям. Копится в памяти воркера и сбрасывается
+# в usage_monthly вместе со статистикой (тот же интервал и те же повторы).
+# {(tenant_id, model, kind): [requests, prompt_tokens, cached_tokens, completion_tokens, audio_seconds]}
+usage_pending = {}
+
+# Цены $ за 1M токенов (prompt, cached prompt, completion) и $ за минуту аудио — для оценки в админке
+PRICES = {
+    "gpt-4o": (2.5, 1.25, 10.0),
+    "gpt-4o-mini": (0.15, 0.075, 0.6),
+    "gpt-4.1": (2.0, 0.5, 8.0),
+    "gpt-4.1-mini": (0.4, 0.1, 1.6),
+    "gpt-4.1-nano": (0.1, 0.025, 0.4),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+}
+AUDIO_PRICE = {"whisper-1": 0.006}
+
+UPSERT_SQL = """
+    INSERT INTO usage_monthly (tenant_id, month, model, kind, requests, prompt_tokens, cached_tokens, completion_tokens, audio_seconds)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        requests = requests + VALUES(requests),
+        prompt_tokens = prompt_tokens + VALUES(prompt_tokens),
+        cached_tokens = cached_tokens + VALUES(cached_tokens),
+        completion_tokens = completion_tokens + VALUES(completion_tokens),
+        audio_seconds = audio_seconds + VALUES(audio_seconds)
+"""
+
+
+def record(model, kind, usage=None, audio_seconds=0, tenant_id=None):
+    """Учитывает один вызов OpenAI; usage — объект usage из ответа (completion, run или чанк стрима)"""
+    key = (tenant_id or current_tenant.get() or "-", model or "-", kind)
+    slot = usage_pending.get(key)
+    if slot is None:
+        slot = usage_pending[key] = [0, 0, 0, 0, 0.0]
+    slot[0] += 1
+    if usage is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        cached = getattr(details, "cached_tokens", 0) or 0
+        slot[1] += prompt
+        slot[2] += cached
+        slot[3] += getattr(usage, "completion_tokens", 0) or 0
+        # доля попаданий в кэш промптов: hit / (hit + miss)
+        inc("barry_prompt_tokens_total", kind, key[0], "hit", amount=cached)
+        inc("barry_prompt_tokens_total", kind, key[0], "miss", amount=prompt - cached)
+    slot[4] += audio_seconds or 0
+
+
+def _take():
+    rows = [(*key, *values) for key, values in usage_pending.items()]
+    usage_pending.clear()
+    return rows
+
+def _merge_back(rows):
+    for tenant_id, model, kind, *values in rows:
+        slot = usage_pending.setdefault((tenant_id, model, kind), [0, 0, 0, 0, 0.0])
+        for i, value in enumerate(values):
+            slot[i] += value
+
+def _write(rows):
+    month = datetime.now(STATS_TZ).date().replace(day=1)
+    conn = get_mysql_connection()
+    try:
+        c = conn.cursor()
+        c.executemany(UPSERT_SQL, [(t, month, m, k, *values) for t, m, k, *values in rows])
+        conn.commit()
+        c.close()
+    finally:
+        conn.close()
+
+
+async def flush_usage():
+    rows = _take()
+    if not rows:
+        return
+
+    for attempt in range(FLUSH_RETRIES):
+        try:
+            await run_blocking(_write, rows)
+            return
+        except Exception as e:
+            log.error("flush_usage error", attempt=f"{attempt + 1}/{FLUSH_RETRIES}", error=e)
+            if attempt + 1 < FLUSH_RETRIES:
+                await asyncio.sleep(stats.FLUSH_BACKOFF * 2 ** attempt)
+
+    _merge_back(rows)
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens, audio_seconds):
+    """Оценка в $ по PRICES; None для неизвестной модели"""
+    if model in AUDIO_PRICE:
+        return AUDIO_PRICE[model] * audio_seconds / 60
+    # датированные версии (gpt-4o-2024-08-06) считаются по базовой модели
+    base = max((name for name in PRICES if model.startswith(name)), key=len, default=None)
+    if not base:
+        return None
+    prices = PRICES[base]
+    uncached = prompt_tokens - cached_tokens
+    return (uncached * prices[0] + cached_tokens * prices[1] + completion_tokens * prices[2]) / 1_000_000
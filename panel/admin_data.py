@@ -0,0 +1,216 @@
+import asyncio, os, time
+from datetime import date
+from logic.cache import get_mysql_connection
+from logic.atts import run_blocking
+from logic.usage import estimate_cost
+from logic.keys import mask, snapshot
+
+PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "10"))  # секунды
+
+# {(tenants_page, users_page, month): (expires_at, data)}
+_admin_cache = {}
+
+
+def invalidate_admin_cache():
+    """Вызывается после любых изменений из админки"""
+    _admin_cache.clear()
+
+
+def get_all_users(limit=None, offset=0):
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    query = """
+        SELECT NULL as tenant_id, login, 'admin' as role FROM admins
+        UNION ALL
+        SELECT tenant_id, login, 'user' as role FROM users
+        ORDER BY role, login
+    """
+    if limit:
+        c.execute(query + " LIMIT %s OFFSET %s", (limit, offset))
+    else:
+        c.execute(query)
+    users = [{"tenant_id": row[0], "email": row[1], "role": row[2]} for row in c.fetchall()]
+    conn.close()
+    return users
+
+def count_users():
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    c.execute("SELECT (SELECT COUNT(*) FROM admins) + (SELECT COUNT(*) FROM users)")
+    total = c.fetchone()[0]
+    conn.close()
+    return total
+
+def get_all_tenants(limit=None, offset=0):
+    conn = get_mysql_connection()
+    c = conn.cursor(dictionary=True)
+    query = """
+        SELECT tenant_id, pyrus_key, gpt_model, engine,
+               allow_attachments_toggle, allow_multi_channel_toggle
+        FROM tenants
+        ORDER BY tenant_id
+    """
+    if limit:
+        c.execute(query + " LIMIT %s OFFSET %s", (limit, offset))
+    else:
+        c.execute(query)
+    tenants = c.fetchall()
+    conn.close()
+    return tenants
+
+def count_tenants():
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM tenants")
+    total = c.fetchone()[0]
+    conn.close()
+    return total
+
+
+def get_all_gpt_models():
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    c.execute("SELECT model_name FROM gpt_models")
+    models = [row[0] for row in c.fetchall()]
+    conn.close()
+    return models
+
+def get_all_api_keys():
+    conn = get_mysql_connection()
+    c = conn.cursor(dictionary=True)
+    c.execute("SELECT id, openai_api_key, key_group, enabled FROM api_keys ORDER BY key_group, id")
+    rows = c.fetchall()
+    conn.close()
+    return [{"id": r["id"], "key": mask(r["openai_api_key"]), "group": r["key_group"], "enabled": r["enabled"]} for r in rows]
+
+def key_usage(api_keys):
+    """Ключи из базы с загрузкой по заголовкам OpenAI (данные этого воркера, не кэшируются)"""
+    live = {key["id"]: key for key in snapshot()}
+    return [{**key, **live.get(key["id"], {})} for key in api_keys]
+
+def get_all_stats(month=None, limit=None, offset=0):
+    """Статистика за месяц (по умолчанию текущий) — читается только из помесячных агрегатов"""
+    month = month or date.today().replace(day=1)
+    conn = get_mysql_connection()
+    c = conn.cursor(dictionary=True)
+    # Оконная сумма считается до LIMIT, поэтому процент — от всех организаций
+    query = """
+        SELECT
+            t.tenant_id,
+            t.created_at AS date,
+            CONCAT('$', 130
+                + IF(t.allow_multi_channel_toggle, 7, 0)
+                + IF(t.allow_attachments_toggle, 25, 0)) AS amount,
+            COALESCE(m.request_count, 0) AS request,
+            COALESCE(m.task_count, 0) AS tasks,
+            ROUND(COALESCE(m.request_count, 0) / GREATEST(COALESCE(m.task_count, 0), 1), 2) AS reqpertasks,
+            ROUND(COALESCE(m.request_count, 0)
+                / GREATEST(COALESCE(SUM(m.request_count) OVER (), 0), 1) * 100, 2) AS percentage
+        FROM tenants t
+        LEFT JOIN statistics_monthly m ON m.tenant_id = t.tenant_id AND m.month = %s
+        ORDER BY t.tenant_id
+    """
+    if limit:
+        c.execute(query + " LIMIT %s OFFSET %s", (month, limit, offset))
+    else:
+        c.execute(query, (month,))
+    stats = c.fetchall()
+    conn.close()
+    return stats
+
+USAGE_COLUMNS = """
+    SUM(requests) AS requests,
+    SUM(prompt_tokens) AS prompt_tokens,
+    SUM(cached_tokens) AS cached_tokens,
+    SUM(completion_tokens) AS completion_tokens,
+    SUM(audio_seconds) AS audio_seconds
+"""
+
+def _usage_row(row):
+    for key in ("requests", "prompt_tokens", "cached_tokens", "completion_tokens"):
+        row[key] = int(row[key] or 0)
+    row["uncached_tokens"] = row["prompt_tokens"] - row["cached_tokens"]
+    row["audio_minutes"] = round(float(row.pop("audio_seconds") or 0) / 60, 1)
+    cost = estimate_cost(row["model"], row["prompt_tokens"], row["cached_tokens"],
+                         row["completion_tokens"], row["audio_minutes"] * 60)
+    row["cost"] = round(cost, 2) if cost is not None else None
+    return row
+
+def get_usage(month=None, limit=None, offset=0):
+    """Расход OpenAI за месяц: строки по организациям и моделям — для организаций страницы
+    (как статистика), итог — по всем организациям, одна строка на модель"""
+    month = month or date.today().replace(day=1)
+    conn = get_mysql_connection()
+    c = conn.cursor(dictionary=True)
+    c.execute(f"SELECT model, {USAGE_COLUMNS} FROM usage_monthly WHERE month = %s GROUP BY model", (month,))
+    models = [_usage_row(row) for row in c.fetchall()]
+    page = ""
+    params = (month,)
+    if limit:
+        page = "JOIN (SELECT tenant_id FROM tenants ORDER BY tenant_id LIMIT %s OFFSET %s) p ON p.tenant_id = u.tenant_id"
+        params = (limit, offset, month)
+    c.execute(f"""
+        SELECT u.tenant_id, u.model, {USAGE_COLUMNS}
+        FROM usage_monthly u
+        {page}
+        WHERE u.month = %s
+        GROUP BY u.tenant_id, u.model
+        ORDER BY u.tenant_id, u.model
+    """, params)
+    rows = [_usage_row(row) for row in c.fetchall()]
+    conn.close()
+
+    total = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "uncached_tokens": 0,
+             "completion_tokens": 0, "audio_minutes": 0.0, "cost": 0.0}
+    for row in models:
+        for key in total:
+            total[key] += row[key] or 0
+    total["audio_minutes"] = round(total["audio_minutes"], 1)
+    total["cost"] = round(total["cost"], 2)
+    return {"rows": rows, "total": total}
+
+
+def _pages(total, page):
+    pages = max(1, -(-total // PAGE_SIZE))
+    return {"page": min(page, pages), "pages": pages, "total": total}
+
+async def load_admin_data(tenants_page=1, users_page=1, month=None):
+    """Все данные для /admin параллельно (каждый запрос в своём соединении из пула) с коротким кэшем"""
+    month = month or date.today().replace(day=1)
+    tenants_page, users_page = max(1, tenants_page), max(1, users_page)
+    key = (tenants_page, users_page, month)
+
+    cached = _admin_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    tenants_offset = (tenants_page - 1) * PAGE_SIZE
+    users_offset = (users_page - 1) * PAGE_SIZE
+    users, users_total, tenants, tenants_total, stats, usage, gpt_models, api_keys = await asyncio.gather(
+        run_blocking(get_all_users, PAGE_SIZE, users_offset),
+        run_blocking(count_users),
+        run_blocking(get_all_tenants, PAGE_SIZE, tenants_offset),
+        run_blocking(count_tenants),
+        run_blocking(get_all_stats, month, PAGE_SIZE, tenants_offset),
+        run_blocking(get_usage, month, PAGE_SIZE, tenants_offset),
+        run_blocking(get_all_gpt_models),
+        run_blocking(get_all_api_keys),
+    )
+
+    data = {
+        "users": users,
+        "users_pages": _pages(users_total, users_page),
+        "tenants": tenants,
+        "tenants_pages": _pages(tenants_total, tenants_page),
+        "stats": stats,
+        "stats_month": month.strftime("%Y-%m"),
+        "usage": usage,
+        "gpt_models": gpt_models,
+        "api_keys": api_keys,
+    }
+    now = time.monotonic()
+    for stale in [k for k, (expires, _) in _admin_cache.items() if expires <= now]:
+        del _admin_cache[stale]
+    _admin_cache[key] = (now + ADMIN_CACHE_TTL, data)
+    return data
@@ -0,0 +1,86 @@
+import asyncio, os, bcrypt
+from concurrent.futures import ThreadPoolExecutor
+from quart import request
+from logic.cache import get_mysql_connection
+from logic.atts import run_blocking
+from logic.throttle import KeyedBuckets
+
+# bcrypt отпускает GIL, поэтому хватает небольшого пула потоков вне event loop
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "16"))  # больше — отказ без хэширования
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+
+# Не больше 10 попыток с IP в минуту и 5 попыток на логин за 5 минут
+ip_buckets = KeyedBuckets(capacity=10, rate=10 / 60)
+login_buckets = KeyedBuckets(capacity=5, rate=5 / 300)
+
+# Сколько прокси перед приложением дописывают адрес в X-Forwarded-For (роутер платформы из Procfile — один);
+# 0 — приложение принимает соединения напрямую, заголовок не учитывается
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "1"))
+
+
+class AuthBusy(Exception):
+    """Слишком много попыток входа или очередь bcrypt переполнена"""
+
+
+async def _run_bcrypt(func, *args):
+    global _pending
+    if _pending >= BCRYPT_MAX_PENDING:
+        raise AuthBusy()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, func, *args)
+    finally:
+        _pending -= 1
+
+
+# Хэширование пароля (при регистрации/добавлении пользователя)
+async def hash_password(password: str) -> str:
+    hashed = await _run_bcrypt(bcrypt.hashpw, password.encode(), bcrypt.gensalt())
+    return hashed.decode()  # Сохраняем как строку в БД
+
+# Проверка пароля
+async def check_password(password: str, hashed: str) -> bool:
+    return await _run_bcrypt(bcrypt.checkpw, password.encode(), hashed.encode())
+
+
+def client_ip():
+    """Адрес, дописанный внешним доверенным прокси: записи левее задаёт сам клиент"""
+    hops = [hop.strip() for hop in request.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+    if TRUSTED_PROXIES and len(hops) >= TRUSTED_PROXIES:
+        return hops[-TRUSTED_PROXIES]
+    return request.remote_addr
+
+def throttle_login(login, tenant_id=""):
+    """Списывает попытку до любого хэширования; AuthBusy — если лимит исчерпан"""
+    if not ip_buckets.take(client_ip()) or not login_buckets.take(f"{tenant_id}:{login}"):
+        raise AuthBusy()
+
+
+def _get_tenant_hash(tenant_id, login):
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    c.execute("SELECT password FROM users WHERE tenant_id=%s AND login=%s", (tenant_id, login))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def _get_admin_hash(login):
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    c.execute("SELECT password FROM admins WHERE login=%s", (login,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+async def check_tenant_credentials(tenant_id, login, password):
+    throttle_login(login, tenant_id)
+    hashed = await run_blocking(_get_tenant_hash, tenant_id, login)
+    return hashed is not None and await check_password(password, hashed)
+
+async def check_admin_credentials(login, password):
+    throttle_login(login)
+    hashed = await run_blocking(_get_admin_hash, login)
+    return hashed is not None and await check_password(password, hashed)
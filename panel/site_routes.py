@@ -1,123 +1,28 @@
 from quart import Blueprint, render_template, request, session, redirect
-import bcrypt, json
-from datetime import date
+import json
+from datetime import date, datetime
 from dotenv import load_dotenv
 from logic.serv import template
-from logic.cache import get_mysql_connection, clear_cache, clear_all_cache
+from logic.cache import get_mysql_connection, get_pyrus_key, get_cache_config, bump_config_version, clear_cache, clear_tenant, clear_all_cache
+from panel.auth import AuthBusy, hash_password, check_tenant_credentials, check_admin_credentials
+from panel.admin_data import load_admin_data, invalidate_admin_cache, get_all_gpt_models, key_usage
+from logic.chat import ENGINES
+from logic.intents import MODES as INTENT_MODES, DEFAULT_THRESHOLD
+from logic.routing import DEFAULT_MAX_CHARS
+from logic.keys import DEFAULT_GROUP
+from logic.admission import POLICIES, DEFAULT_CONCURRENCY, BUSY_REPLY
+from logic.assistants import forget_tenant, rename_tenant
 
 load_dotenv()
 site_routes = Blueprint('site_routes', __name__)
 
 
-# Хэширование пароля (при регистрации/добавлении пользователя)
-def hash_password(password: str) -> str:
-    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-    return hashed.decode()  # Сохраняем как строку в БД
-
-# Проверка пароля
-def check_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
-
-def check_tenant_credentials(tenant_id, login, password):
-    conn = get_mysql_connection()
-    c = conn.cursor()
-    c.execute("SELECT password FROM users WHERE tenant_id=%s AND login=%s", (tenant_id, login))
-    row = c.fetchone()
-    conn.close()
-    return row is not None and check_password(password, row[0])
-
-def check_admin_credentials(login, password):
-    conn = get_mysql_connection()
-    c = conn.cursor()
-    c.execute("SELECT password FROM admins WHERE login=%s", (login,))
-    row = c.fetchone()
-    conn.close()
-    return row is not None and check_password(password, row[0])
-
-def get_all_users():
-    conn = get_mysql_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT NULL as tenant_id, login, 'admin' as role FROM admins
-        UNION ALL
-        SELECT tenant_id, login, 'user' as role FROM users
-    """)
-    users = [{"tenant_id": row[0], "email": row[1], "role": row[2]} for row in c.fetchall()]
-    conn.close()
-    return users
-
-def get_all_tenants():
-    conn = get_mysql_connection()
-    c = conn.cursor(dictionary=True)
-    c.execute("""
-        SELECT tenant_id, pyrus_key, gpt_model,
-               allow_attachments_toggle, allow_multi_channel_toggle
-        FROM tenants
-    """)
-    tenants = c.fetchall()
-    conn.close()
-    return tenants
-
-
-def get_all_gpt_models():
-    conn = get_mysql_connection()
-    c = conn.cursor()
-    c.execute("SELECT model_name FROM gpt_models")
-    models = [row[0] for row in c.fetchall()]
-    conn.close()
-    return models
-
-def get_all_api_keys():
-    conn = get_mysql_connection()
-    c = conn.cursor()
-    c.execute("SELECT openai_api_key FROM api_keys LIMIT 1")
-    row = c.fetchone()
-    conn.close()
-    return {
-        "openai_api_key": row[0] if row else "",
-    }
-
-def get_all_stats():
-    conn = get_mysql_connection()
-    c = conn.cursor(dictionary=True)
-
-    # Сумма всех запросов
-    c.execute("SELECT SUM(request_count) AS total_requests FROM statistics")
-    total_requests = c.fetchone()["total_requests"] or 1
-
-    # Собираем статистику
-    c.execute("""
-        SELECT 
-            t.tenant_id,
-            s.date AS date,
-            s.request_count AS request,
-            s.task_count AS tasks,
-            t.allow_attachments_toggle,
-            t.allow_multi_channel_toggle,
-            ROUND(COALESCE(s.request_count, 0) / %s * 100, 2) AS percentage
-        FROM tenants t
-        LEFT JOIN statistics s ON t.tenant_id = s.tenant_id
-    """, (total_requests,))
-
-    stats = []
-    for row in c.fetchall():
-        base = 130
-        if row.get("allow_multi_channel_toggle"):
-            base += 7
-        if row.get("allow_attachments_toggle"):
-            base += 25
-        row["amount"] = f"${base}"
-
-        # Расчёт запросов на задачу
-        request = row.get("request", 0) or 0
-        tasks = row.get("tasks", 0) or 1  # чтобы не делить на 0
-        row["reqpertasks"] = round(request / tasks, 2) if tasks else "-"
-
-        stats.append(row)
-
-    conn.close()
-    return stats
-
+def parse_month(value):
+    """'2025-06' -> date(2025, 6, 1); None при пустом или кривом значении"""
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except (TypeError, ValueError):
+        return None
 
 
 @site_routes.route("/", methods=["GET"])
@@ -131,18 +36,35 @@ async def universal_login():
     password = data["password"]
     tenant_id = data.get("tenant_id", "").strip()
 
-    if tenant_id:
-        if check_tenant_credentials(tenant_id, login, password):
-            session["tenant"] = tenant_id
-            session["login"] = login  # ← вот это добавь
-            return redirect("/dashboard")
-        return await render_template("index.html", error="Неверный логин или пароль")
-    else:
-        if check_admin_credentials(login, password):
+    try:
+        if tenant_id:
+            if await check_tenant_credentials(tenant_id, login, password):
+                session["tenant"] = tenant_id
+                session["login"] = login  # ← вот это добавь
+                return redirect("/dashboard")
+        elif await check_admin_credentials(login, password):
             session["admin"] = login
             return redirect("/admin")
+    except AuthBusy:
+        return await render_template("index.html", error="Слишком много попыток входа, попробуйте позже"), 429
 
-        return await render_template("index.html", error="Неверный логин или пароль")
+    return await render_template("index.html", error="Неверный логин или пароль")
+
+
+def page_arg(name):
+    try:
+        return max(1, int(request.args.get(name, 1)))
+    except ValueError:
+        return 1
+
+async def render_admin(**extra):
+    data = await load_admin_data(
+        tenants_page=page_arg("tenants_page"),
+        users_page=page_arg("users_page"),
+        month=parse_month(request.args.get("month")),
+    )
+    data = {**data, "api_keys": key_usage(data["api_keys"])}
+    return await render_template("admin.html", admin_login=session.get("admin"), **data, **extra)
 
 
 @site_routes.route("/admin")
@@ -150,21 +72,7 @@ async def admin_panel():
     if "admin" not in session:
         return redirect("/")
 
-    users = get_all_users()
-    tenants = get_all_tenants()
-    stats = get_all_stats()
-    gpt_models = get_all_gpt_models()
-    api_keys = get_all_api_keys()
-
-    return await render_template(
-        "admin.html",
-        admin_login=session["admin"],
-        users=users,
-        tenants=tenants,
-        stats=stats,
-        gpt_models=gpt_models,
-        api_keys=api_keys,
-    )
+    return await render_admin()
 
 
 
@@ -174,15 +82,32 @@ async def update_api_keys():
         return redirect("/")
 
     data = await request.form
+    secret = data.get("openai_api_key", "").strip()
+    if not secret:
+        return redirect("/admin")
     conn = get_mysql_connection()
     c = conn.cursor()
-    c.execute("""
-        INSERT INTO api_keys (id, openai_api_key)
-        VALUES (1, %s)
-        ON DUPLICATE KEY UPDATE
-            openai_api_key = VALUES(openai_api_key)
-    """, (data["openai_api_key"],))
+    c.execute("INSERT INTO api_keys (openai_api_key, key_group) VALUES (%s, %s)",
+              (secret, data.get("key_group", "").strip() or DEFAULT_GROUP))
     conn.commit()
+    invalidate_admin_cache()
+    conn.close()
+    return redirect("/admin")
+
+
+@site_routes.route("/admin/api_keys/<int:key_id>/<string:action>")
+async def change_api_key(key_id, action):
+    if "admin" not in session:
+        return redirect("/")
+
+    conn = get_mysql_connection()
+    c = conn.cursor()
+    if action == "delete":
+        c.execute("DELETE FROM api_keys WHERE id=%s", (key_id,))
+    elif action in ("enable", "disable"):
+        c.execute("UPDATE api_keys SET enabled=%s WHERE id=%s", (action == "enable", key_id))
+    conn.commit()
+    invalidate_admin_cache()
     conn.close()
     return redirect("/admin")
 
@@ -200,7 +125,7 @@ async def create_user():
     login = data.get("email")
     password = data.get("password")
     role = data.get("role")
-    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    hashed = await hash_password(password)
 
     conn = get_mysql_connection()
     c = conn.cursor()
@@ -209,54 +134,26 @@ async def create_user():
         c.execute("SELECT 1 FROM admins WHERE login=%s", (login,))
         if c.fetchone():
             conn.close()
-            return await render_template(
-                "admin.html",
-                error="Админ с таким логином уже существует",
-                admin_login=session.get("admin"),
-                users=get_all_users(),
-                tenants=get_all_tenants(),
-                gpt_models=get_all_gpt_models(),
-                api_keys=get_all_api_keys(),
-            )
+            return await render_admin(error="Админ с таким логином уже существует")
         c.execute("INSERT INTO admins (login, password) VALUES (%s, %s)", (login, hashed))
     else:
         c.execute("SELECT 1 FROM tenants WHERE tenant_id=%s", (tenant_id,))
         if not c.fetchone():
-            c.execute("INSERT INTO tenants (tenant_id, pyrus_key) VALUES (%s, %s)", (tenant_id, pyrus_key))
-
-            # Добавляем начальную запись в statistics
-            c.execute("""
-                INSERT INTO statistics (tenant_id, date)
-                VALUES (%s, %s)
-            """, (tenant_id, date.today()))
+            c.execute("INSERT INTO tenants (tenant_id, pyrus_key, created_at) VALUES (%s, %s, %s)", (tenant_id, pyrus_key, date.today()))
     
         c.execute("SELECT 1 FROM users WHERE login=%s", (login,))
         if c.fetchone():
             conn.close()
-            return await render_template(
-                "admin.html",
-                error="Пользователь с таким логином уже существует",
-                admin_login=session.get("admin"),
-                users=get_all_users(),
-                tenants=get_all_tenants(),
-                gpt_models=get_all_gpt_models(),
-                api_keys=get_all_api_keys(),
-            )
+            return await render_admin(error="Пользователь с таким логином уже существует")
 
         c.execute("INSERT INTO users (tenant_id, login, password) VALUES (%s, %s, %s)", (tenant_id, login, hashed))
 
     conn.commit()
     clear_all_cache()
+    invalidate_admin_cache()
     conn.close()
 
-    return await render_template(
-        "admin.html",
-        admin_login=session.get("admin"),
-        users=get_all_users(),
-        tenants=get_all_tenants(),
-        gpt_models=get_all_gpt_models(),
-        api_keys=get_all_api_keys(),
-    )
+    return await render_admin()
 
 
 @site_routes.route("/admin/edit_user/<string:login>", methods=["GET", "POST"])
@@ -281,7 +178,7 @@ async def edit_user(login):
 
         if not current_role_row:
             conn.close()
-            return await render_template("admin.html", error="Пользователь не найден")
+            return await render_admin(error="Пользователь не найден")
 
         current_role = current_role_row[0]
 
@@ -299,7 +196,7 @@ async def edit_user(login):
                 c.execute("DELETE FROM users WHERE login=%s", (login,))
 
         # Хеш пароля, если указан
-        hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode() if password else None
+        hashed = await hash_password(password) if password else None
 
         if role == "admin":
             if hashed:
@@ -314,6 +211,7 @@ async def edit_user(login):
 
         conn.commit()
         clear_all_cache()
+        invalidate_admin_cache()
         conn.close()
         return redirect("/admin")
 
@@ -327,7 +225,7 @@ async def edit_user(login):
     conn.close()
 
     if not row:
-        return await render_template("admin.html", error="Пользователь не найден")
+        return await render_admin(error="Пользователь не найден")
 
     user = {"email": row[0], "role": row[1], "tenant_id": row[2]}
     return await render_template("edit_user.html", user=user)
@@ -343,6 +241,7 @@ async def delete_user(login):
     c.execute("DELETE FROM users WHERE login=%s", (login,))
     conn.commit()
     clear_all_cache()
+    invalidate_admin_cache()
     conn.close()
     return redirect("/admin")
 
@@ -351,11 +250,15 @@ async def delete_tenant(tenant_id):
     conn = get_mysql_connection()
     c = conn.cursor()
     c.execute("DELETE FROM statistics WHERE tenant_id=%s", (tenant_id,))
+    c.execute("DELETE FROM statistics_daily WHERE tenant_id=%s", (tenant_id,))
+    c.execute("DELETE FROM statistics_monthly WHERE tenant_id=%s", (tenant_id,))
     c.execute("DELETE FROM users WHERE tenant_id=%s", (tenant_id,))
+    forget_tenant(c, tenant_id)
     c.execute("DELETE FROM tenants WHERE tenant_id=%s", (tenant_id,))
 
     conn.commit()
     clear_all_cache()
+    invalidate_admin_cache()
     conn.close()
     return redirect("/admin")
 
@@ -369,26 +272,57 @@ async def edit_tenant(tenant_id):
         new_tenant_id = data["tenant_id"]
         pyrus_key = data["pyrus_key"]
         gpt_model = data["gpt_model"]
+        engine = data.get("engine") if data.get("engine") in ENGINES else "assistants"
+        retrieval_top_k = max(0, int(data.get("retrieval_top_k") or 0))
+        answer_cache = "answer_cache" in data
+        intents = data.get("intents") if data.get("intents") in INTENT_MODES else "off"
+        intent_threshold = min(1.0, max(0.5, float(data.get("intent_threshold") or DEFAULT_THRESHOLD)))
+        fast_model = data.get("fast_model") or None
+        routing_max_chars = int(data["routing_max_chars"]) if data.get("routing_max_chars") else None
+        routing_keywords = data.get("routing_keywords", "").strip() or None
+        key_group = data.get("key_group", "").strip() or None
+        admission_concurrency = max(1, int(data["admission_concurrency"])) if data.get("admission_concurrency") else None
+        admission_rate = max(1, int(data["admission_rate"])) if data.get("admission_rate") else None
+        admission_weight = max(0.1, float(data["admission_weight"])) if data.get("admission_weight") else None
+        overload = data.get("overload") if data.get("overload") in POLICIES else "defer"
+        busy_template = data.get("busy_template", "").strip() or None
         attachments_toggle_allowed = "attachments_toggle_allowed" in data
         multi_channel_toggle_allowed = "multi_channel_toggle_allowed" in data
 
         c.execute("""
-            UPDATE tenants SET tenant_id=%s, pyrus_key=%s, gpt_model=%s,
+            UPDATE tenants SET tenant_id=%s, pyrus_key=%s, gpt_model=%s, engine=%s, retrieval_top_k=%s, answer_cache=%s, intents=%s, intent_threshold=%s,
+            fast_model=%s, routing_max_chars=%s, routing_keywords=%s, key_group=%s,
+            admission_concurrency=%s, admission_rate=%s, admission_weight=%s, overload=%s, busy_template=%s,
             allow_attachments_toggle=%s, allow_multi_channel_toggle=%s
             WHERE tenant_id=%s
-        """, (new_tenant_id, pyrus_key, gpt_model,
+        """, (new_tenant_id, pyrus_key, gpt_model, engine, retrieval_top_k, answer_cache, intents, intent_threshold,
+            fast_model, routing_max_chars, routing_keywords, key_group,
+            admission_concurrency, admission_rate, admission_weight, overload, busy_template,
             attachments_toggle_allowed, multi_channel_toggle_allowed,
             tenant_id))
+        if new_tenant_id != tenant_id:
+            rename_tenant(c, tenant_id, new_tenant_id)
+
+        # Сброс включённых функций, которые админ запретил (раньше делалось на каждом GET /dashboard)
+        if not attachments_toggle_allowed:
+            c.execute("UPDATE other SET is_attachments_enabled=FALSE WHERE pyrus_key=%s", (pyrus_key,))
+        if not multi_channel_toggle_allowed:
+            c.execute("UPDATE other SET is_multi_channel_enabled=FALSE WHERE pyrus_key=%s", (pyrus_key,))
+
+        bump_config_version(c, pyrus_key)
         conn.commit()
         clear_cache(pyrus_key)
+        clear_tenant(tenant_id)
+        clear_tenant(new_tenant_id)
+        invalidate_admin_cache()
         conn.close()
         return redirect("/admin")
 
-    c.execute("SELECT tenant_id, pyrus_key, gpt_model, allow_attachments_toggle, allow_multi_channel_toggle FROM tenants WHERE tenant_id=%s", (tenant_id,))
+    c.execute("SELECT tenant_id, pyrus_key, gpt_model, allow_attachments_toggle, allow_multi_channel_toggle, engine, retrieval_top_k, answer_cache, intents, intent_threshold, fast_model, routing_max_chars, routing_keywords, key_group, admission_concurrency, admission_rate, admission_weight, overload, busy_template FROM tenants WHERE tenant_id=%s", (tenant_id,))
     row = c.fetchone()
     conn.close()
     if not row:
-        return await render_template("admin.html", error="Организация не найдена")
+        return await render_admin(error="Организация не найдена")
 
     tenant = {
         "tenant_id": row[0],
@@ -396,9 +330,25 @@ async def edit_tenant(tenant_id):
         "gpt_model": row[2],
         "attachments_toggle_allowed": row[3],
         "multi_channel_toggle_allowed": row[4],
+        "engine": row[5],
+        "retrieval_top_k": row[6],
+        "answer_cache": row[7],
+        "intents": row[8],
+        "intent_threshold": row[9],
+        "fast_model": row[10],
+        "routing_max_chars": row[11],
+        "routing_keywords": row[12],
+        "key_group": row[13],
+        "admission_concurrency": row[14],
+        "admission_rate": row[15],
+        "admission_weight": row[16],
+        "overload": row[17],
+        "busy_template": row[18],
     }
     gpt_models = get_all_gpt_models()
-    return await render_template("edit_tenant.html", tenant=tenant, gpt_models=gpt_models)
+    return await render_template("edit_tenant.html", tenant=tenant, gpt_models=gpt_models, engines=ENGINES, intent_modes=INTENT_MODES,
+                                 default_max_chars=DEFAULT_MAX_CHARS, default_key_group=DEFAULT_GROUP,
+                                 overload_policies=POLICIES, default_concurrency=DEFAULT_CONCURRENCY, busy_reply=BUSY_REPLY)
 
 @site_routes.route("/admin/model", methods=["POST"])
 async def add_model():
@@ -411,6 +361,7 @@ async def add_model():
             c.execute("INSERT IGNORE INTO gpt_models (model_name) VALUES (%s)", (model_name,))
             conn.commit()
             clear_all_cache()
+            invalidate_admin_cache()
         finally:
             conn.close()
     return redirect("/admin")
@@ -422,6 +373,7 @@ async def delete_model(model_name):
     c.execute("DELETE FROM gpt_models WHERE model_name = %s", (model_name,))
     conn.commit()
     clear_all_cache()
+    invalidate_admin_cache()
     conn.close()
     return redirect("/admin")
 
@@ -434,104 +386,64 @@ async def dashboard():
     tenant_id = session["tenant"]
     login = session["login"]
 
-    conn = get_mysql_connection()
-    c = conn.cursor()
-
-    c.execute("SELECT pyrus_key, allow_attachments_toggle, allow_multi_channel_toggle FROM tenants WHERE tenant_id=%s", (tenant_id,))
-    row = c.fetchone()
-    if not row:
-        conn.close()
+    # Только чтение: та же кэшированная конфигурация, что и у вебхука
+    pyrus_key, _ = get_pyrus_key(tenant_id)
+    if not pyrus_key:
         return redirect("/")
-
-    pyrus_key, allow_attachments_toggle, allow_multi_channel_toggle = row
-
-    c.execute("SELECT ofd_day, ofd_template, ofd_enabled, ofd_greeting FROM ofd WHERE pyrus_key=%s", (pyrus_key,))
-    row = c.fetchone()
-    current_ofd_day, current_ofd_template, current_ofd_enabled, current_ofd_greeting = row or (None, "", False, "")
-
-    c.execute("SELECT is_attachments_enabled, is_multi_channel_enabled, is_emergency_enabled, emergency_template FROM other WHERE pyrus_key=%s", (pyrus_key,))
-    row = c.fetchone()
-    current_attachments_enabled, current_multi_channel_enabled, current_emergency_message_enabled, current_emergency_message_text = row or (False, False, False, "")
-
-    # Автосброс включённых значений, если фича запрещена
-    if not allow_attachments_toggle and current_attachments_enabled:
-        current_attachments_enabled = False
-        c.execute("UPDATE other SET is_attachments_enabled=FALSE WHERE pyrus_key=%s", (pyrus_key,))
-        conn.commit()
-
-    if not allow_multi_channel_toggle and current_multi_channel_enabled:
-        current_multi_channel_enabled = False
-        c.execute("UPDATE other SET is_multi_channel_enabled=FALSE WHERE pyrus_key=%s", (pyrus_key,))
-        conn.commit()
-
-    c.execute("SELECT bot_login, temperature, stop_words, bot_stop_words, time_zone, work_from, work_to, work_from_weekend, work_to_weekend, offmsg FROM config WHERE pyrus_key=%s", (pyrus_key,))
-    row = c.fetchone()
-    if row:
-        (current_bot_login, current_temperature, current_stop_words, current_bot_stop_words, current_timezone,
-         current_work_from, current_work_to, current_work_from_weekend,
-         current_work_to_weekend, current_offmsg) = row
-        current_timezone = int(current_timezone)
-        if not current_bot_stop_words:
-            current_bot_stop_words = "Anydesk, .."
-    else:
-        current_bot_login = ""
-        current_temperature = 0.5
-        current_stop_words = ""
-        current_bot_stop_words = "Anydesk, .."
+    config = get_cache_config(pyrus_key)
+
+    allow_attachments_toggle = config["tenant"]["allow_attachments_toggle"]
+    allow_multi_channel_toggle = config["tenant"]["allow_multi_channel_toggle"]
+
+    ofd = config["ofd"]
+    current_ofd_day = ofd["day"]
+    current_ofd_template = ofd["template"] or ""
+    current_ofd_enabled = bool(ofd["enabled"])
+    current_ofd_greeting = ofd["greeting"] or ""
+
+    other = config["other"]
+    current_attachments_enabled = other["attachments_enabled"]
+    current_multi_channel_enabled = other["multi_channel_enabled"]
+    current_emergency_message_enabled = other["emergency_enabled"]
+    current_emergency_message_text = other["emergency_template"] or ""
+
+    cfg = config["config"]
+    current_bot_login = cfg["bot_login"] or ""
+    current_temperature = cfg["temperature"] if cfg["temperature"] is not None else 0.5
+    current_stop_words = cfg["stop_words"] or ""
+    current_bot_stop_words = cfg["bot_stop_words"] or "Anydesk, .."
+    try:
+        current_timezone = int(cfg["time_zone"])
+    except (TypeError, ValueError):
         current_timezone = "UTC"
-        current_work_from = current_work_to = current_work_from_weekend = current_work_to_weekend = current_offmsg = ""
-
-    c.execute("""
-        SELECT
-            fc.form_enabled, fc.form_or_card, fc.form_template, fc.dynamic_fields,
-            f.dictionary_id, f.dict_field_id,
-            f.name_column, f.filter_column, f.filter_words
-        FROM form_config fc
-        LEFT JOIN form f ON fc.pyrus_key = f.pyrus_key
-        WHERE fc.pyrus_key=%s
-    """, (pyrus_key,))
-    row = c.fetchone()
-    if row:
-        (current_form_enabled, current_form_or_card,  current_form_template, current_dynamic_fields,
-         current_dictionary_id, current_dict_field_id,
-         current_name_column, current_filter_column, current_filter_words) = row
-
-        current_form_or_card = str(current_form_or_card or '')
-        if current_form_or_card not in ('form', 'card'):
-            current_form_or_card = ""
-        if not current_form_template:
-            current_form_template = template("logic/service.txt")
-            c.execute("UPDATE form_config SET form_template=%s WHERE pyrus_key=%s", (current_form_template, pyrus_key))
-            conn.commit()
-            clear_cache(pyrus_key)
-        if current_dynamic_fields:
-            try:
-                current_dynamic_fields = json.loads(current_dynamic_fields)
-            except:
-                current_dynamic_fields = []
-        else:
-            current_dynamic_fields = []
-    else:
-        current_form_enabled = False
+    current_work_from = cfg["work_from"] or ""
+    current_work_to = cfg["work_to"] or ""
+    current_work_from_weekend = cfg["work_from_weekend"] or ""
+    current_work_to_weekend = cfg["work_to_weekend"] or ""
+    current_offmsg = cfg["offmsg"] or ""
+
+    form_config = config["form_config"]
+    current_form_enabled = bool(form_config["enabled"])
+    current_form_or_card = str(form_config["form_or_card"] or "")
+    if current_form_or_card not in ("form", "card"):
         current_form_or_card = ""
-        current_form_template = template("logic/service.txt")
-        current_dictionary_id = current_dict_field_id = ""
-        current_name_column = current_filter_column = current_filter_words = ""
-        current_dynamic_fields = []
+    current_form_template = form_config["form_template"]
+    current_dynamic_fields = form_config["dynamic_fields"]
 
-    c.execute("SELECT card_id, field_id, card_field_id, group_id FROM card WHERE pyrus_key=%s", (pyrus_key,))
-    row = c.fetchone()
-    current_card_id, current_field_id, current_card_field_id, current_group_id = row if row else ("", "", "", "")
+    form = config["form"]
+    current_dictionary_id = form["dictionary_id"] or ""
+    current_dict_field_id = form["dict_field_id"] or ""
+    current_name_column = form["name_column"] or ""
+    current_filter_column = form["filter_column"] or ""
+    current_filter_words = form["filter_words"] or ""
 
-    c.execute("SELECT template FROM template WHERE pyrus_key=%s", (pyrus_key,))
-    row = c.fetchone()
-    current_bot_template = row[0] if row and row[0] else "" #template("logic/template.txt")
-    if not row or not row[0]:
-        c.execute("INSERT INTO template (pyrus_key, template) VALUES (%s, %s) ON DUPLICATE KEY UPDATE template=%s", (pyrus_key, current_bot_template, current_bot_template))
-        conn.commit()
-        clear_cache(pyrus_key)
+    card = config["card"]
+    current_card_id = card["card_id"] or ""
+    current_field_id = card["field_id"] or ""
+    current_card_field_id = card["card_field_id"] or ""
+    current_group_id = card["group_id"] or ""
 
-    conn.close()
+    current_bot_template = config["template"] or ""
 
     return await render_template(
         "dashboard.html",
@@ -617,6 +529,7 @@ async def dashboard_form():
                 pyrus_key, dictionary_id, dict_field_id, name_column, filter_column, filter_words
             ) VALUES (%s, %s, %s, %s, %s, %s)
         """, (pyrus_key, dictionary_id, dict_field_id, name_column, filter_column, filter_words))
+    bump_config_version(c, pyrus_key)
     conn.commit()
     clear_cache(pyrus_key)
     conn.close()
@@ -634,7 +547,7 @@ async def dashboard_form_config():
 
     form_enabled = form.get("form_enabled") == "on"
     form_or_card = form.get("form_or_card", "")
-    form_template = form.get("form_template", "")
+    form_template = form.get("form_template", "").strip() or template("logic/service.txt")
     dynamic_fields_raw = form.get("dynamic_fields", "[]")
 
     try:
@@ -670,6 +583,7 @@ async def dashboard_form_config():
             ) VALUES (%s, %s, %s, %s, %s)
         """, (pyrus_key, form_enabled, form_or_card, form_template, dynamic_fields_raw))
 
+    bump_config_version(c, pyrus_key)
     conn.commit()
     clear_cache(pyrus_key)
     conn.close()
@@ -712,6 +626,7 @@ async def dashboard_card():
         c.execute("INSERT INTO card (pyrus_key, card_id, field_id, card_field_id, group_id) VALUES (%s, %s, %s, %s, %s)", (pyrus_key, card_id, field_id, card_field_id, group_id))
 
 
+    bump_config_version(c, pyrus_key)
     conn.commit()
     clear_cache(pyrus_key)
     conn.close()
@@ -756,6 +671,7 @@ async def save_ofd():
             (pyrus_key, ofd_day, ofd_template, ofd_enabled, ofd_greeting)
         )
 
+    bump_config_version(c, pyrus_key)
     conn.commit()
     clear_cache(pyrus_key)
     conn.close()
@@ -814,6 +730,7 @@ async def dashboard_other():
             ) VALUES (%s, %s, %s, %s, %s)
         """, (pyrus_key, attachments_enabled, multi_channel_enabled, emergency_enabled, emergency_text))
 
+    bump_config_version(c, pyrus_key)
     conn.commit()
     clear_cache(pyrus_key)
     conn.close()
@@ -879,6 +796,7 @@ async def dashboard_configuration():
         """, (pyrus_key, bot_login, temperature, stop_words, bot_stop_words, time_zone,
               work_from, work_to, work_from_weekend, work_to_weekend, offmsg))
 
+    bump_config_version(c, pyrus_key)
     conn.commit()
     clear_cache(pyrus_key)
     conn.close()
@@ -901,6 +819,7 @@ async def dashboard_bot_template():
     if row:
         pyrus_key = row[0]
         c.execute("INSERT INTO template (pyrus_key, template) VALUES (%s, %s) ON DUPLICATE KEY UPDATE template=%s", (pyrus_key, bot_template, bot_template))
+        bump_config_version(c, pyrus_key)
         conn.commit()
         clear_cache(pyrus_key)
     conn.close()
@@ -0,0 +1,133 @@
+"""
+Test per-tenant admission control and weighted fair queuing (без OpenAI)
+"""
+import asyncio
+
+from quart import Quart, jsonify
+
+from logic import admission, core, metrics
+
+
+def config(tenant_id, **tenant):
+    return {"tenant": {"tenant_id": tenant_id, **tenant}}
+
+
+async def fairness_test():
+    """A flood from one tenant does not delay another tenant's calls"""
+    print("Testing fair queuing...")
+    admission._scheduler = admission.Scheduler(slots=2)
+    order = []
+
+    async def call(tenant):
+        async with admission.admit(config(tenant), "question"):
+            order.append(tenant)
+            await asyncio.sleep(0.01)
+
+    flood = [asyncio.create_task(call("outage")) for _ in range(20)]
+    await asyncio.sleep(0)
+    quiet = [asyncio.create_task(call("quiet")) for _ in range(2)]
+    await asyncio.gather(*flood, *quiet)
+    served = [i for i, tenant in enumerate(order) if tenant == "quiet"]
+    assert max(served) < 8, order
+    assert admission._scheduler.busy == 0
+    print(f"✅ Quiet tenant served at positions {served} of {len(order)}")
+
+
+async def limits_test():
+    """Concurrency cap, rate bucket, queue length and wait time are enforced"""
+    print("Testing limits...")
+    admission._scheduler = admission.Scheduler(slots=10)
+    running, peak = 0, 0
+
+    async def call():
+        nonlocal running, peak
+        async with admission.admit(config("capped", admission_concurrency=2), "question"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2, peak
+
+    limited = config("limited", admission_rate=2)
+    for _ in range(2):
+        async with admission.admit(limited, "question"):
+            pass
+    try:
+        async with admission.admit(limited, "question"):
+            raise AssertionError("rate limit not applied")
+    except admission.Overloaded as e:
+        assert e.reason == "rate"
+
+    admission._scheduler = admission.Scheduler(slots=1)
+    held = asyncio.Event()
+
+    async def hold():
+        async with admission.admit(config("slow"), "question"):
+            held.set()
+            await asyncio.sleep(0.2)
+
+    holder = asyncio.create_task(hold())
+    await held.wait()
+    try:
+        await admission._scheduler.acquire("waiting", max_wait=0.01)
+        raise AssertionError("wait limit not applied")
+    except admission.Overloaded as e:
+        assert e.reason == "wait"
+    await holder
+    assert admission._scheduler.waiting["waiting"] == 0 and admission._scheduler.busy == 0
+
+    assert 'barry_admission_queue_depth{tenant="waiting"} 0' in metrics.render()
+    print("✅ Caps, rate limits and wait limits respected")
+
+
+async def deferred_attachment_test():
+    """A deferred reply keeps the recognised attachment for Pyrus' redelivery"""
+    print("Testing deferred replies with attachments...")
+    recognised, asked = [], []
+
+    async def fake_inf(url, name, pyrus_key):
+        recognised.append(url)
+        return "Фото: ошибка E-37 на кассе"
+
+    async def fake_prep(sessions, text, *args):
+        asked.append(text)
+        if len(asked) == 1:
+            raise admission.Overloaded("wait")
+        return jsonify({"text": "Перезагрузите кассу"})
+
+    config = {"tenant": {"tenant_id": "t1", "overload": "defer"}, "config": {"stop_words": "стоп-слово"},
+              "other": {"multi_channel_enabled": False, "attachments_enabled": True}}
+    core.get_cache_config, core.inf, core.prep = lambda key: config, fake_inf, fake_prep
+    task = {"is_closed": False, "form_id": 1, "attachments": [{"url": "https://files/1.jpg", "name": "1.jpg"}],
+            "comments": [{"text": "", "author": {}, "channel": {"type": "telegram"}}]}
+
+    async with Quart(__name__).app_context():
+        _, status, _ = await core.processing(task, 7, {}, "pk", "gpt-4o", None, "t1")
+        assert status == 503
+        assert not await core.is_processed("https://files/1.jpg")
+        await core.processing(task, 7, {}, "pk", "gpt-4o", None, "t1")
+
+    assert asked == ["Фото: ошибка E-37 на кассе"] * 2, asked
+    assert recognised == ["https://files/1.jpg"]  # повтор не распознаёт заново
+    assert await core.is_processed("https://files/1.jpg") and not core._attach_texts
+    print("✅ Attachment text survives a deferred reply")
+
+
+async def main():
+    print("=" * 60)
+    print("Admission Control Tests")
+    print("=" * 60)
+
+    await fairness_test()
+    await limits_test()
+    await deferred_attachment_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Tenants share model calls fairly.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Test semantic answer cache (без OpenAI: эмбеддинги из loadtest.fake_openai)
+"""
+import asyncio
+from types import SimpleNamespace
+
+from logic import answers
+from loadtest.fake_openai import embedding
+
+
+class FakeEmbeddings:
+    async def create(self, model, input):
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=embedding(text)) for text in input],
+            usage=SimpleNamespace(prompt_tokens=10, prompt_tokens_details=None, completion_tokens=0),
+        )
+
+client = SimpleNamespace(embeddings=FakeEmbeddings())
+
+REPLY = "Перезагрузите кассу и проверьте бумагу в принтере. Могу ещё чем-то помочь?"
+
+
+def config(template="A", version=1):
+    return {"template": template, "version": version, "tenant": {"tenant_id": "t1", "answer_cache": True}}
+
+
+async def answer(cfg, text, reply=REPLY):
+    """Как prep: поиск, при промахе — «ответ модели» и сохранение"""
+    cached, probe = await answers.lookup(cfg, text, client)
+    if cached:
+        return cached
+    answers.store(cfg, text, probe, reply)
+    return None
+
+
+async def confirm_test():
+    """Reply is served only after the model answered similar questions the same way"""
+    print("Testing confirmations...")
+    assert await answer(config(), "касса не печатает чек") is None
+    assert await answer(config(), "Касса не печатает чек!") is None
+    assert await answer(config(), "касса не печатает чек") == REPLY
+    assert await answer(config(), "как поменять пароль") is None
+    print("✅ Hits only for confirmed answers")
+
+
+async def template_test():
+    """Changed template invalidates stored answers"""
+    print("Testing template changes...")
+    assert await answer(config("B", 2), "касса не печатает чек") is None
+    assert all(entry["template"] == answers.template_version(config("B", 2)) for entry in answers._caches["t1"].values())
+    print("✅ Template change drops old answers")
+
+
+async def eviction_test():
+    """TTL and LRU bound the cache"""
+    print("Testing TTL and LRU...")
+    size, ttl = answers.SIZE, answers.TTL
+    answers.SIZE = 3
+    for i in range(5):
+        await answer(config("B", 2), f"вопрос номер {i} про склад {i}")
+    assert len(answers._caches["t1"]) == 3
+
+    answers.TTL = 0
+    assert await answer(config("B", 2), "совсем другой вопрос") is None
+    assert len(answers._caches["t1"]) == 1
+    answers.SIZE, answers.TTL = size, ttl
+    print("✅ Cache stays bounded")
+
+
+async def main():
+    print("=" * 60)
+    print("Answer Cache Tests")
+    print("=" * 60)
+
+    await confirm_test()
+    await template_test()
+    await eviction_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Frequent questions skip the model.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
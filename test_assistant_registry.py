@@ -0,0 +1,166 @@
+"""
+Test persisted assistant registry (без БД и OpenAI: таблица и клиент подменяются)
+"""
+import asyncio
+from types import SimpleNamespace
+
+from logic import assistants
+
+
+table = {}  # {(tenant_id, assistant_type): (assistant_id, hash, config_version)}
+calls = []
+
+
+def fake_load_one(tenant_id, assistant_type):
+    return table.get((tenant_id, assistant_type))
+
+def fake_save(tenant_id, assistant_type, assistant_id, digest, version, expected_id=None):
+    current = table.get((tenant_id, assistant_type))
+    if expected_id is None and current:
+        return False
+    if expected_id is not None and (not current or current[0] != expected_id or current[2] > version):
+        return False
+    table[(tenant_id, assistant_type)] = (assistant_id, digest, version)
+    return True
+
+
+class FakeAssistants:
+    def __init__(self):
+        self.count = 0
+        self.fail_update = False
+        self.during_update = None  # действие «другого воркера» посреди update
+        self.instructions = {}
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(0.01)
+        self.count += 1
+        calls.append("create")
+        return SimpleNamespace(id=f"asst_{self.count}")
+
+    async def update(self, assistant_id, **kwargs):
+        calls.append("update")
+        if self.fail_update:
+            raise RuntimeError("No assistant found")
+        if self.during_update:
+            self.during_update, during = None, self.during_update
+            during()
+        self.instructions[assistant_id] = kwargs["instructions"]
+        return SimpleNamespace(id=assistant_id)
+
+    async def delete(self, assistant_id):
+        calls.append(f"delete {assistant_id}")
+
+
+client = SimpleNamespace(beta=SimpleNamespace(assistants=FakeAssistants()))
+
+
+def config(template, version=1):
+    return {"template": template, "version": version, "tenant": {"tenant_id": "t1"}}
+
+
+async def create_once_test():
+    """Concurrent first messages create one assistant, stored in the table"""
+    print("Testing concurrent creation...")
+    ids = await asyncio.gather(*(
+        assistants.get_assistant("t1", "main", config("A"), "gpt-4o", client) for _ in range(10)
+    ))
+    assert len(set(ids)) == 1, ids
+    assert calls.count("create") == 1, calls
+    assert table[("t1", "main")][0] == ids[0]
+    print("✅ One assistant per tenant, persisted")
+
+
+async def restart_test():
+    """After restart the stored assistant is reused without API calls"""
+    print("Testing restart...")
+    assistants._registry.clear()
+    calls.clear()
+    assistant_id = await assistants.get_assistant("t1", "main", config("A"), "gpt-4o", client)
+    assert assistant_id == table[("t1", "main")][0]
+    assert not calls, calls
+    print("✅ Restart reuses stored assistant")
+
+
+async def template_change_test():
+    """Changed template or model updates the existing assistant"""
+    print("Testing instruction changes...")
+    calls.clear()
+    old_id = table[("t1", "main")][0]
+    assert await assistants.get_assistant("t1", "main", config("B", 2), "gpt-4o", client) == old_id
+    assert await assistants.get_assistant("t1", "main", config("B", 2), "gpt-4o-mini", client) == old_id
+    assert calls == ["update", "update"], calls
+    assert table[("t1", "main")][1] == assistants.instructions_hash(
+        assistants.instructions("main", config("B", 2)), "gpt-4o-mini")
+    print("✅ Template/model changes update assistant in place")
+
+
+async def stale_config_test():
+    """A worker with an older config version does not roll instructions back"""
+    print("Testing stale workers...")
+    calls.clear()
+    current = table[("t1", "main")]
+    assistants._registry.clear()
+    assert await assistants.get_assistant("t1", "main", config("A", 1), "gpt-4o", client) == current[0]
+    assert await assistants.get_assistant("t1", "main", config("A", 1), "gpt-4o", client) == current[0]
+    assert not calls, calls
+    assert table[("t1", "main")] == current
+    print("✅ Stale config leaves the assistant alone")
+
+
+async def failed_update_test():
+    """If the update fails, the new assistant replaces the old one, which is deleted"""
+    print("Testing failed updates...")
+    calls.clear()
+    old_id = table[("t1", "main")][0]
+    client.beta.assistants.fail_update = True
+    new_id = await assistants.get_assistant("t1", "main", config("C", 3), "gpt-4o", client)
+    client.beta.assistants.fail_update = False
+    assert new_id != old_id
+    assert calls == ["update", "create", f"delete {old_id}"], calls
+    assert table[("t1", "main")][0] == new_id
+    print("✅ Replaced assistant deleted")
+
+
+async def update_race_test():
+    """A newer config saved during our update wins: its instructions are re-applied, nothing is created"""
+    print("Testing update races...")
+    calls.clear()
+    assistant_id = table[("t1", "main")][0]
+    newer = config("E", 5)
+    newer_digest = assistants.instructions_hash(assistants.instructions("main", newer), "gpt-4o")
+    assistants.get_pyrus_key = lambda tenant_id: ("pk1", "gpt-4o")
+    assistants.load_configs = lambda keys: {"pk1": {**newer, "tenant": {"tenant_id": "t1", "gpt_model": "gpt-4o"}}}
+
+    def newer_worker_saves():
+        table[("t1", "main")] = (assistant_id, newer_digest, 5)
+
+    client.beta.assistants.during_update = newer_worker_saves
+    assert await assistants.get_assistant("t1", "main", config("D", 4), "gpt-4o", client) == assistant_id
+    assert calls == ["update", "update"], calls
+    assert client.beta.assistants.instructions[assistant_id] == assistants.instructions("main", newer)
+    assert table[("t1", "main")] == (assistant_id, newer_digest, 5)
+    print("✅ Newer instructions restored, no throwaway assistant")
+
+
+async def main():
+    print("=" * 60)
+    print("Assistant Registry Tests")
+    print("=" * 60)
+
+    assistants._load_one = fake_load_one
+    assistants._save = fake_save
+
+    await create_once_test()
+    await restart_test()
+    await template_change_test()
+    await stale_config_test()
+    await failed_update_test()
+    await update_race_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Assistants are reused.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
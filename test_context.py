@@ -0,0 +1,65 @@
+"""
+Test bounded conversation context with a rolling summary (без OpenAI: клиент подменяется)
+"""
+import asyncio
+from types import SimpleNamespace
+
+from logic import context
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def create(self, **kwargs):
+        await self.release.wait()
+        message = SimpleNamespace(content="Кафе на Абая 37, не печатает чек.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+completions = FakeCompletions()
+client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+def turn(session, i):
+    context.remember(session, f"вопрос {i}", f"ответ {i}")
+    context.schedule_summary(session, client, task_id=1)
+
+
+async def no_gap_test():
+    """Messages waiting for a summary stay in the context until they are folded into it"""
+    print("Testing context before and during summary...")
+    session = {}
+    for i in range(context.KEEP_TURNS + 1):
+        turn(session, i)
+    assert len(context.bounded(session)) == context.KEEP_MESSAGES + 2  # сводки ещё нет, ничего не выпало
+    assert context.last_messages(session) == context.KEEP_MESSAGES + 3
+
+    while "summarizing" not in session:
+        turn(session, len(session["history"]) // 2)
+    sent = context.bounded(session)
+    assert sent[0]["content"] == "вопрос 0", sent[0]  # сводка строится — старые сообщения ещё дословно
+
+    completions.release.set()
+    await session["summarizing"]
+    sent = context.bounded(session)
+    assert sent[0]["role"] == "system" and "Абая 37" in sent[0]["content"]
+    assert len(sent) == context.KEEP_MESSAGES + 1
+    assert context.last_messages(session) == context.KEEP_MESSAGES + 1
+    print("✅ No message is left out of both the summary and the context")
+
+
+async def main():
+    print("=" * 60)
+    print("Conversation Context Tests")
+    print("=" * 60)
+
+    await no_gap_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Context keeps every message.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Test the JSON layer: orjson and stdlib backends give the same results
+"""
+import asyncio, json
+from decimal import Decimal
+
+from quart import Quart, jsonify, request
+
+from logic import fastjson
+
+PAYLOAD = {"task": {"id": 1, "text": "Не печатает чек", "comments": [{"id": 2, "value": None}]}, "sum": 1.5}
+
+
+def parity_test():
+    """bytes and str parse the same, output matches stdlib json"""
+    print(f"Testing {fastjson.BACKEND} backend...")
+    body = json.dumps(PAYLOAD, ensure_ascii=False).encode()
+    assert fastjson.loads(body) == fastjson.loads(body.decode()) == PAYLOAD
+    assert json.loads(fastjson.dumps(PAYLOAD)) == PAYLOAD
+    assert fastjson.dumpb(PAYLOAD) == fastjson.dumps(PAYLOAD).encode()
+    assert "Не печатает" in fastjson.dumps(PAYLOAD)  # без \u-экранирования
+    assert json.loads(fastjson.dumps({1: Decimal("12.50")})) == {"1": "12.50"}
+    try:
+        fastjson.loads(b'{"task": ')
+        raise AssertionError("broken body parsed")
+    except ValueError:
+        pass
+    print("✅ Same data as stdlib json")
+
+
+async def provider_test():
+    """jsonify and request.get_json go through the layer"""
+    print("Testing Quart provider...")
+    app = Quart(__name__)
+    app.json = fastjson.Provider(app)
+
+    @app.route("/", methods=["POST"])
+    async def echo():
+        return jsonify(await request.get_json())
+
+    async with app.app_context():
+        response = jsonify({"text": "Перезагрузите кассу"})
+        assert await response.get_data() == fastjson.dumpb({"text": "Перезагрузите кассу"})
+        assert response.mimetype == "application/json"
+
+    client = app.test_client()
+    response = await client.post("/", data=json.dumps(PAYLOAD), headers={"Content-Type": "application/json"})
+    assert await response.get_json() == PAYLOAD
+    print("✅ Replies serialised by the layer")
+
+
+async def main():
+    print("=" * 60)
+    print("Fast JSON Tests")
+    print("=" * 60)
+
+    parity_test()
+    await provider_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! JSON layer is consistent.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Test idempotent webhook handling (повторы Pyrus по задаче и последнему комментарию)
+"""
+import asyncio
+
+from quart import Quart, jsonify
+
+from logic import idempotency, metrics
+
+
+async def dedup_test():
+    """A retry during or after processing gets the original reply, the handler runs once"""
+    print("Testing duplicates...")
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return jsonify({"text": "Перезагрузите кассу"})
+
+    key = ("t1", 1, 100)
+    first, retry = await asyncio.gather(idempotency.once(key, handler), idempotency.once(key, handler))
+    late = await idempotency.once(key, handler)
+    assert len(calls) == 1, calls
+    assert await first.get_data() == await retry.get_data() == await late.get_data()
+
+    await idempotency.once(("t1", 1, 101), handler)  # новый комментарий — новый ответ
+    assert len(calls) == 2
+
+    series = metrics._counters["barry_webhook_duplicates_total"]
+    assert series[("inflight", "")] == 1 and series[("completed", "")] == 1, series
+    print("✅ Duplicates answered from the first run")
+
+
+async def disconnect_test():
+    """The first caller is cancelled (Pyrus dropped the connection): the retry still gets the reply"""
+    print("Testing client disconnect...")
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return jsonify({"text": "Проверьте кабель"})
+
+    key = ("t1", 7, 700)
+    first = asyncio.ensure_future(idempotency.once(key, handler))
+    await asyncio.sleep(0.01)
+    retry = asyncio.ensure_future(idempotency.once(key, handler))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    try:
+        await first
+        raise AssertionError("first caller not cancelled")
+    except asyncio.CancelledError:
+        pass
+    response = await retry
+    assert len(calls) == 1, calls
+    assert (await response.get_json())["text"] == "Проверьте кабель"
+    assert key in idempotency._entries  # ответ сохранён для следующих повторов
+    print("✅ Disconnect does not cancel processing")
+
+
+async def failures_test():
+    """Deferred replies and errors are not stored, expired entries are dropped"""
+    print("Testing non-200 replies and TTL...")
+    calls = []
+
+    async def deferred():
+        calls.append(1)
+        return jsonify({}), 503, {"Retry-After": "30"}
+
+    key = ("t1", 2, 200)
+    response = await idempotency.once(key, deferred)
+    assert response.status_code == 503 and response.headers["Retry-After"] == "30"
+    await idempotency.once(key, deferred)
+    assert len(calls) == 2
+
+    async def broken():
+        raise RuntimeError("boom")
+
+    try:
+        await idempotency.once(("t1", 3, 300), broken)
+        raise AssertionError("error swallowed")
+    except RuntimeError:
+        pass
+    assert ("t1", 3, 300) not in idempotency._entries
+
+    # записи истекают в порядке добавления — TTL меняется только на пустом кэше
+    idempotency._entries.clear()
+    idempotency.TTL = 0
+    await idempotency.once(("t1", 4, 400), deferred)
+    await idempotency.once(("t1", 5, 500), lambda: asyncio.sleep(0, jsonify({})))
+    await idempotency.once(("t1", 6, 600), lambda: asyncio.sleep(0, jsonify({})))
+    assert ("t1", 5, 500) not in idempotency._entries
+    print("✅ Only successful replies are reused, entries expire")
+
+
+async def main():
+    print("=" * 60)
+    print("Webhook Idempotency Tests")
+    print("=" * 60)
+
+    async with Quart(__name__).app_context():
+        await dedup_test()
+        await disconnect_test()
+        await failures_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Each comment is answered once.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Test local intent classifier (обучается на logic/intents.txt, без OpenAI)
+"""
+import asyncio, time
+
+from logic import intents, metrics
+
+
+def config(mode, threshold=0.9):
+    return {"tenant": {"tenant_id": "t1", "intents": mode, "intent_threshold": threshold}}
+
+
+async def classify_test():
+    """Unseen variants of trivial messages are recognised, real questions are not"""
+    print("Testing classification...")
+    cases = {
+        "Спасибоооо!!": "thanks",
+        "ок, жду": "thanks",
+        "👍🏻": "thanks",
+        "Здравствуйте!!!": "greeting",
+        "позовите, пожалуйста, оператора": "handoff",
+        "касса не печатает": "other",
+        "спасибо, но принтер так и не печатает": "other",
+        "здравствуйте, у нас не работает терминал": "other",
+        "да, по usb": "other",
+    }
+    for text, expected in cases.items():
+        intent, confidence = intents.classify(text)
+        assert intent == expected, (text, intent, confidence)
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        intents.classify("спасибо большое")
+    per_call = (time.perf_counter() - started) / 1000
+    assert per_call < 0.001, per_call
+    print(f"✅ Trivial messages recognised ({per_call * 1e6:.0f} µs per message)")
+
+
+async def modes_test():
+    """off does nothing, shadow only records, on routes; greeting only at dialog start"""
+    print("Testing modes...")
+    assert intents.decide(config("off"), "спасибо", True) is None
+    assert intents.decide(config("on"), "спасибо", False) == "thanks"
+    assert intents.decide(config("on"), "здравствуйте", True) == "greeting"
+    assert intents.decide(config("on"), "здравствуйте", False) is None
+    assert intents.decide(config("on", threshold=1.0), "спасибо", True) is None
+
+    assert intents.decide(config("shadow"), "спасибо", True) is None
+    intents.compare(approved=False)
+    series = metrics._counters["barry_intent_total"]
+    assert series[("thanks", "shadow", "disagree", "")] == 1, series
+    print("✅ Modes and thresholds respected")
+
+
+async def main():
+    print("=" * 60)
+    print("Intent Classifier Tests")
+    print("=" * 60)
+
+    await classify_test()
+    await modes_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Trivial messages skip the model.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+Test OpenAI key pool (заголовки x-ratelimit, выбор ключа, закрепление организаций; без сети)
+"""
+import asyncio
+from types import SimpleNamespace
+
+from logic import keys
+
+
+def config(tenant_id, engine="chat", group=None):
+    return {"tenant": {"tenant_id": tenant_id, "engine": engine, "key_group": group}}
+
+
+def response(status=200, **headers):
+    """Ответ OpenAI для хука ключа: заголовки в нижнем регистре, как их отдаёт API"""
+    return SimpleNamespace(status_code=status, headers={k.replace("_", "-"): str(v) for k, v in headers.items()})
+
+
+async def headers_test():
+    """Rate-limit headers update remaining quota, 429 takes the key out of rotation"""
+    print("Testing rate-limit headers...")
+    assert keys.parse_duration("6m0s") == 360
+    assert keys.parse_duration("1.5s") == 1.5
+    assert keys.parse_duration("20ms") == 0.02
+
+    keys.sync([(1, "sk-aaaaaaaaaaaaaaaa", "default", True), (2, "sk-bbbbbbbbbbbbbbbb", "default", True)])
+    first, second = keys._keys[1], keys._keys[2]
+    await first._on_response(response(x_ratelimit_limit_requests=100, x_ratelimit_remaining_requests=10,
+                                      x_ratelimit_limit_tokens=1000, x_ratelimit_remaining_tokens=900))
+    assert first.headroom() == 0.1
+    assert keys.pick() is second
+
+    await second._on_response(response(429, x_ratelimit_reset_requests="30s"))
+    assert second.cooling()
+    assert keys.pick() is first
+    print("✅ Calls go to the key with most headroom, throttled keys cool down")
+
+
+async def groups_test():
+    """Assistants tenants stay on one key, groups fall back to default"""
+    print("Testing groups and pinning...")
+    keys.sync([(id, f"sk-{id:016d}", "default", True) for id in range(1, 5)] + [(9, "sk-vipvipvipvipvip", "vip", True)])
+    assert keys.pick("vip") is keys._keys[9]
+    assert keys.pick("missing").group == "default"
+
+    pinned = {t: keys.client(config(t, "assistants")) for t in ("t1", "t2", "t3", "t4", "t5")}
+    assert all(keys.client(config(t, "assistants")) is client for t, client in pinned.items())
+
+    # добавление ключа переносит только часть организаций
+    keys.sync([(id, f"sk-{id:016d}", "default", True) for id in range(1, 6)])
+    moved = sum(keys.client(config(t, "assistants")) is not client for t, client in pinned.items())
+    assert moved < len(pinned), moved
+
+    keys.sync([(1, "sk-0000000000000001", "default", False)])
+    try:
+        keys.pick()
+        raise AssertionError("disabled key picked")
+    except RuntimeError:
+        pass
+    print("✅ Groups, pinning and disabling respected")
+
+
+async def main():
+    print("=" * 60)
+    print("OpenAI Key Pool Tests")
+    print("=" * 60)
+
+    await headers_test()
+    await groups_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Keys share the load.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
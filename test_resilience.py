@@ -0,0 +1,110 @@
+"""
+Test OpenAI call resilience: deadlines, retries, retry budget, circuit breaker (без сети)
+"""
+import asyncio, time
+from types import SimpleNamespace
+
+from logic import resilience
+
+resilience.BACKOFF = resilience.BACKOFF_MAX = 0.01
+
+
+class Flaky:
+    """Запрос, который падает по таймауту первые failures раз"""
+    def __init__(self, failures, hang=False):
+        self.failures, self.hang, self.calls = failures, hang, 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            if self.hang:
+                await asyncio.sleep(10)
+            raise asyncio.TimeoutError()
+        return "ok"
+
+
+async def expect_unavailable(coro, reason):
+    try:
+        await coro
+    except resilience.Unavailable as e:
+        assert e.reason == reason, e.reason
+        return
+    raise AssertionError(f"expected Unavailable({reason})")
+
+
+async def retry_test():
+    """Transient failures are retried, hung calls hit the deadline, the budget caps retries"""
+    print("Testing retries and deadlines...")
+    flaky = Flaky(2)
+    assert await resilience.call(object(), "m-retry", flaky) == "ok" and flaky.calls == 3
+
+    started = time.perf_counter()
+    await expect_unavailable(resilience.call(object(), "m-hang", Flaky(5, hang=True), timeout=0.05), "retries")
+    assert time.perf_counter() - started < 1
+
+    resilience._budget.get("").tokens = 0
+    flaky = Flaky(1)
+    await expect_unavailable(resilience.call(object(), "m-budget", flaky), "retries")
+    assert flaky.calls == 1
+    resilience._budget.get("").tokens = resilience.RETRY_BUDGET
+    print("✅ Retries are bounded by attempts, deadlines and the tenant budget")
+
+
+async def breaker_test():
+    """After repeated failures calls fail fast; one probe closes the breaker again"""
+    print("Testing circuit breaker...")
+    client = object()
+    for _ in range(resilience.BREAKER_FAILURES):
+        try:
+            await resilience.call(client, "m-breaker", Flaky(1), attempts=1)
+        except resilience.Unavailable:
+            pass
+    flaky = Flaky(0)
+    await expect_unavailable(resilience.call(client, "m-breaker", flaky), "breaker")
+    assert flaky.calls == 0
+
+    guard = resilience.breaker(client, "m-breaker")
+    guard.opened_at -= resilience.BREAKER_COOLDOWN
+    assert guard.state() == "half-open"
+    assert await resilience.call(client, "m-breaker", flaky) == "ok"
+    assert guard.state() == "closed"
+    print("✅ Breaker opens, fails fast and recovers after a probe")
+
+
+async def single_post_test():
+    """A timed-out message POST is not repeated: it may already be in the thread"""
+    print("Testing non-idempotent calls...")
+    from logic.core import ask_assistant
+
+    posted = []
+
+    async def create_message(**kwargs):
+        posted.append(kwargs["content"])
+        raise asyncio.TimeoutError()  # сервер принял сообщение, ответ не дошёл
+
+    async def list_runs(**kwargs):
+        return SimpleNamespace(data=[])
+
+    threads = SimpleNamespace(messages=SimpleNamespace(create=create_message), runs=SimpleNamespace(list=list_runs))
+    client = SimpleNamespace(beta=SimpleNamespace(threads=threads))
+    await expect_unavailable(ask_assistant(1, "Не печатает чек", {}, "thread_1", "asst_1", {}, "m-post", client), "retries")
+    assert posted == ["Не печатает чек"], posted
+    print("✅ Message is posted at most once")
+
+
+async def main():
+    print("=" * 60)
+    print("OpenAI Resilience Tests")
+    print("=" * 60)
+
+    await retry_test()
+    await breaker_test()
+    await single_post_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Failing OpenAI calls end quickly.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
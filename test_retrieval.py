@@ -0,0 +1,71 @@
+"""
+Test retrieval over tenant templates (без OpenAI: только BM25)
+"""
+import asyncio
+
+from logic import retrieval
+from logic.chat import instructions
+from logic.serv import template
+
+
+TEMPLATE = template("logic/template.txt")
+
+
+def config(text=TEMPLATE, version=1, top_k=3):
+    return {"template": text, "version": version, "tenant": {"tenant_id": "t1", "retrieval_top_k": top_k}}
+
+
+async def search_test():
+    """Relevant sections are found by topic, pinned rules are not repeated"""
+    print("Testing search...")
+    cases = {
+        "Не выходит чек, принтер не печатает": "Проблемы с принтером",
+        "весы не работают": "При любых проблемах с весами",
+        "Оплачена ли у нас лицензия?": 'При вопросах "Оплачена ли лицензия?"',
+    }
+    for query, title in cases.items():
+        found = await retrieval.relevant(config(), query)
+        assert found.startswith(retrieval.RELEVANT_HEADER), found
+        assert title in found, (query, found)
+        assert "4. Ограничения:" not in found
+    assert await retrieval.relevant(config(), "Здравствуйте") == ""
+    print("✅ Top-K sections by topic")
+
+
+async def instructions_test():
+    """Instructions keep only general rules and stay much shorter than the template"""
+    print("Testing instructions...")
+    text = instructions("main", config())
+    assert "4. Ограничения:" in text and "Hexadecimal dump" not in text
+    assert len(text) < len(TEMPLATE) / 2, len(text)
+    assert "Hexadecimal dump" in instructions("main", config(version=2, top_k=0))
+    print("✅ Pinned rules only")
+
+
+async def rebuild_test():
+    """Index is rebuilt only when template text changes"""
+    print("Testing rebuilds...")
+    index = retrieval.get_index(config(version=3))
+    assert retrieval.get_index(config(version=4)) is index
+    extended = config(TEMPLATE + "\nПроблемы с кофемашиной:\n    - Передайте заявку сотруднику.", version=5)
+    assert retrieval.get_index(extended) is not index
+    assert "кофемашиной" in await retrieval.relevant(extended, "сломалась кофемашина")
+    print("✅ Rebuild on template change only")
+
+
+async def main():
+    print("=" * 60)
+    print("Template Retrieval Tests")
+    print("=" * 60)
+
+    await search_test()
+    await instructions_test()
+    await rebuild_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Prompts carry only relevant sections.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
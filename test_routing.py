@@ -0,0 +1,67 @@
+"""
+Test complexity-based model routing (только локальные признаки, без OpenAI)
+"""
+import asyncio
+
+from logic import routing
+
+
+def config(fast="gpt-4o-mini", **tenant):
+    return {"tenant": {"tenant_id": "t1", "fast_model": fast, **tenant}}
+
+
+def turns(count):
+    """Сессия с count завершёнными ходами"""
+    history = []
+    for _ in range(count):
+        history += [{"role": "user", "content": "..."}, {"role": "assistant", "content": "..."}]
+    return {"history": history}
+
+
+async def choose_test():
+    """Simple messages go to the fast model, complex ones to the tenant model"""
+    print("Testing routes...")
+    cases = [
+        (config(), {}, "касса не печатает чек", False, ("gpt-4o-mini", "fast", "simple")),
+        (config(), {}, "Кафе Лето, Абая 5", False, ("gpt-4o-mini", "fast", "simple")),
+        (config(), {}, "ошибка: истекли 24 часа", False, ("gpt-4o", "strong", "keyword")),
+        (config(), {}, "на фото касса", True, ("gpt-4o", "strong", "attachment")),
+        (config(), {}, "касса " * 40, False, ("gpt-4o", "strong", "length")),
+        (config(routing_max_chars=10), {}, "касса не печатает", False, ("gpt-4o", "strong", "length")),
+        (config(routing_keywords="глово"), {}, "заказы с глово", False, ("gpt-4o", "strong", "keyword")),
+        (config(), turns(routing.MAX_TURN), "да", False, ("gpt-4o", "strong", "turn")),
+        (config(None), {}, "да", False, ("gpt-4o", "default", "off")),
+    ]
+    for cfg, session, text, attachment, expected in cases:
+        assert routing.choose(cfg, "gpt-4o", session, text, attachment) == expected, (text, expected)
+    print("✅ Routes by length, keywords, attachments and turn")
+
+
+async def escalation_test():
+    """After a failed answer the dialog stays on the tenant model"""
+    print("Testing escalation...")
+    session = turns(1)
+    assert routing.choose(config(), "gpt-4o", session, "не помогло", False)[2] == "failure"
+    assert routing.choose(config(), "gpt-4o", session, "да", False) == ("gpt-4o", "strong", "escalated")
+
+    session = {}
+    routing.escalate(session, "english")
+    assert routing.choose(config(), "gpt-4o", session, "да", False)[0] == "gpt-4o"
+    print("✅ Escalation is sticky")
+
+
+async def main():
+    print("=" * 60)
+    print("Model Routing Tests")
+    print("=" * 60)
+
+    await choose_test()
+    await escalation_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Models are picked per message.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
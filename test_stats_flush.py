@@ -0,0 +1,125 @@
+"""
+Test write-behind statistics counters (без БД: запись в MySQL подменяется)
+"""
+import asyncio
+
+from mysql.connector.errors import IntegrityError
+
+from logic import stats
+
+
+written = []
+failures = {"left": 0}
+real_write = stats._write
+
+
+class FakeConnection:
+    """Строки удалённой организации нарушают FK, как в MySQL"""
+
+    def __init__(self, deleted):
+        self.deleted, self.pending, self.committed = deleted, [], []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        if params[0] in self.deleted:
+            raise IntegrityError("Cannot add or update a child row: a foreign key constraint fails")
+        self.pending.append(params)
+
+    def executemany(self, sql, seq):
+        for params in seq:
+            self.execute(sql, params)
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+def fake_write(rows):
+    if failures["left"]:
+        failures["left"] -= 1
+        raise RuntimeError("mysql is down")
+    written.extend(rows)
+
+
+async def batched_flush_test():
+    """Deltas are flushed as one batch and counters reset"""
+    print("Testing batched flush...")
+    written.clear()
+
+    for _ in range(5):
+        stats.count_request("a")
+    stats.count_request("b")
+    stats.count_task("a")
+
+    await stats.flush_stats()
+
+    assert sorted(written) == [("a", 5, 1), ("b", 1, 0)], written
+    assert not stats.requests_today and not stats.tasks_today
+
+    print("✅ Batched flush: deltas written and counters reset")
+
+
+async def retry_test():
+    """Failed flush is retried, then deltas survive until next flush"""
+    print("Testing flush retries...")
+    written.clear()
+
+    stats.count_request("a")
+    failures["left"] = 1
+    await stats.flush_stats()
+    assert written == [("a", 1, 0)], written
+
+    written.clear()
+    stats.count_request("a")
+    failures["left"] = stats.FLUSH_RETRIES
+    await stats.flush_stats()
+    assert not written
+    assert stats.requests_today == {"a": 1}, stats.requests_today
+
+    stats.count_request("a")
+    await stats.flush_stats()
+    assert written == [("a", 2, 0)], written
+
+    print("✅ Retries: nothing lost when MySQL is unavailable")
+
+
+def poisoned_row_test():
+    """A deleted tenant's row is dropped, the rest of the batch is saved"""
+    print("Testing rows of deleted tenants...")
+    conn = FakeConnection({"gone"})
+    stats.get_mysql_connection = lambda: conn
+    rows = [("a", 3, 1), ("gone", 2, 0), ("b", 1, 0)]
+    real_write(rows)
+    assert not rows
+    assert sorted({params[0] for params in conn.committed}) == ["a", "b"], conn.committed
+    assert len(conn.committed) == 4  # дневная и месячная строки
+    print("✅ Poisoned row dropped, other tenants' stats saved")
+
+
+async def main():
+    print("=" * 60)
+    print("Statistics Counter Tests")
+    print("=" * 60)
+
+    stats._write = fake_write
+    stats.FLUSH_BACKOFF = 0
+
+    await batched_flush_test()
+    await retry_test()
+    poisoned_row_test()
+
+    print("=" * 60)
+    print("🎉 All tests passed! Counters flush correctly.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())